@@ -1,3 +1,4 @@
+# 数据模块需在 dispatcher 中注册后才能被其他模块导入，因此先导入 dispatcher
+from .dispatcher import get, show_mappings, update, sync, migrate
 from .data_source import DataSource
 from .data_source import BenchDataSource
-from .dispatcher import get, show_mappings, update, sync
@@ -0,0 +1,205 @@
+"""
+交易日历与指数行情的进程内缓存
+
+完整的交易日历以排序后的数组保存，区间截取和前后交易日查询均通过二分查找完成；
+基准指数行情在首次使用时一次性载入，按交易日历对齐为宽表，之后的回测直接从内存中截取。
+数据布局文件中指数数据的更新日期发生变化时自动重新载入
+"""
+from __future__ import annotations
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from wk_util.configuration import Configuration
+from wk_util.metaclass import SingletonType
+from wk_data.data_spec import DataSpec
+from wk_data.exceptions import DataOutOfRangeException
+from wk_data.wind_data.index_daily_status import prepare_index_daily, fetch_index_daily_status
+
+CALENDAR_INSTRUMENT = '000001.SH'
+INDEX_DATA_NAME = 'index_daily'
+INDEX_FIELDS = ['open', 'close', 'low', 'high', 'volume', 'amount']
+
+_FULL_RANGE_BEGIN = '19000101'
+
+
+def _index_update_date():
+    spec = DataSpec(Configuration().data_dir)
+    spec.reload_if_modified()
+    try:
+        return spec.get_shard_update_date(INDEX_DATA_NAME)
+    except KeyError:
+        return spec.last_update_date
+
+
+def _load_calendar():
+    data = prepare_index_daily().fetch_data(_FULL_RANGE_BEGIN, instrument=CALENDAR_INSTRUMENT, columns=['trade_dt'])
+    return data['trade_dt'].tolist()
+
+
+def _load_index(symbol):
+    return fetch_index_daily_status(_FULL_RANGE_BEGIN, instrument=symbol)
+
+
+class TradeCalendarService(metaclass=SingletonType):
+    """
+    进程内共享的交易日历与指数行情服务
+
+    用法::
+
+        service = TradeCalendarService()
+        calendar = service.trade_calendar('20200101', '20201231')
+        bars = service.index_bars('000300.SH', '20200101', '20201231')
+    """
+
+    def __init__(self):
+        self.__lock = threading.RLock()
+        self.__update_date = None
+        self.__reset()
+
+    def __reset(self):
+        self.__calendar = None
+        self.__codes = []
+        self.__code_pos = {}
+        # (字段, 交易日, 指数) 的行情矩阵，以及对应交易日是否有原始行情
+        self.__values = np.empty((len(INDEX_FIELDS), 0, 0))
+        self.__present = np.empty((0, 0), dtype=bool)
+
+    def __check_update(self):
+        update_date = _index_update_date()
+        if update_date != self.__update_date:
+            self.__reset()
+            self.__update_date = update_date
+
+    def invalidate(self):
+        """
+        丢弃已缓存的数据，下次访问时重新载入
+        """
+        with self.__lock:
+            self.__reset()
+
+    def __ensure_calendar(self):
+        self.__check_update()
+        if self.__calendar is None:
+            self.__calendar = np.unique(np.asarray(_load_calendar(), dtype=object).astype(str))
+            n = len(self.__calendar)
+            self.__values = np.empty((len(INDEX_FIELDS), n, 0))
+            self.__present = np.empty((n, 0), dtype=bool)
+        return self.__calendar
+
+    def __range(self, begin_date, end_date=None):
+        calendar = self.__calendar
+        lo = np.searchsorted(calendar, str(begin_date), side='left')
+        hi = len(calendar) if end_date is None else np.searchsorted(calendar, str(end_date), side='right')
+        return lo, max(lo, hi)
+
+    @property
+    def calendar(self) -> np.ndarray:
+        """
+        完整的交易日历
+        """
+        with self.__lock:
+            return self.__ensure_calendar()
+
+    def trade_calendar(self, begin_date, end_date=None) -> list:
+        """
+        [begin_date, end_date] 区间内的交易日，end_date为None时截至最新交易日
+        """
+        with self.__lock:
+            calendar = self.__ensure_calendar()
+            lo, hi = self.__range(begin_date, end_date)
+            return calendar[lo:hi].tolist()
+
+    def is_trade_date(self, date) -> bool:
+        with self.__lock:
+            calendar = self.__ensure_calendar()
+            pos = np.searchsorted(calendar, str(date), side='left')
+            return pos < len(calendar) and calendar[pos] == str(date)
+
+    def next_trade_date(self, date, n=1) -> str:
+        """
+        date之后（不含当日）的第n个交易日
+        """
+        with self.__lock:
+            calendar = self.__ensure_calendar()
+            pos = np.searchsorted(calendar, str(date), side='right') + n - 1
+            if pos >= len(calendar):
+                raise DataOutOfRangeException(f"{date}之后的第{n}个交易日超出交易日历范围")
+            return calendar[pos]
+
+    def prev_trade_date(self, date, n=1) -> str:
+        """
+        date之前（不含当日）的第n个交易日
+        """
+        with self.__lock:
+            calendar = self.__ensure_calendar()
+            pos = np.searchsorted(calendar, str(date), side='left') - n
+            if pos < 0:
+                raise DataOutOfRangeException(f"{date}之前的第{n}个交易日超出交易日历范围")
+            return calendar[pos]
+
+    def __ensure_index(self, symbols):
+        calendar = self.__ensure_calendar()
+        missing = [symbol for symbol in dict.fromkeys(symbols) if symbol not in self.__code_pos]
+        if not missing:
+            return
+
+        values = np.full((len(INDEX_FIELDS), len(calendar), len(missing)), np.nan)
+        present = np.zeros((len(calendar), len(missing)), dtype=bool)
+        for j, symbol in enumerate(missing):
+            data = _load_index(symbol)
+            dates = data['trade_dt'].to_numpy().astype(str)
+            pos = np.searchsorted(calendar, dates, side='left')
+            in_calendar = calendar[np.minimum(pos, len(calendar) - 1)] == dates
+            pos = pos[in_calendar]
+            # 同一交易日有多条记录时与按日历对齐一致，保留第一条
+            pos, first = np.unique(pos, return_index=True)
+            present[pos, j] = True
+            for k, field in enumerate(INDEX_FIELDS):
+                values[k, pos, j] = data[field].to_numpy(dtype=np.float64)[in_calendar][first]
+
+        for symbol in missing:
+            self.__code_pos[symbol] = len(self.__codes)
+            self.__codes.append(symbol)
+        self.__values = np.concatenate([self.__values, values], axis=2)
+        self.__present = np.concatenate([self.__present, present], axis=1)
+
+    def prepare_index(self, symbols):
+        """
+        一次性载入尚未缓存的指数行情
+        """
+        with self.__lock:
+            self.__ensure_index(symbols)
+
+    def index_bars(self, symbol, begin_date, end_date=None) -> pd.DataFrame:
+        """
+        按交易日历对齐后的指数日行情，与 align_calendar(wk_data.get('index_market', instrument=symbol, ...)) 的结果一致：
+        从区间内的首个行情日开始，缺失的交易日及空值使用之前最近的行情填充
+        """
+        with self.__lock:
+            self.__ensure_index([symbol])
+            lo, hi = self.__range(begin_date, end_date)
+            j = self.__code_pos[symbol]
+            present = self.__present[lo:hi, j]
+            if not present.any():
+                return pd.DataFrame(columns=['trade_dt', 'windcode'] + INDEX_FIELDS)
+
+            start = lo + np.argmax(present)
+            data = pd.DataFrame(self.__values[:, start:hi, j].T, columns=INDEX_FIELDS).ffill()
+            data.insert(0, 'trade_dt', self.__calendar[start:hi])
+            data.insert(1, 'windcode', symbol)
+            return data
+
+    def index_matrix(self, symbols, begin_date, end_date=None, field='close') -> pd.DataFrame:
+        """
+        以交易日为索引、指数代码为列的宽表，缺失的交易日及空值使用之前最近的行情填充
+        """
+        with self.__lock:
+            self.__ensure_index(symbols)
+            lo, hi = self.__range(begin_date, end_date)
+            columns = [self.__code_pos[symbol] for symbol in symbols]
+            values = self.__values[INDEX_FIELDS.index(field), lo:hi][:, columns]
+            return pd.DataFrame(values, index=pd.Index(self.__calendar[lo:hi], name='trade_dt'),
+                                columns=list(symbols)).ffill()
@@ -1,23 +1,13 @@
-from functools import lru_cache
-
-import pandas as pd
-
-from wk_data import DataSource
 from wk_data.mappings import register_get
-from wk_data.wind_data.index_daily_status import prepare_index_daily
+from wk_data.data.calendar_service import TradeCalendarService
 # from wk_data.local_data.ame_index_daily import prepare_ame_index
 from wk_platform.config import CalendarType
 
 
 @register_get('trade_calendar')
 def get_trade_calendar(begin_date, end_date=None, calendar=CalendarType.A_SHARE_MARKET):
-    ds = prepare_index_daily()
-    data: pd.DataFrame = ds.fetch_data(begin_date=begin_date, end_date=end_date, instrument='000001.SH')
-    data.sort_values('trade_dt', inplace=True)
-    trade_calendar = data['trade_dt'].tolist()
     if calendar == CalendarType.A_SHARE_MARKET:
-
-        return trade_calendar
+        return TradeCalendarService().trade_calendar(begin_date, end_date)
     else:
         assert False
         # ame_data = prepare_ame_index(begin_date, end_date, instrument='SPX.GI')
@@ -25,5 +15,3 @@ def get_trade_calendar(begin_date, end_date=None, calendar=CalendarType.A_SHARE_
 
         # full_calendar = list(set(ame_trade_calendar + trade_calendar))
         # return sorted(full_calendar)
-
-
@@ -11,25 +11,39 @@ from wk_util.logger import console_log
 # from wk_util.metaclass import SingletonType
 from wk_data.data_spec import DataSpec
 from wk_data.exceptions import DataOutOfRangeException
-from wk_data.proc_util import load_data, dump_data
+from wk_data.proc_util import load_data, dump_data, load_shards, SHARD_FILE_TYPES
 import wk_db
 
 
 class ShardDataBase:
-    def __init__(self, file_type):
-        assert file_type in ('h5', 'pkl')
+    def __init__(self, file_type, data_name=None):
+        assert file_type in SHARD_FILE_TYPES
         self.__file_type = file_type
+        self.__shard_data_name = data_name
+        self.__shard_data_spec = DataSpec(Configuration().data_dir)
 
     @property
     def file_type(self):
+        """
+        分片文件格式，数据经过格式迁移后以数据布局文件中记录的格式为准
+        """
+        if self.__shard_data_name is not None:
+            try:
+                return self.__shard_data_spec.get_shard_file_type(self.__shard_data_name)
+            except KeyError:
+                pass
         return self.__file_type
 
-    def load_data(self, file_names):
-        results = []
-        for f in file_names:
-            data: pd.DataFrame = load_data(f, self.__file_type)
-            results.append(data)
-        return pd.concat(results)
+    def load_data(self, file_names, columns=None, filters=None, max_workers=None, executor=None):
+        """
+        并发读取分片文件，结果按file_names的顺序拼接
+        columns: 需要读取的列
+        filters: 过滤条件 [(field, op, value), ...]，parquet格式下只读取满足条件的row group
+        max_workers: 并发数，None时使用配置 data_loader.max_workers；非parquet格式未显式指定时顺序读取
+        executor: 'thread' 或 'process'，None时使用配置 data_loader.executor
+        """
+        return load_shards(file_names, self.file_type, columns=columns, filters=filters,
+                           max_workers=max_workers, executor=executor)
 
 
 class YearlyShardData(ShardDataBase):
@@ -40,11 +54,12 @@ class YearlyShardData(ShardDataBase):
                  data_name=None,
                  fields=None,  date_field='trade_dt', fetch=False, fetch_func=None, proc_func=None, use_prev_data=False,
                  retrospect=False,
-                 file_type='h5'):
-        super().__init__(file_type)
+                 file_type='h5', code_field='windcode'):
+        if data_name is None:
+            data_name = table_name
+        super().__init__(file_type, data_name)
         self.__data_name = data_name
-        if self.__data_name is None:
-            self.__data_name = table_name
+        self.__code_field = code_field
 
         self.__table_name = table_name
         self.__date_field = date_field
@@ -65,8 +80,6 @@ class YearlyShardData(ShardDataBase):
                 assert fields is not None
                 self.__fetch_func = self.__gen_fetch_func()
 
-        self.__pandarallel_initialized = False
-
     def __gen_fetch_func(self):
         def fetch_func(begin_date, end_date):
             # stmt = text(
@@ -79,14 +92,19 @@ class YearlyShardData(ShardDataBase):
             return data
         return fetch_func
 
-    def fetch_data(self, begin_date, end_date=None):
+    def fetch_data(self, begin_date, end_date=None, *, columns=None, instruments=None):
+        """
+        columns: 需要读取的列，None表示全部
+        instruments: 需要读取的标的，None表示全部
+        """
         console_log(f"loading {self.__data_name} data from table {self.__table_name}...")
         file_names = self.__prepare_data(begin_date, end_date)
-        data = self.load_data(file_names)
-        if end_date is None:
-            return data[data[self.__date_field] >= begin_date]
-        else:
-            return data[(data[self.__date_field] >= begin_date) & (data[self.__date_field] <= end_date)]
+        filters = [(self.__date_field, '>=', begin_date)]
+        if end_date is not None:
+            filters.append((self.__date_field, '<=', end_date))
+        if instruments is not None:
+            filters.append((self.__code_field, 'in', list(instruments)))
+        return self.load_data(file_names, columns=columns, filters=filters)
 
     def __prepare_data(self, begin_date, end_date=None):
         begin_year = int(begin_date[:4])
@@ -126,7 +144,7 @@ class YearlyShardData(ShardDataBase):
 
     def __call_proc_func(self, data, year, buf_begin_date):
         if self.__proc_func is None:
-            return data
+            return data, None
 
         begin_date = f"{year}0101"
         end_date = f"{year}1231"
@@ -178,10 +196,10 @@ class YearlyShardData(ShardDataBase):
 
         file_path = self.__data_spec.yearly_shard_file_path(self.__data_name, year, file_type=self.file_type)
         file_path_list.append(str(file_path.absolute()))
-        dump_data(data, file_path, self.file_type)
+        dump_data(data, file_path, self.file_type, sort_by=[self.__date_field])
         if self.__retrospect and prev_data is not None:
             file_path = self.__data_spec.yearly_shard_file_path(self.__data_name, year-1, file_type=self.file_type)
-            dump_data(prev_data, file_path, self.file_type)
+            dump_data(prev_data, file_path, self.file_type, sort_by=[self.__date_field])
             file_path_list.append(str(file_path.absolute()))
         try:
             self.__data_spec.add_yearly_shard_file(self.__data_name, year, file_type=self.file_type)
@@ -223,11 +241,11 @@ class CodeShardData(ShardDataBase):
                  data_name=None,
                  fields=None,  date_field='trade_dt', fetch=False, fetch_func=None, proc_func=None,
                  file_type='h5'):
-        super(CodeShardData, self).__init__(file_type)
+        if data_name is None:
+            data_name = table_name
+        super(CodeShardData, self).__init__(file_type, data_name)
         self.__code_list = code_list
         self.__data_name = data_name
-        if self.__data_name is None:
-            self.__data_name = table_name
 
         self.__table_name = table_name
         self.__date_field = date_field
@@ -253,21 +271,18 @@ class CodeShardData(ShardDataBase):
             return data
         return fetch_func
 
-    def fetch_data(self, begin_date, end_date=None, *, instrument=None):
+    def fetch_data(self, begin_date, end_date=None, *, instrument=None, columns=None):
         if instrument is not None:
             code_list = [instrument]
         else:
             code_list = self.__code_list
-        data_list = []
+        filters = [(self.__date_field, '>=', begin_date)]
+        if end_date is not None:
+            filters.append((self.__date_field, '<=', end_date))
+        file_names = []
         for code in code_list:
-            file_names = self.__prepare_data(code)
-            data = self.load_data(file_names)
-            if end_date is None:
-                data_part = data[data[self.__date_field] >= begin_date]
-            else:
-                data_part = data[(data[self.__date_field] >= begin_date) & (data[self.__date_field] <= end_date)]
-            data_list.append(data_part)
-        return pd.concat(data_list)
+            file_names.extend(self.__prepare_data(code))
+        return self.load_data(file_names, columns=columns, filters=filters)
 
     def __prepare_data(self, windcode):
         file_names = []
@@ -304,7 +319,7 @@ class CodeShardData(ShardDataBase):
             data = self.__proc_func(data)
 
         file_path = self.__data_spec.code_shard_file_path(self.__data_name, code, file_type=self.file_type)
-        dump_data(data, file_path, self.file_type)
+        dump_data(data, file_path, self.file_type, sort_by=[self.__date_field])
         try:
             self.__data_spec.add_code_shard_file(self.__data_name, code, file_type=self.file_type)
         except KeyError:
@@ -335,3 +350,45 @@ class CodeShardData(ShardDataBase):
             return []
 
         return self.__force_prepare_data()
+
+
+def migrate_shard_data(data_name, file_type='parquet', date_field='trade_dt', remove_old=False):
+    """
+    将已有的分片数据转换为指定格式，并在数据布局文件中记录新的格式，之后读写该数据均使用新格式
+
+    Parameters
+    ==================
+    data_name: str
+        数据名称，即数据布局文件中data_shard下的字段
+    file_type: str
+        目标格式
+    date_field: str
+        日期字段，parquet格式按此字段排序写入
+    remove_old: bool
+        是否删除旧格式的文件
+    """
+    assert file_type in SHARD_FILE_TYPES
+    config = Configuration()
+    data_spec = DataSpec(config.data_dir)
+
+    migrated = {}
+    old_files = []
+    for field, file_name in data_spec.shard_files(data_name).items():
+        old_path = config.data_dir.joinpath(file_name)
+        old_type = old_path.suffix[1:]
+        if old_type == file_type:
+            continue
+        aux_info = field[len(data_spec.shard_field_name(data_name, '')):]
+        new_name = data_spec.shard_file_name(data_name, aux_info, file_type=file_type)
+        console_log(f"migrating {file_name} -> {new_name}")
+        data = load_data(str(old_path), old_type)
+        dump_data(data, config.data_dir.joinpath(new_name), file_type, sort_by=[date_field])
+        migrated[field] = new_name
+        old_files.append(old_path)
+
+    data_spec.replace_shard_files(data_name, migrated, file_type)
+
+    if remove_old:
+        for p in old_files:
+            p.unlink()
+    return list(migrated.values())
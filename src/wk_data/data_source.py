@@ -18,7 +18,6 @@ from functools import lru_cache
 
 import toml
 import pandas as pd
-from pandarallel import pandarallel
 from pyalgotrade.bar import Frequency
 
 from wk_data import db_util
@@ -344,7 +343,6 @@ class DataSourceBase(metaclass=SingletonType):
     """
 
     def __init__(self, fetch=False):
-        self.__pandarallel_initialized = False
         self.__config = Configuration()
         # self.__spec_path = self.__config.data_dir.joinpath(DATA_LAYOUT_SPEC_FILE)
         self.__data_spec = DataSpec(self.__config.data_dir)
@@ -371,10 +369,6 @@ class DataSourceBase(metaclass=SingletonType):
         return get_trade_calendar(begin_date, end_date)
 
     def __download_daily_data(self, year):
-        if not self.__pandarallel_initialized:
-            pandarallel.initialize()
-            self.__pandarallel_initialized = True
-
         console_log("downloading daily data of", year)
         begin_date = f"{year}0101"
         end_date = f"{year + 1}0101"
@@ -429,11 +423,9 @@ class DataSourceBase(metaclass=SingletonType):
         return pd.read_hdf(f, **kwargs)
 
     def __load_data(self, file_names):
-        results = []
-        for f in file_names:
-            data = self.__read_hdf(f)
-            results.append(data)
-        return pd.concat(results)
+        # HDF5不是线程安全的，读取函数带有缓存也无法在进程池中使用，因此顺序读取
+        frames = pu.read_frames(file_names, self.__read_hdf, max_workers=1)
+        return pu.concat_frames(frames)
 
     def get_daily(self, begin_date, end_date=None):
         console_log("loading market data...")
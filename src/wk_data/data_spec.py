@@ -9,6 +9,8 @@ import toml
 import fcntl
 from wk_util.metaclass import SingletonType
 from wk_util.configuration import Configuration
+from wk_util.file_digest import md5
+from wk_data.proc_util import SHARD_FILE_TYPES
 
 
 DATA_LAYOUT_SPEC_FILE = 'data_spec.toml'
@@ -81,6 +83,7 @@ class DataSpec(metaclass=SingletonType):
         self.__spec_path = data_dir.joinpath(DATA_LAYOUT_SPEC_FILE)
         self.__ref_spec = {}
         self.__spec = None
+        self.__mtime = None
         try:
             self.load()
         except FileNotFoundError:
@@ -88,9 +91,19 @@ class DataSpec(metaclass=SingletonType):
             self.load()
 
     def load(self):
+        self.__mtime = self.__spec_path.stat().st_mtime_ns
         self.__spec = toml.load(self.__spec_path)
         self.__ref_spec = copy.deepcopy(self.__spec)
 
+    def reload_if_modified(self):
+        """
+        磁盘上的布局文件被其他进程修改后重新加载，返回是否重新加载
+        """
+        if self.__spec_path.stat().st_mtime_ns == self.__mtime:
+            return False
+        self.load()
+        return True
+
     def __make_empty_data_spec(self):
         self.__spec = {
             'daily': {'update_date': '20091231'},
@@ -109,6 +122,13 @@ class DataSpec(metaclass=SingletonType):
             toml.dump(self.__spec, f)
         self.load()
 
+    @property
+    def revision(self):
+        """
+        数据布局文件的修订号，直接由磁盘上的文件内容计算，任何进程写入新的数据分片后都会改变
+        """
+        return md5(self.__spec_path)
+
     @property
     def last_update_date(self):
         return self.__spec['daily']['update_date']
@@ -208,13 +228,40 @@ class DataSpec(metaclass=SingletonType):
         self.shard_spec(data_name)[f"{data_name}_update"] = date_str
         self.save()
 
+    def get_shard_file_type(self, data_name):
+        """
+        数据迁移后记录的文件格式，未迁移过的数据抛出KeyError
+        """
+        return self.shard_spec(data_name)['file_type']
+
+    def set_shard_file_type(self, data_name, file_type):
+        self.shard_spec(data_name)['file_type'] = file_type
+        self.save()
+
+    def shard_files(self, data_name):
+        """
+        返回数据的全部分片，{分片字段: 文件名}
+        """
+        prefix = self.shard_field_name(data_name, '')
+        update_field = f"{data_name}_update"
+        return {
+            k: v for k, v in self.shard_spec(data_name).items()
+            if k.startswith(prefix) and k != update_field and isinstance(v, str)
+        }
+
+    def replace_shard_files(self, data_name, files: dict, file_type):
+        """
+        批量替换分片文件名并记录文件格式，只写入一次布局文件
+        """
+        spec = self.shard_spec(data_name)
+        spec.update(files)
+        spec['file_type'] = file_type
+        self.save()
+
     @classmethod
     def shard_file_name(cls, data_name, aux_info, file_type='h5'):
-        assert file_type in ('h5', 'pkl')
-        if file_type == 'h5':
-            return f"{cls.shard_field_name(data_name, aux_info)}.h5"
-        elif file_type == 'pkl':
-            return f"{cls.shard_field_name(data_name, aux_info)}.pkl"
+        assert file_type in SHARD_FILE_TYPES
+        return f"{cls.shard_field_name(data_name, aux_info)}.{file_type}"
 
     @staticmethod
     def shard_field_name(data_name, aux_info):
@@ -49,7 +49,7 @@
 # def update(name):
 #     return UPDATE_DISPATCHER_MAPPING[name]()
 
-import importlib.util
+import importlib
 import pathlib
 
 from wk_data.mappings import GET_MAPPING
@@ -59,7 +59,7 @@ from wk_data.mappings import SYNC_MAPPING
 from wk_data.mappings import RegisterEnv
 
 __all__ = [
-    'get', 'update', 'show_mappings', 'sync'
+    'get', 'update', 'show_mappings', 'sync', 'migrate'
 ]
 
 
@@ -81,10 +81,9 @@ def _init(module_path: pathlib.Path):
             # print(f)
             if f.is_file() and f.suffix == '.py':
                 import_name = _calc_import_name(f)
-                spec = importlib.util.spec_from_file_location(import_name, f.absolute())
-                spec.loader.exec_module(
-                    importlib.util.module_from_spec(spec)
-                )
+                # 按模块路径正常导入，使每个数据模块只有一份，其中定义的类（如MRRecord）可以被pickle；
+                # 已被其他数据模块导入的模块在本函数内导入，同样已完成注册
+                importlib.import_module(import_name)
 
 
 def get(name, *, begin_date=None, end_date=None, **kwargs):
@@ -121,6 +120,14 @@ def sync(name, **kwargs):
     return SYNC_MAPPING[name](**kwargs)
 
 
+def migrate(name, file_type='parquet', **kwargs):
+    """
+    将分片数据转换为指定的文件格式
+    """
+    from wk_data.data_shard import migrate_shard_data
+    return migrate_shard_data(name, file_type=file_type, **kwargs)
+
+
 _init(pathlib.Path(__file__).parent.joinpath('wind_data'))
 _init(pathlib.Path(__file__).parent.joinpath('data'))
 _init(pathlib.Path(__file__).parent.joinpath('local_data'))
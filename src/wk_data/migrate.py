@@ -0,0 +1,27 @@
+"""
+分片数据格式迁移
+
+python -m wk_data.migrate a_share_market --file-type parquet
+"""
+import argparse
+
+from wk_data.data_shard import migrate_shard_data
+from wk_util.logger import console_log
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="将分片数据转换为指定的文件格式，并记录到数据布局文件中")
+    parser.add_argument('data_name', nargs='+', help="数据名称，如 a_share_market")
+    parser.add_argument('--file-type', default='parquet', choices=['h5', 'pkl', 'parquet'], help="目标格式")
+    parser.add_argument('--date-field', default='trade_dt', help="日期字段，parquet格式按此字段排序写入")
+    parser.add_argument('--remove-old', action='store_true', help="迁移完成后删除旧格式的文件")
+    args = parser.parse_args(args)
+
+    for data_name in args.data_name:
+        files = migrate_shard_data(data_name, file_type=args.file_type, date_field=args.date_field,
+                                   remove_old=args.remove_old)
+        console_log(f"{data_name}: {len(files)} files migrated")
+
+
+if __name__ == '__main__':
+    main()
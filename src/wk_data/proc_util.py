@@ -1,9 +1,12 @@
 import os
 import pathlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
 
 import numpy as np
 import pandas as pd
 from wk_data.constants import ExtStatus
+from wk_util.configuration import Configuration
 from wk_util.logger import console_log
 
 
@@ -167,6 +170,151 @@ def group_processor(data, current_date, trade_calendar=None, mr_map=None):
     return data
 
 
+def _group_bounds(codes):
+    """
+    codes已按标的排序，返回每个标的所在的行区间 [starts, ends)
+    """
+    n = len(codes)
+    if n == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], n]
+    return starts, ends
+
+
+def _in_mr_map(mr_map, windcode):
+    # 与mark_delisting_merger_and_reorganization一致，以是否抛出KeyError判断
+    try:
+        mr_map[windcode]
+        return True
+    except KeyError:
+        return False
+
+
+def _vectorized_group_processor(data, current_date, trade_calendar=None, mr_map=None, window=20):
+    """
+    与 data.groupby('windcode').apply(group_processor) 结果一致的向量化实现
+
+    缺失值填充、退市日虚拟行情与amount_ma对全部数据一次完成；涉及并购重组的标的每年只有少量，
+    这部分标的仍逐个调用group_processor处理
+    """
+    if 'ext_status' not in data.columns:
+        data = data.assign(ext_status=ExtStatus.NORMAL.value)
+    if mr_map is None:
+        mr_map = {}
+
+    # proc_na: 组内按日期排序后向前填充，仅处理存在缺失值的列，组内无可填充的值时保留原始的空值
+    data = data.sort_values(by=['windcode', 'trade_dt'], kind='mergesort')
+    na_columns = [c for c in data.columns if c != 'windcode' and data[c].hasnans]
+    if na_columns:
+        original = data[na_columns]
+        filled = data.groupby('windcode', sort=False)[na_columns].ffill()
+        data[na_columns] = filled.where(filled.notna(), original)
+
+    codes = data['windcode'].to_numpy()
+    starts, ends = _group_bounds(codes)
+    sizes = ends - starts
+    last = ends - 1
+
+    # 与mark_delisting_merger_and_reorganization的提前返回条件一致，满足条件的标的不需要补充虚拟行情
+    last_status = data['ext_status'].to_numpy()[last]
+    last_dt = data['trade_dt'].to_numpy()[last]
+    delist_date = data.groupby('windcode', sort=False)['delist_date'].first().to_numpy()
+    has_delist = pd.notna(delist_date)
+    delist_in_future = np.array([h and current_date < d for h, d in zip(has_delist, delist_date)], dtype=bool)
+    untouched = (
+        (last_status != ExtStatus.NORMAL.value)
+        | (~has_delist & (last_dt == current_date))
+        | (has_delist & delist_in_future)
+    )
+    is_mr = np.array([not u and _in_mr_map(mr_map, codes[i]) for i, u in zip(last, untouched)], dtype=bool)
+    delisting = ~untouched & ~is_mr
+
+    # 退市：复制最后一行作为退市日行情，价格为0，可交易量无穷大
+    delist_rows = data.iloc[last[delisting]].copy()
+    if len(delist_rows) > 0:
+        no_delist_date = ~has_delist[delisting]
+        dates = delist_date[delisting].copy()
+        if no_delist_date.any():
+            # 吸收合并未更新或剩余情况，以最后一个交易日的下一交易日作为退市日
+            dates[no_delist_date] = [trade_calendar[trade_calendar.index(d) + 1]
+                                     for d in last_dt[delisting][no_delist_date]]
+        delist_rows['trade_dt'] = dates
+        delist_rows[['open', 'close', 'high', 'low']] = 0
+        delist_rows['volume'] = np.inf
+        delist_rows['ext_status'] = ExtStatus.DUMMY_BAR_FOR_DELISTING.value
+
+    # 新增行排在所属标的的末尾，与逐标的concat的顺序一致
+    keep = np.repeat(~is_mr, sizes)
+    order = np.r_[np.arange(len(data))[keep], last[delisting] + 0.5]
+    bulk = pd.concat([data[keep], delist_rows]) if len(delist_rows) > 0 else data[keep]
+    bulk = bulk.iloc[np.argsort(order, kind='stable')]
+    begin_date = np.repeat(data['trade_dt'].to_numpy()[starts], sizes + delisting)[np.repeat(~is_mr, sizes + delisting)]
+
+    bulk_codes = bulk['windcode'].to_numpy()
+    bulk_starts, bulk_ends = _group_bounds(bulk_codes)
+    bulk_sizes = bulk_ends - bulk_starts
+    ma = bulk.groupby('windcode', sort=False)['amount'].rolling(window).mean().to_numpy()
+    na_idx = np.isnan(ma)
+    expected_na = np.where(bulk_sizes >= window, window - 1, bulk_sizes)
+    assert na_idx.sum() == expected_na.sum()
+    # 没有 ma20 的前19个数据直接用原始数据填充
+    bulk = bulk.assign(amount_ma=np.where(na_idx, bulk['amount'].to_numpy(), ma))
+
+    # 填充数据的生成根据trade_calendar确定，并会根据begin_date作裁剪
+    trade_dt = bulk['trade_dt'].to_numpy()
+    bulk = bulk[(trade_dt >= begin_date) & (trade_dt <= current_date)]
+
+    mr_parts = [
+        group_processor(data.iloc[starts[i]:ends[i]], current_date, trade_calendar, mr_map)
+        for i in np.flatnonzero(is_mr)
+    ]
+    if len(mr_parts) == 0:
+        return bulk.reset_index(drop=True)
+
+    result = pd.concat([bulk] + mr_parts)
+    # 恢复按标的排列的顺序，标的内部的顺序保持不变
+    result = result.iloc[np.argsort(result['windcode'].to_numpy(), kind='stable')]
+    return result.reset_index(drop=True)
+
+
+def process_groups(data, current_date, trade_calendar=None, mr_map=None, using_parallel=False, max_workers=None):
+    """
+    按标的执行缺失值填充、退市与并购重组标记以及amount_ma预计算
+
+    Parameters
+    ==================
+    using_parallel: bool
+        是否按标的切分后在进程池中并行处理，数据量较小时收益有限
+    max_workers: int | None
+        进程数，None时读取配置 data_loader.max_workers
+    """
+    if not using_parallel:
+        return _vectorized_group_processor(data, current_date, trade_calendar, mr_map)
+
+    max_workers, _ = _loader_config(max_workers, 'process')
+    code_list = np.sort(data['windcode'].unique())
+    if max_workers <= 1 or len(code_list) < 2 * max_workers:
+        return _vectorized_group_processor(data, current_date, trade_calendar, mr_map)
+
+    # 按标的代码分块，分块之间代码有序，拼接后无需重新排序
+    chunks = [data[data['windcode'].isin(c)] for c in np.array_split(code_list, max_workers)]
+    func = partial(_vectorized_group_processor, current_date=current_date,
+                   trade_calendar=trade_calendar, mr_map=mr_map)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(func, chunks))
+    return pd.concat(results).reset_index(drop=True)
+
+
+def _process_groups_legacy(data, current_date, trade_calendar=None, mr_map=None):
+    """
+    逐标的groupby.apply的实现，保留用于结果核对
+    """
+    def group_processor_curried(data_part):
+        return group_processor(data_part, current_date, trade_calendar, mr_map)
+    return data.groupby("windcode", group_keys=True).apply(group_processor_curried).reset_index(drop=True)
+
+
 def fillna_with_previous_data(data, previous_data, trade_calendar=None, mr_map=None, using_parallel=False):
     """
     考虑前值的缺失值填充
@@ -176,12 +324,7 @@ def fillna_with_previous_data(data, previous_data, trade_calendar=None, mr_map=N
 
     full_data: pd.DataFrame = pd.concat([previous_data[previous_data['trade_dt'] < begin_date], data]).reset_index(drop=True)
 
-    def group_processor_curried(data_part):
-        return group_processor(data_part, current_date, trade_calendar, mr_map)
-    if using_parallel:
-        full_data = full_data.groupby("windcode", group_keys=True).parallel_apply(group_processor_curried).reset_index(drop=True)
-    else:
-        full_data = full_data.groupby("windcode", group_keys=True).apply(group_processor_curried).reset_index(drop=True)
+    full_data = process_groups(full_data, current_date, trade_calendar, mr_map, using_parallel=using_parallel)
     selected_data = full_data[
         ['trade_dt', 'windcode', 'pre_close', 'open', 'high', 'low', 'close', 'industry_name', 'volume', 'st', 'suspension',
          'sec_name', 'max_up_down', 'list_date', 'amount', 'adj_factor', 'delist_date', 'ext_status', 'amount_ma']]
@@ -237,20 +380,9 @@ def process_price_data(data, previous_data=None, trade_calendar=None, mr_map=Non
     console_log("total instrument count", len(groups.keys()))
 
     # 数据表中存在负数值的情况，按照windcode分组，按照trade_dt排序，负数设为Null，之后按照前值fillna
-    # 该段代码执行速度较慢
     console_log("processing data")
 
-    cs = len(data.columns)
-    def group_processor_curried(data_part):
-        data = group_processor(data_part, current_date, trade_calendar, mr_map)
-        return data
-
-    if using_parallel:
-        processed_data = data.groupby("windcode", group_keys=True).parallel_apply(group_processor_curried)
-        processed_data = processed_data.reset_index(drop=True)
-    else:
-        processed_data = data.groupby("windcode", group_keys=True).apply(group_processor_curried)
-        processed_data = processed_data.reset_index(drop=True)
+    processed_data = process_groups(data, current_date, trade_calendar, mr_map, using_parallel=using_parallel)
 
     """
     筛选实际用的列，保存成HDF5和CSV.
@@ -296,8 +428,18 @@ def process_spif_data(data: pd.DataFrame):
     return selected_data
 
 
-def dump_data(data: pd.DataFrame, file_path, file_type="h5"):
-    if file_type not in ("h5", 'pkl'):
+SHARD_FILE_TYPES = ('h5', 'pkl', 'parquet')
+
+# parquet文件每个row group的行数，数据按日期排序写入后，按日期过滤时只需读取相关的row group
+PARQUET_ROW_GROUP_SIZE = 50000
+
+
+def dump_data(data: pd.DataFrame, file_path, file_type="h5", sort_by=None):
+    """
+    sort_by: list | None
+        仅对parquet格式生效，写入前按该字段排序，使row group的统计信息可用于过滤
+    """
+    if file_type not in SHARD_FILE_TYPES:
         raise ValueError(f"Unsupported data type `{file_type}`")
 
     if os.path.exists(file_path):
@@ -308,22 +450,173 @@ def dump_data(data: pd.DataFrame, file_path, file_type="h5"):
         data.to_hdf(file_path, 'df', complevel=9, complib='blosc', format="table")
     elif file_type == 'pkl':
         data.to_pickle(file_path)
+    elif file_type == 'parquet':
+        if sort_by is not None:
+            data = data.sort_values(by=sort_by, kind='mergesort')
+        data.to_parquet(file_path, index=False, row_group_size=PARQUET_ROW_GROUP_SIZE)
 
 
-def load_data(file_path: str, file_type='h5'):
-    if file_type not in ("h5", 'pkl'):
+def apply_filters(data: pd.DataFrame, filters):
+    """
+    在内存中执行与parquet相同格式的过滤条件，filters为 [(field, op, value), ...]，各条件之间为且的关系
+    """
+    if not filters:
+        return data
+    mask = np.ones(len(data), dtype=bool)
+    for field, op, value in filters:
+        column = data[field]
+        if op == '==':
+            mask &= (column == value).to_numpy()
+        elif op == '>=':
+            mask &= (column >= value).to_numpy()
+        elif op == '<=':
+            mask &= (column <= value).to_numpy()
+        elif op == '>':
+            mask &= (column > value).to_numpy()
+        elif op == '<':
+            mask &= (column < value).to_numpy()
+        elif op == 'in':
+            mask &= column.isin(value).to_numpy()
+        else:
+            raise ValueError(f"Unsupported filter operator `{op}`")
+    return data[mask]
+
+
+def load_data(file_path: str, file_type='h5', columns=None, filters=None):
+    """
+    columns: list | None
+        需要读取的列，None表示全部
+    filters: list | None
+        过滤条件，格式见apply_filters；parquet格式下下推至文件读取，其余格式在读取后过滤
+    """
+    if file_type not in SHARD_FILE_TYPES:
         raise ValueError(f"Unsupported data type `{file_type}`")
 
     p = pathlib.Path(file_path)
     if p.suffix != '.' + file_type:
         raise ValueError(f"Unmatched data type `{p.suffix}` and `{file_type}`")
 
+    if file_type == 'parquet':
+        return pd.read_parquet(file_path, columns=columns, filters=filters if filters else None)
+
     if file_type == 'h5':
         data = pd.read_hdf(file_path)
     elif file_type == 'pkl':
         data = pd.read_pickle(file_path)
     else:
         assert False
+    data = apply_filters(data, filters)
+    if columns is not None:
+        data = data[columns]
     return data
 
 
+# 并发读取分片文件时的默认配置，可在配置文件的 [data_loader] 中修改
+DEFAULT_LOADER_EXECUTOR = 'thread'
+# 可以在线程池中并发读取的文件格式，PyTables/HDF5不是线程安全的，h5等格式改用进程池
+THREAD_SAFE_FILE_TYPES = ('parquet',)
+
+
+def _loader_config(max_workers=None, executor=None):
+    config = Configuration()
+    if executor is None:
+        executor = config.get(['data_loader', 'executor'], DEFAULT_LOADER_EXECUTOR)
+    if max_workers is None:
+        max_workers = config.get(['data_loader', 'max_workers'], os.cpu_count() or 1)
+    if executor not in ('thread', 'process'):
+        raise ValueError(f"Unsupported executor `{executor}`")
+    return int(max_workers), executor
+
+
+def _loader_configured(max_workers=None, executor=None):
+    """
+    调用方或配置文件的 [data_loader] 中是否显式指定了并发参数
+    """
+    if max_workers is not None or executor is not None:
+        return True
+    config = Configuration()
+    for key in ('max_workers', 'executor'):
+        try:
+            config.get(['data_loader', key])
+            return True
+        except KeyError:
+            pass
+    return False
+
+
+def read_frames(file_paths, reader, max_workers=None, executor=None):
+    """
+    并发读取多个文件，返回结果的顺序与file_paths一致
+
+    Parameters
+    ==================
+    file_paths: list
+        文件路径
+    reader: callable
+        读取单个文件的函数，使用进程池时必须可以被pickle
+    max_workers: int | None
+        并发数，None时读取配置 data_loader.max_workers，默认为CPU核数
+    executor: str | None
+        'thread' 或 'process'，None时读取配置 data_loader.executor，默认为'thread'；
+        reader不是线程安全的（如读取h5文件）时不能使用'thread'
+    """
+    file_paths = list(file_paths)
+    max_workers, executor = _loader_config(max_workers, executor)
+    max_workers = min(max_workers, len(file_paths))
+    if max_workers <= 1:
+        return [reader(f) for f in file_paths]
+
+    pool_cls = ThreadPoolExecutor if executor == 'thread' else ProcessPoolExecutor
+    with pool_cls(max_workers=max_workers) as pool:
+        # map按提交顺序返回结果，保证年份/代码顺序不变
+        return list(pool.map(reader, file_paths))
+
+
+def concat_frames(frames):
+    """
+    将列相同的多个DataFrame按顺序拼接，按总行数预先分配每一列的内存后逐块填充，避免pd.concat的逐列类型推断和多次复制；
+    列名、列类型不一致或存在扩展类型时退回pd.concat
+    """
+    frames = [f for f in frames if f is not None]
+    if len(frames) == 0:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0].copy()
+
+    first = frames[0]
+    columns = first.columns
+    dtypes = first.dtypes
+    for f in frames[1:]:
+        if not f.columns.equals(columns) or not f.dtypes.equals(dtypes):
+            return pd.concat(frames)
+    if not all(isinstance(t, np.dtype) for t in dtypes) or not columns.is_unique:
+        return pd.concat(frames)
+
+    total = sum(len(f) for f in frames)
+    bounds = np.cumsum([0] + [len(f) for f in frames])
+    data = {}
+    for i, col in enumerate(columns):
+        buffer = np.empty(total, dtype=dtypes.iloc[i])
+        for f, lo, hi in zip(frames, bounds[:-1], bounds[1:]):
+            buffer[lo:hi] = f.iloc[:, i].to_numpy()
+        data[col] = buffer
+    index = first.index.append([f.index for f in frames[1:]])
+    return pd.DataFrame(data, index=index, columns=columns, copy=False)
+
+
+def load_shards(file_paths, file_type='h5', columns=None, filters=None, max_workers=None, executor=None):
+    """
+    并发读取分片文件并按顺序拼接，参数含义见load_data和read_frames
+
+    只有parquet格式默认并发读取；其余格式（如h5）需要通过进程池传回整个DataFrame，
+    默认顺序读取，只有调用方或配置文件显式指定了max_workers/executor时才并发，且即使指定为'thread'也使用进程池
+    """
+    configured = _loader_configured(max_workers, executor)
+    max_workers, executor = _loader_config(max_workers, executor)
+    if file_type not in THREAD_SAFE_FILE_TYPES:
+        if not configured:
+            max_workers = 1
+        elif executor == 'thread':
+            executor = 'process'
+    reader = partial(load_data, file_type=file_type, columns=columns, filters=filters)
+    return concat_frames(read_frames(file_paths, reader, max_workers=max_workers, executor=executor))
@@ -60,10 +60,10 @@ def update_a_share_market(**kwargs):
 
 
 @register_get(DATASET_NAME)
-def fetch_a_share_market(begin_date=None, end_date=None, check_calendar=False):
+def fetch_a_share_market(begin_date=None, end_date=None, check_calendar=False, *, columns=None, instruments=None):
     if check_calendar:
         trade_calender = get_trade_calendar(begin_date, end_date)
         if len(trade_calender) > 0:
             end_date = trade_calender[-1]
     ds = prepare_a_share_market()
-    return ds.fetch_data(begin_date, end_date)
\ No newline at end of file
+    return ds.fetch_data(begin_date, end_date, columns=columns, instruments=instruments)
\ No newline at end of file
@@ -0,0 +1 @@
+version = __version__ = "0.0.0"
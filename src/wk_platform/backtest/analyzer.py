@@ -3,9 +3,12 @@
 各类回测指标的计算算子
 
 """
+import contextvars
+import os
+import threading
 import pandas as pd
-import copy
 import math
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from collections import OrderedDict
 
 import numpy as np
@@ -14,30 +17,56 @@ from wk_platform.broker.commission import TradePercentage, StampTaxAShare
 from wk_platform.broker.commission import TradePercentageTaxFee
 from wk_platform.config import StrategyConfiguration, HedgeStrategyConfiguration
 from wk_platform.stratanalyzer.sharpe import sharpe_ratio_3
-from wk_platform.stratanalyzer.drawdown import draw_down as calc_draw_down
+from wk_platform.stratanalyzer.drawdown_kernel import draw_down_frame, grouped_max_draw_down_frame
 import wk_platform.backtest.util as bench_util
+from wk_platform.util.profiler import profile_section
 
 
 class AnalyzerContext:
     """
     保存指标的计算图
+
+    除算子外还缓存各算子共用的中间结果（如带日期索引的日收益率），通过 `shared` 获取，
+    同一个中间结果只计算一次。缓存的对象在算子间共享，使用方不得原地修改
     """
 
     def __init__(self):
         self.__analyzers_status: dict[str: bool] = {}
         self.__analyzers: dict[str: BaseAnalyzer] = {}
+        self.__shared: dict[str: object] = {}
+        self.__shared_locks: dict[str: threading.Lock] = {}
+        self.__lock = threading.Lock()
 
     def add_analyzer(self, analyzer):
         key = analyzer.__class__.__name__
-        try:
-            _ = self.__analyzers[key]
-            raise ValueError("Duplicated analyzer")
-        except KeyError:
+        with self.__lock:
+            if key in self.__analyzers:
+                raise ValueError("Duplicated analyzer")
             self.__analyzers[key] = analyzer
             self.__analyzers_status[key] = True
 
     def check_finished(self, analyzer_class):
-        return self.__analyzers_status[analyzer_class.__name__]
+        return self.finished(analyzer_class.__name__)
+
+    def finished(self, name) -> bool:
+        return self.__analyzers_status.get(name, False)
+
+    def shared(self, key, factory):
+        """
+        获取共享的中间结果，首次获取时调用factory计算并缓存
+
+        并行执行时同一个key只会计算一次，其他线程等待计算完成后直接使用缓存结果
+        """
+        try:
+            return self.__shared[key]
+        except KeyError:
+            pass
+        with self.__lock:
+            key_lock = self.__shared_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self.__shared:
+                self.__shared[key] = factory()
+            return self.__shared[key]
 
     def __getitem__(self, analyzer_class):
         return self.__analyzers[analyzer_class.__name__]
@@ -49,6 +78,17 @@ class BaseAnalyzer:
         if dependencies is not None:
             self.__dependencies += dependencies
 
+    @property
+    def name(self):
+        return self.__class__.__name__
+
+    @property
+    def dependencies(self) -> list[str]:
+        """
+        依赖的算子名称
+        """
+        return [dep.__name__ for dep in self.__dependencies]
+
     def __check_dependencies(self, context: AnalyzerContext) -> bool:
         for dep in self.__dependencies:
             if not context.check_finished(dep):
@@ -61,7 +101,8 @@ class BaseAnalyzer:
     def __call__(self, context: AnalyzerContext):
         if not self.__check_dependencies(context):
             raise ValueError("calculation dependencies check failed")
-        self._analyze(context)
+        with profile_section(f'analyzer.{self.__class__.__name__}'):
+            self._analyze(context)
         context.add_analyzer(self)
 
 
@@ -82,6 +123,99 @@ class Depend:
         return func
 
 
+def run_analyzers(analyzers: list[BaseAnalyzer], context: AnalyzerContext, max_workers=1):
+    """
+    按依赖关系调度执行算子
+
+    算子按声明的依赖关系拓扑排序，默认在当前线程中依次执行；max_workers大于1时依赖均已完成的算子之间相互独立，
+    使用线程池并行执行。同时就绪的算子按列表中的先后顺序提交。已在context中完成的依赖视为满足
+
+    Parameters
+    ==================
+    analyzers: list[BaseAnalyzer]
+        待执行的算子，依赖的算子必须在列表中或已在context中完成
+    context: AnalyzerContext
+        计算上下文
+    max_workers: int | None
+        并行线程数，默认为1即在当前线程中按拓扑顺序依次执行，为None时取算子数与CPU核数的较小值
+    """
+    names = [analyzer.name for analyzer in analyzers]
+    if len(set(names)) != len(names):
+        raise ValueError("Duplicated analyzer")
+    waiting = {}
+    dependents = {name: [] for name in names}
+    for analyzer in analyzers:
+        deps = [dep for dep in dict.fromkeys(analyzer.dependencies) if not context.finished(dep)]
+        for dep in deps:
+            if dep not in dependents:
+                raise ValueError(f"analyzer {analyzer.name} depends on {dep}, which is not scheduled")
+            dependents[dep].append(analyzer.name)
+        waiting[analyzer.name] = len(deps)
+    by_name = dict(zip(names, analyzers))
+    ready = [name for name in names if waiting[name] == 0]
+
+    def finish(name):
+        released = []
+        for dependent in dependents[name]:
+            waiting[dependent] -= 1
+            if waiting[dependent] == 0:
+                released.append(dependent)
+        # 保持列表中的先后顺序
+        ready.extend(sorted(released, key=names.index))
+
+    if max_workers is None:
+        max_workers = min(len(analyzers), os.cpu_count() or 1)
+
+    done = 0
+    if max_workers <= 1:
+        while ready:
+            name = ready.pop(0)
+            by_name[name](context)
+            finish(name)
+            done += 1
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            running = {}
+            while ready or running:
+                while ready:
+                    name = ready.pop(0)
+                    # 每个任务在当前上下文的副本中执行，使profile_section记录到同一个profiler
+                    running[pool.submit(contextvars.copy_context().run, by_name[name], context)] = name
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    future.result()
+                    finish(name)
+                    done += 1
+
+    if done != len(analyzers):
+        pending = [name for name in names if waiting[name] > 0]
+        raise ValueError(f"circular analyzer dependencies: {pending}")
+
+
+def select_analyzers(analyzers: list[BaseAnalyzer], targets) -> list[BaseAnalyzer]:
+    """
+    选出计算targets所需的算子，包括其直接和间接依赖，保持列表中的先后顺序
+
+    Parameters
+    ==================
+    analyzers: list[BaseAnalyzer]
+        全部算子
+    targets: Iterable
+        目标算子的类或名称
+    """
+    by_name = {analyzer.name: analyzer for analyzer in analyzers}
+    required = set()
+    stack = [target if isinstance(target, str) else target.__name__ for target in targets]
+    while stack:
+        name = stack.pop()
+        if name in required:
+            continue
+        required.add(name)
+        stack.extend(by_name[name].dependencies)
+    return [analyzer for analyzer in analyzers if analyzer.name in required]
+
+
 class BasicInfoAnalyzer(BaseAnalyzer):
     def __init__(self, strategy, strategy_name,  config: StrategyConfiguration):
         super().__init__()
@@ -143,6 +277,62 @@ class BenchAnalyzer(BaseAnalyzer):
         # setattr(self, "benchmark", self.__bench_ins.getBenchStandard().reset_index())
 
 
+def shared_benchmark(context: AnalyzerContext) -> pd.DataFrame:
+    """
+    以日期字符串为索引的净值序列，在算子间共享，不再每次访问时复制
+    """
+    return context.shared('benchmark', lambda: context[BenchAnalyzer].benchmark)
+
+
+def shared_benchmark_with_base(context: AnalyzerContext) -> pd.DataFrame:
+    return context.shared('benchmark_with_base', lambda: context[BenchAnalyzer].benchmark_with_base)
+
+
+def shared_benchmark_by_date(context: AnalyzerContext) -> pd.DataFrame:
+    """
+    以日期为索引的净值序列，用于按周、月、年重采样
+    """
+    def factory():
+        benchmark = shared_benchmark(context).copy(deep=False)
+        benchmark.index = pd.to_datetime(benchmark.index, format='%Y%m%d').rename('date')
+        return benchmark
+    return context.shared('benchmark_by_date', factory)
+
+
+def shared_daily_returns(context: AnalyzerContext) -> pd.DataFrame:
+    """
+    以日期为索引的日收益率，首日收益率为0，用于计算周、月波动率
+    """
+    def factory():
+        daily_returns = shared_benchmark_with_base(context).pct_change()
+        daily_returns = bench_util.remove_net_value_base(daily_returns).fillna(0)
+        daily_returns.index = pd.to_datetime(daily_returns.index, format='%Y%m%d')
+        return daily_returns
+    return context.shared('daily_returns', factory)
+
+
+def shared_daily_change_by_date(context: AnalyzerContext) -> pd.DataFrame:
+    """
+    以日期为索引的DailyMetricAnalyzer.daily_change
+    """
+    def factory():
+        daily_change = context[DailyMetricAnalyzer].daily_change.copy(deep=False)
+        daily_change.index = pd.to_datetime(daily_change.index, format='%Y%m%d')
+        return daily_change
+    return context.shared('daily_change_by_date', factory)
+
+
+def shared_monthly_change_by_date(context: AnalyzerContext) -> pd.DataFrame:
+    """
+    以日期为索引的MonthlyMetricAnalyzer.monthly_change
+    """
+    def factory():
+        monthly_change = context[MonthlyMetricAnalyzer].monthly_change.copy(deep=False)
+        monthly_change.index = pd.to_datetime(monthly_change.index, format='%Y%m%d').rename('date')
+        return monthly_change
+    return context.shared('monthly_change_by_date', factory)
+
+
 @Depend(BasicInfoAnalyzer)
 class ConfigSummaryAnalyzer(BaseAnalyzer):
     def _analyze(self, context: AnalyzerContext):
@@ -195,7 +385,7 @@ class DailyMetricAnalyzer(BaseAnalyzer):
         得出日收益率矩阵
         """
         # benchmark = context[BenchAnalyzer].benchmark.set_index('date')
-        benchmark = context[BenchAnalyzer].benchmark_with_base
+        benchmark = shared_benchmark_with_base(context)
         daily_change = benchmark.pct_change()
         daily_diff = benchmark.diff()
 
@@ -218,9 +408,7 @@ class DrawDownAnalyzer(BaseAnalyzer):
         计算回撤序列
         """
         # benchmark = context[BenchAnalyzer].benchmark.set_index('date')
-        benchmark = context[BenchAnalyzer].benchmark_with_base
-        for col in benchmark.columns:
-            benchmark[col] = calc_draw_down(benchmark[col].tolist())
+        benchmark = draw_down_frame(shared_benchmark_with_base(context))
 
         benchmark = bench_util.remove_net_value_base(benchmark)
         setattr(self, "draw_down", benchmark)
@@ -245,12 +433,10 @@ class DrawDownAnalyzer(BaseAnalyzer):
 class MonthlyMetricAnalyzer(BaseAnalyzer):
     @staticmethod
     def volatility(context):
-        benchmark = context[BenchAnalyzer].benchmark_with_base
+        benchmark = shared_benchmark_with_base(context)
         # benchmark['date'] = pd.to_datetime(benchmark['date'], format='%Y%m%d')
         # benchmark.set_index('date', inplace=True)
-        daily_returns = benchmark.pct_change()
-        daily_returns = bench_util.remove_net_value_base(daily_returns).fillna(0)
-        daily_returns.index = pd.to_datetime(daily_returns.index, format='%Y%m%d')
+        daily_returns = shared_daily_returns(context)
 
         # benchmark['date'] = pd.to_datetime(benchmark.index, format='%Y%m%d')
         # benchmark.set_index('date', inplace=True)
@@ -264,15 +450,10 @@ class MonthlyMetricAnalyzer(BaseAnalyzer):
         return monthly_volatility
 
     def _analyze(self, context: AnalyzerContext):
-        benchmark = context[BenchAnalyzer].benchmark
-        benchmark['date'] = pd.to_datetime(benchmark.index, format='%Y%m%d')
-        benchmark.set_index('date', inplace=True)
-        benchmark_monthly = benchmark.resample('M').ffill()
+        benchmark_monthly = shared_benchmark_by_date(context).resample('M').ffill()
         benchmark_monthly = benchmark_monthly.reset_index()
         benchmark_monthly['date'] = [x.strftime('%Y%m%d') for x in benchmark_monthly['date']]
-        benchmark = benchmark.reset_index()
-        benchmark['date'] = [x.strftime('%Y%m%d') for x in benchmark['date']]
-        benchmark.set_index('date', inplace=True)
+        benchmark = shared_benchmark(context)
 
         """
         新增日频数据第一行到月频截面，用日频数据最后一行替换月频数据最后一行时间
@@ -310,10 +491,8 @@ class WeeklyMetricAnalyzer(BaseAnalyzer):
     """
     @staticmethod
     def volatility(context):
-        benchmark = context[BenchAnalyzer].benchmark_with_base
-        daily_returns = benchmark.pct_change()
-        daily_returns: pd.DataFrame = bench_util.remove_net_value_base(daily_returns).fillna(0)
-        daily_returns.index = pd.to_datetime(daily_returns.index, format='%Y%m%d')
+        benchmark = shared_benchmark_with_base(context)
+        daily_returns = shared_daily_returns(context)
 
 
         weekly_volatility = daily_returns.resample('W').std()
@@ -325,15 +504,10 @@ class WeeklyMetricAnalyzer(BaseAnalyzer):
         return weekly_volatility
 
     def _analyze(self, context: AnalyzerContext):
-        benchmark = context[BenchAnalyzer].benchmark
-        benchmark['date'] = pd.to_datetime(benchmark.index, format='%Y%m%d')
-        benchmark.set_index('date', inplace=True)
-        benchmark_weekly = benchmark.resample('W').ffill()
+        benchmark_weekly = shared_benchmark_by_date(context).resample('W').ffill()
         benchmark_weekly = benchmark_weekly.reset_index()
         benchmark_weekly['date'] = [x.strftime('%Y%m%d') for x in benchmark_weekly['date']]
-        benchmark = benchmark.reset_index()
-        benchmark['date'] = [x.strftime('%Y%m%d') for x in benchmark['date']]
-        benchmark.set_index('date', inplace=True)
+        benchmark = shared_benchmark(context)
 
         """
         新增日频数据第一行到截面，用日频数据最后一行替换数据最后一行时间
@@ -368,8 +542,7 @@ class WeeklyMetricAnalyzer(BaseAnalyzer):
 class YearlyMetricAnalyzer(BaseAnalyzer):
     @staticmethod
     def volatility(context):
-        daily_returns = context[DailyMetricAnalyzer].daily_change
-        daily_returns.index = pd.to_datetime(daily_returns.index, format='%Y%m%d')
+        daily_returns = shared_daily_change_by_date(context)
 
         yearly_volatility = daily_returns.resample('BA').std()
         yearly_volatility['date'] = yearly_volatility.index
@@ -380,8 +553,8 @@ class YearlyMetricAnalyzer(BaseAnalyzer):
         """
         对于净值列表进行年度采样，年末采样
         """
-        benchmark = context[BenchAnalyzer].benchmark
-        bench_index_yearly = copy.deepcopy(benchmark)
+        benchmark = shared_benchmark(context)
+        bench_index_yearly = benchmark.copy(deep=False)
 
         bench_index_yearly.index = pd.to_datetime(bench_index_yearly.index) #, format='%Y%m%d')
         # bench_index_yearly.set_index('date', inplace=True)
@@ -421,26 +594,14 @@ class YearlyDrawDownAnalyzer(BaseAnalyzer):
 
     @classmethod
     def calc_draw_down(cls, context):
-        benchmark = context[BenchAnalyzer].benchmark
+        benchmark = shared_benchmark(context)
         # benchmark['date'] = pd.to_datetime(benchmark['start_date'], format='%Y%m%d')
-        benchmark['year'] = benchmark.index.map(lambda x: x[:4])
         yearly_change: pd.DataFrame = context[YearlyMetricAnalyzer].yearly_change # .reset_index()
 
         full_list = context[BenchAnalyzer].full_list
 
-        def group_processor(df):
-            result_dict = {
-                'date': [df['year'].unique()[0]]
-            }
-            for name in full_list:
-                max_draw_down = min(calc_draw_down(df[name].tolist(), base=1))
-                result_dict[name] = [max_draw_down]
-            return pd.DataFrame(result_dict)
-
-        draw_down_result = benchmark.groupby('year').apply(group_processor).reset_index(drop=True)
-        draw_down_result['date'] = yearly_change.index
-
-        result = draw_down_result.set_index('date')
+        result = grouped_max_draw_down_frame(benchmark[full_list], benchmark.index.str[:4], base=1)
+        result.index = pd.Index(yearly_change.index, name='date')
         return result
 
     def _analyze(self, context: AnalyzerContext):
@@ -454,27 +615,14 @@ class MonthlyDrawDownAnalyzer(BaseAnalyzer):
     """
     @classmethod
     def calc_draw_down(cls, context):
-        benchmark = context[BenchAnalyzer].benchmark
+        benchmark = shared_benchmark(context)
         # benchmark['date'] = pd.to_datetime(benchmark['start_date'], format='%Y%m%d')
-
-        benchmark['ym'] = benchmark.index.map(lambda x: x[:6])
         monthly_change: pd.DataFrame = context[MonthlyMetricAnalyzer].monthly_change
 
         full_list = context[BenchAnalyzer].full_list
 
-        def group_processor(df):
-            result_dict = {
-                'date': [df['ym'].unique()[0]]
-            }
-            for name in full_list:
-                max_draw_down = min(calc_draw_down(df[name].tolist(), base=1))
-                result_dict[name] = [max_draw_down]
-            return pd.DataFrame(result_dict)
-
-        draw_down_result = benchmark.groupby('ym').apply(group_processor).reset_index(drop=True)
-        draw_down_result['date'] = monthly_change.index
-
-        result = draw_down_result.set_index('date')
+        result = grouped_max_draw_down_frame(benchmark[full_list], benchmark.index.str[:6], base=1)
+        result.index = pd.Index(monthly_change.index, name='date')
         return result
 
     def _analyze(self, context: AnalyzerContext):
@@ -482,10 +630,9 @@ class MonthlyDrawDownAnalyzer(BaseAnalyzer):
 
 
 
-@Depend(BenchAnalyzer, YearlyDrawDownAnalyzer, MonthlyMetricAnalyzer, YearlyMetricAnalyzer)
+@Depend(BasicInfoAnalyzer, BenchAnalyzer, YearlyDrawDownAnalyzer, MonthlyMetricAnalyzer, YearlyMetricAnalyzer)
 class YearlyExtendedMetricAnalyzer(BaseAnalyzer):
     def calmar(self, context, draw_down_index):
-        benchmark = context[BenchAnalyzer].benchmark
         # first_dt = benchmark.head().index.tolist()[0]
         benchmark_yearly = context[YearlyMetricAnalyzer].benchmark_yearly.reset_index()
         # risk_free_rate = context[BasicInfoAnalyzer].risk_free_rate
@@ -512,16 +659,14 @@ class YearlyExtendedMetricAnalyzer(BaseAnalyzer):
         return result
 
     def monthly_win_ratio(self, context):
-        monthly_change = context[MonthlyMetricAnalyzer].monthly_change
-        monthly_change['date'] = pd.to_datetime(monthly_change.index, format='%Y%m%d')
-        monthly_change.set_index('date', inplace=True)
+        monthly_change = shared_monthly_change_by_date(context)
         count_df = monthly_change.fillna(1).notna()
         win_ratio = (monthly_change > 0).resample('A').sum() / count_df.resample('A').sum()
         win_ratio.index = win_ratio.index.map(lambda x: x.strftime("%Y%m%d"))
         return win_ratio
 
     def tracking_error(self, context):
-        daily_change = context[DailyMetricAnalyzer].daily_change
+        daily_change = shared_daily_change_by_date(context)
         strategy_name = context[BasicInfoAnalyzer].strategy_name
         bench_list = context[BenchAnalyzer].all_bench_list
         tracking_difference = pd.DataFrame()
@@ -610,7 +755,7 @@ class YearlyExtendedMetricAnalyzer(BaseAnalyzer):
         setattr(self, 'summary', self.reconstruct(context))
 
 
-@Depend(MonthlyDrawDownAnalyzer, MonthlyMetricAnalyzer)
+@Depend(BasicInfoAnalyzer, BenchAnalyzer, MonthlyDrawDownAnalyzer, MonthlyMetricAnalyzer)
 class MonthlyAggregatedMetricAnalyzer(BaseAnalyzer):
     def monthly_aggregate(self, context):
 
@@ -623,7 +768,7 @@ class MonthlyAggregatedMetricAnalyzer(BaseAnalyzer):
         monthly_draw_down = context[MonthlyDrawDownAnalyzer].monthly_draw_down.reset_index()
         setattr(self, 'monthly_agg_draw_down', monthly_agg(monthly_draw_down))
 
-        monthly_change = context[MonthlyMetricAnalyzer].monthly_change.reset_index()
+        monthly_change = shared_monthly_change_by_date(context).reset_index()
         # monthly_change['month'] = monthly_change['date'].map(lambda x: f"{int(x[4:6])}月")
         monthly_change['month'] = monthly_change['date'].map(lambda x: f"{x.month}月")
         monthly_change = monthly_change.drop(columns=['date'])
@@ -1031,7 +1176,7 @@ class MetricSummaryAnalyzer(BaseAnalyzer):
         self.__bench = bench_ins
 
     def _analyze(self, context: AnalyzerContext):
-        benchmark = context[BenchAnalyzer].benchmark #.set_index('date')
+        benchmark = shared_benchmark(context) #.set_index('date')
         total_list = benchmark.columns
         # totalList = [self.__strategyName] + self.__bench.getAllBenchList() + self.__bench.getAllHedgeList()
         strategy_metric = pd.DataFrame()
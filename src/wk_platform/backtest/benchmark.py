@@ -11,17 +11,18 @@ from __future__ import annotations
 import datetime
 import math
 import pathlib
-from functools import partial
+import threading
 
 import numpy as np
 import pandas as pd
 
 from wk_platform.math import stats
+from wk_platform.stratanalyzer.drawdown_kernel import max_draw_down
 from wk_platform.config import StrategyConfiguration, PriceType, CalendarType
 from wk_data import BenchDataSource
 import wk_platform.backtest.util as bench_util
 import wk_data
-from wk_platform.util.data import align_calendar
+from wk_data.data.calendar_service import TradeCalendarService
 
 INDEX_NAME_MAPPING = {
     "000001.SH": "上证综指",
@@ -61,15 +62,138 @@ def tmp_user_benchmark(begin_date, end_date=None):
     return data
 
 
+INDEX_LIST = [
+    "000001.SH", "000016.SH", "000300.SH", "399905.SZ",
+    "000852.SH", "399006.SZ", "000906.SH", "932000.CSI"
+]
+
+
+def prepare_index_bench(index_list, begin_date, end_date) -> pd.DataFrame:
+    """
+    构造指数的benchmark，各指数以区间内首个交易日的开盘价归一化
+
+    Returns
+    ==================
+    以trade_dt为列、各指数代码为列名的净值表
+    """
+    # 指数行情和交易日历由进程内的缓存服务提供，只在首次使用或数据更新后从磁盘载入
+    service = TradeCalendarService()
+    service.prepare_index(index_list)
+    calendar = service.trade_calendar(begin_date, end_date)
+    bench_combine = None
+    for symbol in index_list:
+
+        # data = bench_source.get_daily(symbol, self.__beginDate, self.__endDate)
+        data = service.index_bars(symbol, begin_date, end_date)
+        if data.empty:
+            bench_combine_temp = pd.DataFrame({
+                "trade_dt": calendar,
+                "close": [1] * len(calendar)
+            })
+            open_price = 1
+        else:
+            # 读取时间列和Close列
+            bench_combine_temp = data[["trade_dt", "close"]].copy()
+            open_price = data.head(1)['open'].tolist()[0]
+            if np.isnan(open_price):
+                bench_combine_temp = data[["trade_dt", "close"]].copy()
+                bench_combine_temp = bench_combine_temp.bfill()
+                open_price = bench_combine_temp.head(1)['close'].tolist()[0]
+
+        bench_combine_temp['close'] = bench_combine_temp['close'] / open_price
+        bench_combine_temp = bench_combine_temp.rename(columns={"close": symbol})
+        if bench_combine is None:
+            bench_combine = bench_combine_temp.reset_index(drop=True)
+        else:
+            bench_combine = bench_combine.merge(bench_combine_temp, on='trade_dt', how='outer')
+
+    # 对于超出指数时间范围的点数，按照刚上市时的点数填充，目前假定不出现此种情况
+    # self.__benchCombine = self.__benchCombine.fillna(method="bfill")
+    return bench_combine.bfill()
+
+
+class BenchmarkCache:
+    """
+    批量回测共享的基准缓存
+
+    同一批回测中各策略的指数净值曲线相同，指数列的收益率、回撤和夏普比率也只取决于回测区间和净值的交易日，
+    因此按 (回测区间, 交易日历, 价格类型) 缓存指数净值，按净值的交易日和无风险利率缓存指数指标，
+    每次回测只需计算策略列和对冲列。使用自定义基准的回测不使用缓存
+
+    用法::
+
+        cache = BenchmarkCache()
+        output = StrategyOutput(strategy, begin_date, end_date, config=config, bench_cache=cache)
+    """
+
+    def __init__(self):
+        self.__index_bench: dict[tuple, pd.DataFrame] = {}
+        self.__index_metrics: dict[tuple, dict] = {}
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def bench_key(begin_date, end_date, config: StrategyConfiguration):
+        return begin_date, end_date, config.calendar, config.price_type
+
+    def __get(self, store, key, factory):
+        with self.__lock:
+            try:
+                return store[key]
+            except KeyError:
+                pass
+        value = factory()
+        with self.__lock:
+            return store.setdefault(key, value)
+
+    def index_bench(self, begin_date, end_date, config: StrategyConfiguration, index_list=INDEX_LIST) -> pd.DataFrame:
+        """
+        指数净值表，返回的对象在各回测间共享，不得原地修改
+        """
+        assert config.calendar == CalendarType.A_SHARE_MARKET
+        key = self.bench_key(begin_date, end_date, config) + (tuple(index_list),)
+        return self.__get(self.__index_bench, key,
+                          lambda: prepare_index_bench(index_list, begin_date, end_date))
+
+    def prefill(self, begin_dates, end_date, config: StrategyConfiguration, index_list=INDEX_LIST):
+        """
+        在批量回测开始前载入各回测区间的指数净值，fork出的子进程直接继承，不再各自重复计算
+
+        Parameters
+        ==================
+        begin_dates: Iterable[str | None]
+            各回测的起始日期，None被忽略
+        """
+        if config.calendar != CalendarType.A_SHARE_MARKET:
+            return
+        for begin_date in dict.fromkeys(begin_dates):
+            if begin_date is not None:
+                self.index_bench(begin_date, end_date, config, index_list)
+
+    def index_metrics(self, key, factory) -> dict:
+        """
+        指数列的各项指标，key需包含回测区间、价格类型、净值的交易日以及无风险利率
+        """
+        return self.__get(self.__index_metrics, key, factory)
+
+    def clear(self):
+        with self.__lock:
+            self.__index_bench.clear()
+            self.__index_metrics.clear()
 
 
 class BenchmarkAnalyzer:
     
-    def __init__(self, begin_date, end_date, user_benchmark=None, config=StrategyConfiguration()):
-        
+    def __init__(self, begin_date, end_date, user_benchmark=None, config=StrategyConfiguration(), cache=None):
+        """
+        Parameters
+        ==================
+        cache: BenchmarkCache | None
+            批量回测共享的基准缓存，为None时不使用缓存
+        """
         self.__beginDate = begin_date
         self.__endDate = end_date
         self.__config = config
+        self.__cache: BenchmarkCache | None = cache
         
         self.__benchIndex = pd.DataFrame()
         """
@@ -77,10 +201,7 @@ class BenchmarkAnalyzer:
         """
         self.__benchCombine: pd.DataFrame | None = None
 
-        self.__indexList = [
-            "000001.SH", "000016.SH", "000300.SH", "399905.SZ",
-            "000852.SH", "399006.SZ", "000906.SH", "932000.CSI"
-        ]
+        self.__indexList = list(INDEX_LIST)
         # self.__indexList = ["000300.SH", "399905.SZ", "000906.SH", "000016.SH",  "000852.SH", "399006.SZ"]
 
         self.__dictIndexList = INDEX_NAME_MAPPING
@@ -198,19 +319,20 @@ class BenchmarkAnalyzer:
     def getSharpeRatio(self):
         return self.__sharpeRatio
 
-    def calculateReturn(self, strategyName):
+    def __total_list(self, strategyName):
+        # 新增用户自定义基准, 20171228
+        return [strategyName] + self.__name_list + self.__user_bench_name_list + self.__hedge_list + self.__user_bench_hedge_list
+
+    def calculateReturn(self, strategyName, symbols=None):
         """
-        计算收益率和年化收益率
+        计算收益率和年化收益率，symbols为None时计算策略、全部基准及对冲序列
         """
         # 计算天数间隔
         daysTotal = self.getDaysBetween(pd.to_datetime(self.__benchStandard.index[0]), pd.to_datetime(self.__benchStandard.index[-1]))
         
        
         #totalList = [strategyName] + self.__nameList + self.__hedgeList
-        """
-        新增用户自定义基准, 20171228
-        """
-        totalList = [strategyName] + self.__name_list + self.__user_bench_name_list + self.__hedge_list + self.__user_bench_hedge_list
+        totalList = self.__total_list(strategyName) if symbols is None else symbols
         #for symbol in self.__nameList:
         for symbol in totalList:
             # self.__cumulativeReturn[symbol] = (self.__benchStandard[symbol].iloc[-1] - self.__benchStandard[symbol].iloc[0]) * 1.0 / self.__benchStandard[symbol].iloc[0]
@@ -223,44 +345,27 @@ class BenchmarkAnalyzer:
             """
             self.__annualReturn[symbol] = math.pow(self.__cumulativeReturn[symbol] + 1, self.__tradeDaysOneYear * 1.0 / daysTotal) - 1
 
-    def calculateMaxdrawdown(self,strategyName):
+    def calculateMaxdrawdown(self, strategyName, symbols=None):
         """
-        计算最大回撤相关信息
+        计算最大回撤相关信息，symbols为None时计算策略、全部基准及对冲序列
         """
      
         #totalList = [strategyName] + self.__nameList + self.__hedgeList
-        """
-        新增用户自定义基准,20171228
-        """
-        totalList = [strategyName] + self.__name_list + self.__user_bench_name_list + self.__hedge_list + self.__user_bench_hedge_list
-                    
-        for symbol in totalList:
-            highValue = 1
-            highTime = 0
-            lowTime = 0
-            maxdd = 0
-
-            maxHighTime = 0
-            # maxHighValue = 0
-            # maxLowValue = 0
-
-            for index, row in self.__benchStandard[[symbol]].iterrows():
-                #print index, row['Close']
-                if row[symbol] > highValue:
-                    highValue = row[symbol]
-                    highTime = index
-                else:
-                    drawdownRet = (highValue - row[symbol]) / highValue
-                    
-                    if drawdownRet > maxdd:
-                        maxdd = drawdownRet
-                        lowTime = index
-                        # maxLowValue = row[symbol]
-                        #
-                        # maxHighValue = highValue
-                        maxHighTime = highTime
-
-            
+        totalList = self.__total_list(strategyName) if symbols is None else symbols
+
+        # 所有序列一次完成计算，初始高点为1，未发生回撤时回撤为0，高点及低点时间记为0
+        dates = self.__benchStandard.index
+        values = np.column_stack([self.__benchStandard[symbol].to_numpy(dtype=np.float64) for symbol in totalList])
+        summary = max_draw_down(values, base=1)
+        for j, symbol in enumerate(totalList):
+            if summary.trough[j] >= 0:
+                maxdd = summary.max_draw_down[j]
+                lowTime = dates[summary.trough[j]]
+            else:
+                maxdd = 0
+                lowTime = 0
+            maxHighTime = dates[summary.peak[j]] if summary.peak[j] >= 0 else 0
+
             self.__maxdrawdown[symbol] = maxdd
 
             # 时间间隔需要-1
@@ -269,13 +374,12 @@ class BenchmarkAnalyzer:
             self.__maxdrawdownLow[symbol] = lowTime
                         
 
-    def calculateSharpeRatio(self, strategyName, riskFreeRate=0.05):
+    def calculateSharpeRatio(self, strategyName, riskFreeRate=0.05, symbols=None):
         """
-        计算波动率和sharpe比率,无风险利率默认值为0.05
+        计算波动率和sharpe比率,无风险利率默认值为0.05，symbols为None时计算策略、全部基准及对冲序列
         """
 
-        # 新增用户自定义基准,20171228
-        totalList = [strategyName] + self.__name_list + self.__user_bench_name_list + self.__hedge_list + self.__user_bench_hedge_list
+        totalList = self.__total_list(strategyName) if symbols is None else symbols
 
         for symbol in totalList:
             net_value = self.__benchStandard[symbol].tolist()
@@ -312,40 +416,12 @@ class BenchmarkAnalyzer:
         构造指数的benchmark
         """
         # bench_source = BenchDataSource()
-        for symbol in self.__indexList:
-
-            # data = bench_source.get_daily(symbol, self.__beginDate, self.__endDate)
-            data = wk_data.get('index_market', instrument=symbol, begin_date=self.__beginDate, end_date=self.__endDate)
-            calendar = wk_data.get('trade_calendar', begin_date=self.__beginDate, end_date=self.__endDate,
-                                       calendar=self.__config.calendar)
-            align_func = partial(align_calendar, calendar=calendar)
-
-            data = align_func(data)
-            if data.empty:
-                bench_combine_temp = pd.DataFrame({
-                    "trade_dt": calendar,
-                    "close": [1] * len(calendar)
-                })
-                open_price = 1
-            else:
-                # 读取时间列和Close列
-                bench_combine_temp = data[["trade_dt", "close"]].copy()
-                open_price = data.head(1)['open'].tolist()[0]
-                if np.isnan(open_price):
-                    bench_combine_temp = data[["trade_dt", "close"]].copy()
-                    bench_combine_temp = bench_combine_temp.bfill()
-                    open_price = bench_combine_temp.head(1)['close'].tolist()[0]
-
-            bench_combine_temp['close'] = bench_combine_temp['close'] / open_price
-            bench_combine_temp = bench_combine_temp.rename(columns={"close": symbol})
-            if self.__benchCombine is None:
-                self.__benchCombine = bench_combine_temp.reset_index(drop=True)
-            else:
-                self.__benchCombine = self.__benchCombine.merge(bench_combine_temp, on='trade_dt', how='outer')
-
-        # 对于超出指数时间范围的点数，按照刚上市时的点数填充，目前假定不出现此种情况
-        # self.__benchCombine = self.__benchCombine.fillna(method="bfill")
-        self.__benchCombine = self.__benchCombine.bfill()
+        assert self.__config.calendar == CalendarType.A_SHARE_MARKET
+        if self.__cache is not None:
+            self.__benchCombine = self.__cache.index_bench(self.__beginDate, self.__endDate, self.__config,
+                                                           self.__indexList)
+        else:
+            self.__benchCombine = prepare_index_bench(self.__indexList, self.__beginDate, self.__endDate)
 
     def prepare_benchmark(self, strategy_equity, strategy_name='myStrategy'):
         """
@@ -431,10 +507,44 @@ class BenchmarkAnalyzer:
                 exceed_return_ratio[hedgeIndex] = bench_change[strategy_name] - bench_change[index] + 1
                 self.__benchStandard[hedgeIndex] = exceed_return_ratio[hedgeIndex].cumprod()
 
+    def __metric_dicts(self):
+        return [
+            self.__cumulativeReturn, self.__annualReturn,
+            self.__maxdrawdown, self.__maxdrawdownTime, self.__maxdrawdownHigh, self.__maxdrawdownLow,
+            self.__volatility, self.__sharpeRatio
+        ]
+
+    def __calculate(self, strategyName, riskFreeRate, symbols):
+        self.calculateReturn(strategyName, symbols)
+        self.calculateMaxdrawdown(strategyName, symbols)
+        self.calculateSharpeRatio(strategyName, riskFreeRate, symbols)
+
+    def __index_metrics(self, strategyName, riskFreeRate):
+        """
+        计算指数列的指标，用于写入批量回测的缓存
+        """
+        self.__calculate(strategyName, riskFreeRate, self.__name_list)
+        return [{symbol: d[symbol] for symbol in self.__name_list} for d in self.__metric_dicts()]
+
     def process(self, strategyName, riskFreeRate):
-        self.calculateReturn(strategyName)
-        self.calculateMaxdrawdown(strategyName)
-        self.calculateSharpeRatio(strategyName, riskFreeRate)
+        total_list = self.__total_list(strategyName)
+        if self.__cache is None or self.__user_bench_name_list:
+            self.__calculate(strategyName, riskFreeRate, total_list)
+            return
+
+        # 指数列的指标只取决于净值的交易日，批量回测中直接使用缓存结果
+        key = self.__cache.bench_key(self.__beginDate, self.__endDate, self.__config) + (
+            riskFreeRate, tuple(self.__benchStandard.index)
+        )
+        index_metrics = self.__cache.index_metrics(key, lambda: self.__index_metrics(strategyName, riskFreeRate))
+        own_list = [symbol for symbol in total_list if symbol not in self.__name_list]
+        self.__calculate(strategyName, riskFreeRate, own_list)
+
+        # 按原有的顺序合并指数列与策略、对冲列的结果
+        for d, cached in zip(self.__metric_dicts(), index_metrics):
+            merged = {symbol: cached[symbol] if symbol in cached else d[symbol] for symbol in total_list}
+            d.clear()
+            d.update(merged)
 
     def getBenchCombine(self):
         return self.__benchCombine
@@ -1,12 +1,131 @@
 from __future__ import annotations
 
+import importlib
+import json
 import pathlib
 import datetime
 import pytz
 import pandas as pd
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import zipfile
 
+MANIFEST_NAME = 'manifest.json'
+BINARY_FORMATS = ('parquet', 'feather')
+
+
+def _flatten_frame(df: pd.DataFrame):
+    """
+    将索引转换为普通列，返回转换后的DataFrame及还原索引所需的信息
+    """
+    if isinstance(df.index, pd.RangeIndex) and df.index.start == 0 and df.index.step == 1 and df.index.name is None:
+        flat = df.reset_index(drop=True)
+        index_columns = []
+    else:
+        flat = df.reset_index()
+        index_columns = [str(name) for name in flat.columns[:df.index.nlevels]]
+    spec = {
+        'index': index_columns,
+        'index_names': list(df.index.names) if index_columns else [],
+        'columns_name': df.columns.name,
+    }
+    return flat, spec
+
+
+def _restore_frame(flat: pd.DataFrame, spec) -> pd.DataFrame:
+    if spec['index']:
+        flat = flat.set_index(spec['index'])
+        flat.index.names = spec['index_names']
+    flat.columns.name = spec['columns_name']
+    return flat
+
+
+def _write_frame(df: pd.DataFrame, path: pathlib.Path, fmt):
+    """
+    按fmt格式写入单个DataFrame，列名不是字符串或列中混有多种类型（如数值与'--'）时改用pickle格式
+
+    Returns
+    ==================
+    文件信息，写入清单
+    """
+    flat, spec = _flatten_frame(df)
+    target = path.with_suffix('.' + fmt)
+    try:
+        if not all(isinstance(c, str) for c in flat.columns):
+            raise TypeError('non-string column names')
+        if fmt == 'parquet':
+            flat.to_parquet(target, index=False)
+        else:
+            flat.to_feather(target)
+    except (ImportError, ValueError, TypeError, NotImplementedError):
+        target.unlink(missing_ok=True)
+        target = path.with_suffix('.pkl')
+        df.to_pickle(target)
+        return {'file': target.name, 'format': 'pickle'}
+    return {'file': target.name, 'format': fmt, **spec}
+
+
+def _read_frame(directory: pathlib.Path, entry) -> pd.DataFrame:
+    """
+    读取单个DataFrame，parquet及feather文件使用内存映射读取
+    """
+    path = directory / entry['file']
+    fmt = entry['format']
+    if fmt == 'pickle':
+        return pd.read_pickle(path)
+    if fmt == 'parquet':
+        flat = pd.read_parquet(path, memory_map=True)
+    else:
+        from pyarrow import feather
+        flat = feather.read_table(path, memory_map=True).to_pandas()
+    return _restore_frame(flat, entry)
+
+
+def _read_metric(directory: pathlib.Path, metric):
+    if metric['kind'] == 'frame':
+        return _read_frame(directory, metric['files'][0])
+    return OrderedDict((entry['name'], _read_frame(directory, entry)) for entry in metric['files'])
+
+
+def _func_path(func):
+    qualname = getattr(func, '__qualname__', '')
+    if func is None or '<' in qualname:
+        return None
+    return f"{func.__module__}:{qualname}"
+
+
+def _resolve_func(path):
+    if path is None:
+        return None
+    module_name, qualname = path.split(':')
+    try:
+        obj = importlib.import_module(module_name)
+        for name in qualname.split('.'):
+            obj = getattr(obj, name)
+    except (ImportError, AttributeError):
+        return None
+    return obj
+
+
+class _LazyMetric:
+    """
+    延迟计算的指标，首次访问时调用func并使用formatter处理结果
+
+    func通常是引用了策略、券商及分析器的闭包，计算完成后即释放，
+    全部指标计算后回测结果不再持有这些对象
+    """
+    __slots__ = ('func', 'formatter')
+
+    def __init__(self, func, formatter):
+        self.func = func
+        self.formatter = formatter
+
+    def evaluate(self):
+        value = self.formatter(self.func())
+        self.func = self.formatter = None
+        return value
+
 
 class BackTestResult:
     def __init__(self):
@@ -15,6 +134,13 @@ class BackTestResult:
         self.__results = OrderedDict()
         self.__plot_func = {}
 
+    def __add(self, key, value, plot_func):
+        if key in self.__results:
+            raise ValueError(f"`{key}` existed")
+        self.__results[key] = value
+        if plot_func:
+            self.__plot_func[key] = plot_func
+
     def add_metric(self, key: str, data: pd.DataFrame | OrderedDict, *, plot_func=None, formatter=lambda x: x):
         """
         Parameters
@@ -28,24 +154,61 @@ class BackTestResult:
         formatter: Callable
             格式化输出的后处理函数
         """
-        try:
-            df = self.__results[key]
+        if key in self.__results:
             raise ValueError(f"`{key}` existed")
-        except KeyError:
-            self.__results[key] = formatter(data)
-            if plot_func:
-                self.__plot_func[key] = plot_func
+        self.__add(key, formatter(data), plot_func)
+
+    def add_lazy_metric(self, key: str, func, *, plot_func=None, formatter=lambda x: x):
+        """
+        添加延迟计算的指标，首次通过 `result[key]` 访问时才调用func计算，之后直接返回缓存的结果；
+        `items`、`to_excel` 以及序列化时计算全部指标
+
+        Parameters
+        --------
+        key : str
+            指标名称
+        func : Callable[[], DataFrame | OrderedDict]
+            计算指标的无参函数
+        plot_func: Callable
+            绘图函数
+        formatter: Callable
+            格式化输出的后处理函数
+        """
+        self.__add(key, _LazyMetric(func, formatter), plot_func)
 
     def __getitem__(self, k):
-        return self.__results[k]
+        v = self.__results[k]
+        if isinstance(v, _LazyMetric):
+            v = self.__results[k] = v.evaluate()
+        return v
+
+    def is_materialized(self, k) -> bool:
+        """
+        指标是否已经计算
+        """
+        return not isinstance(self.__results[k], _LazyMetric)
+
+    def materialize(self):
+        """
+        计算全部尚未计算的指标
+        """
+        for k in list(self.__results.keys()):
+            _ = self[k]
+        return self
+
+    def __getstate__(self):
+        # 延迟计算的函数引用了策略对象，序列化前先计算全部指标
+        self.materialize()
+        return self.__dict__
 
     def items(self):
-        return self.__results.items()
+        return self.materialize().__results.items()
 
     def keys(self):
         return self.__results.keys()
 
     def to_excel(self, file_path):
+        self.materialize()
         with pd.ExcelWriter(file_path) as writer:
             for k, v in self.__results.items():
                 if isinstance(v, pd.DataFrame):
@@ -59,12 +222,68 @@ class BackTestResult:
 
     def plot(self, key: str, **kwargs):
         plot_func = self.__plot_func[key]
-        return plot_func(self.__results[key], **kwargs).render_notebook()
+        return plot_func(self[key], **kwargs).render_notebook()
+
+    def to_binary(self, directory, fmt='parquet'):
+        """
+        导出为二进制格式，每个指标一个文件，并写入描述各指标的清单文件manifest.json，
+        通过 `BackTestResult.load` 读取
+
+        Parameters
+        --------
+        directory: str | pathlib.Path
+            导出目录，不存在时自动创建
+        fmt: str
+            文件格式，parquet或feather，无法用该格式表示的指标使用pickle格式
+        """
+        if fmt not in BINARY_FORMATS:
+            raise ValueError(f"Unsupported format `{fmt}`")
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        metrics = []
+        for i, (k, v) in enumerate(self.items()):
+            metric = {'key': k, 'plot': _func_path(self.__plot_func.get(k))}
+            if isinstance(v, pd.DataFrame):
+                metric['kind'] = 'frame'
+                metric['files'] = [_write_frame(v, directory / f"{i:03d}", fmt)]
+            elif isinstance(v, OrderedDict):
+                metric['kind'] = 'dict'
+                metric['files'] = [
+                    {'name': name, **_write_frame(df, directory / f"{i:03d}_{j:03d}", fmt)}
+                    for j, (name, df) in enumerate(v.items())
+                ]
+            else:
+                continue
+            metrics.append(metric)
+        with open(directory / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+            json.dump({'format': fmt, 'metrics': metrics}, f, ensure_ascii=False, indent=1)
+        return directory
+
+    def to_parquet(self, directory):
+        return self.to_binary(directory, 'parquet')
+
+    def to_feather(self, directory):
+        return self.to_binary(directory, 'feather')
+
+    @classmethod
+    def load(cls, directory) -> BackTestResult:
+        """
+        读取 `to_parquet` 或 `to_feather` 导出的结果，各指标在首次访问时才读取文件
+        """
+        directory = pathlib.Path(directory)
+        with open(directory / MANIFEST_NAME, encoding='utf-8') as f:
+            manifest = json.load(f)
+        result = cls()
+        for metric in manifest['metrics']:
+            result.add_lazy_metric(metric['key'], partial(_read_metric, directory, metric),
+                                   plot_func=_resolve_func(metric.get('plot')))
+        return result
 
 
 class BackTestResultSet:
     def __init__(self):
         self.__results = {}
+        self.__errors = {}
 
     def __getitem__(self, k):
         return self.__results[k]
@@ -78,6 +297,73 @@ class BackTestResultSet:
     def keys(self):
         return self.__results.keys()
 
+    def add_error(self, key, msg: str):
+        """
+        记录执行失败的回测及其异常信息
+        """
+        self.__errors[key] = msg
+
+    @property
+    def errors(self) -> dict:
+        return self.__errors
+
+    def to_binary(self, directory, fmt='parquet', max_workers=None):
+        """
+        导出为二进制格式，每个回测结果一个子目录，使用线程池并行写入；
+        目录下的清单文件记录各结果的子目录以及执行失败的回测
+
+        各结果的指标计算共享基准缓存和分析器状态，先在当前线程中依次计算全部指标，线程池只负责写入文件
+
+        Parameters
+        --------
+        directory: str | pathlib.Path
+            导出目录，不存在时自动创建
+        fmt: str
+            文件格式，parquet或feather
+        max_workers: int | None
+            写入线程数，为None时使用ThreadPoolExecutor的默认值
+        """
+        if fmt not in BINARY_FORMATS:
+            raise ValueError(f"Unsupported format `{fmt}`")
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        entries = [(k, f"{i:04d}") for i, k in enumerate(self.__results.keys())]
+        for result in self.__results.values():
+            result.materialize()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.__results[k].to_binary, directory / sub_dir, fmt) for k, sub_dir in entries]
+            for future in futures:
+                future.result()
+        manifest = {
+            'format': fmt,
+            'results': [{'key': k, 'directory': sub_dir} for k, sub_dir in entries],
+            'errors': self.__errors,
+        }
+        with open(directory / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        return directory
+
+    def to_parquet(self, directory, max_workers=None):
+        return self.to_binary(directory, 'parquet', max_workers)
+
+    def to_feather(self, directory, max_workers=None):
+        return self.to_binary(directory, 'feather', max_workers)
+
+    @classmethod
+    def load(cls, directory) -> BackTestResultSet:
+        """
+        读取 `to_parquet` 或 `to_feather` 导出的结果集，各回测结果的指标在首次访问时才读取
+        """
+        directory = pathlib.Path(directory)
+        with open(directory / MANIFEST_NAME, encoding='utf-8') as f:
+            manifest = json.load(f)
+        result_set = cls()
+        for entry in manifest['results']:
+            result_set[entry['key']] = BackTestResult.load(directory / entry['directory'])
+        for k, msg in manifest['errors'].items():
+            result_set.add_error(k, msg)
+        return result_set
+
     def to_excel(self, directory, time_tag=False, compress=False):
         if not isinstance(directory, pathlib.Path):
             directory = pathlib.Path(directory)
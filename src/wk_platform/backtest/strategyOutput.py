@@ -11,6 +11,7 @@ comment:
 
 import math
 import copy
+from functools import partial
 import pandas as pd
 import pathlib
 
@@ -24,7 +25,8 @@ from wk_platform.backtest.analyzer import *
 from wk_platform.strategy.strategy import BaseStrategy
 from wk_platform.broker.commission import TradePercentage
 from wk_platform.broker.commission import TradePercentageTaxFee
-from wk_platform.config import StrategyConfiguration
+from wk_platform.config import StrategyConfiguration, MetricGroup
+from wk_platform.util.profiler import profiled, current_profiler, PROFILE_SHEET_NAME
 from wk_analyzer.plot.backtest import plot_net_value, plot_drawback
 
 
@@ -88,9 +90,11 @@ class StrategyOutput:
     增加参数strategyName,默认参数为myStrategy
     """
     def __init__(self, strategy: BaseStrategy, begin_date, end_date, strategy_name='myStrategy',
-                 config=StrategyConfiguration(), user_benchmark=None):
+                 config=StrategyConfiguration(), user_benchmark=None, bench_cache=None):
         """
         注册策略和相关参数
+
+        bench_cache为批量回测共享的benchmark.BenchmarkCache，指数净值和指数指标在同一批回测中只计算一次
         """
         if user_benchmark is None:
             user_benchmark = pd.DataFrame()
@@ -135,7 +139,7 @@ class StrategyOutput:
         添加对benchmark的分析
         """
         self.__bench = benchmark.BenchmarkAnalyzer(self.__begin_date, self.__end_date, self.__user_benchmark,
-                                                   config=strategy.config)
+                                                   config=strategy.config, cache=bench_cache)
 
     def pre_process(self):
         """
@@ -150,6 +154,15 @@ class StrategyOutput:
         self.__strategy.attachAnalyzerEx(self.__strategy_custom_tracker, 'custom_analyzer')
 
 
+    def extend(self, end_date, bench_cache=None):
+        """
+        从状态快照恢复后延长回测区间，按新的结束日期重新创建基准分析
+        """
+        self.__end_date = end_date
+        self.__bench = benchmark.BenchmarkAnalyzer(self.__begin_date, self.__end_date, self.__user_benchmark,
+                                                   config=self.__strategy.config, cache=bench_cache)
+
+    @profiled('bench_process')
     def bench_process(self):
         """
         benchmark指标的分析处理
@@ -174,36 +187,34 @@ class StrategyOutput:
 
 
 
-    def post_process(self):
+    def __analyze(self, *targets) -> AnalyzerContext:
         """
-        策略运行完成后，完成对回测报告的输出
+        计算targets及其依赖中尚未完成的算子
         """
+        pending = [analyzer for analyzer in select_analyzers(self.__analyzers, targets)
+                   if not self.__context.finished(analyzer.name)]
+        if pending:
+            run_analyzers(pending, self.__context, max_workers=self.__strategy.config.analyzer_workers)
+        return self.__context
 
-        """
-        记录策略的交易流水
-        """
-        # tracker = self.__retAnalyzer.getPdTradeTrackerTemp()
+    def __metric(self, analyzer_class, attr):
+        return lambda: getattr(self.__analyze(analyzer_class)[analyzer_class], attr)
 
+    def post_process(self):
         """
-        记录策略的每日持仓
-        """
-        # share1 = self.__retAnalyzer.getPdSharesTemp()
-        share = self.__strategy_tracker.total_position_records
-        """
-        记录策略的每日详细持仓
-        """
-        # shareDetails = self.__retAnalyzer.getPdDetailsTemp()
-        shareDetails = self.__strategy_tracker.position_records
-        """
-        记录个股详细持仓变化
+        策略运行完成后，完成对回测报告的输出
+
+        各项指标在首次访问时才计算，config.metric_groups未包含的分组不输出，对应的算子和记录转换不会执行
         """
-        shareDetailPositions = self.__strategy_tracker.detailed_position_records
+        groups = self.__strategy.config.metric_groups
+
+        def enabled(group):
+            return groups is None or group in groups
 
-        unfilled_orders = self.__strategy_tracker.unfilled_orders
-        transaction_records = self.__strategy_tracker.transaction_records
+        strategy_tracker = self.__strategy_tracker
 
-        context = AnalyzerContext()
-        analyzers = [
+        self.__context = AnalyzerContext()
+        self.__analyzers = [
             BasicInfoAnalyzer(self.__strategy, self.__strategyName, self.__config),
             ConfigSummaryAnalyzer(),
             BenchAnalyzer(self.__bench),
@@ -229,45 +240,61 @@ class StrategyOutput:
             MonthlyAggregatedMetricAnalyzer()
         ]
 
-        for analyzer in analyzers:
-            analyzer(context)
-
         result = BackTestResult()
 
-        result.add_metric('回测配置', context[ConfigSummaryAnalyzer].config_summary)
-        result.add_metric('策略指标', context[MetricSummaryAnalyzer].metric_summary, formatter=reformat_row)
-        result.add_metric('年度表现', context[YearlyExtendedMetricAnalyzer].summary, formatter=reformat_row)
-        result.add_metric('策略净值', context[BenchAnalyzer].benchmark, plot_func=plot_net_value)
-        result.add_metric('回撤指标', context[DrawDownAnalyzer].draw_down_summary, formatter=reformat_row)
-        result.add_metric('回撤详情', context[DrawDownAnalyzer].draw_down, plot_func=plot_drawback)
-        result.add_metric('分月度表现', context[MonthlyAggregatedMetricAnalyzer].summary, formatter=reformat_row)
-
-        if self.__strategy.custom_analyzer is not None:
-            for k, df in self.__strategy.custom_analyzer.entries():
-                result.add_metric(k, df)
-
-        result.add_metric('月频涨跌幅', context[MonthlyMetricAnalyzer].monthly_change)
-        result.add_metric('周频涨跌幅', context[WeeklyMetricAnalyzer].weekly_change)
-        # result.add_metric('交易流水', tracker.set_index("交易日期"))
-        result.add_metric('交易流水', transaction_records.set_index("交易日期"))
-        result.add_metric('未成交记录', unfilled_orders.set_index("交易时间"))
-        result.add_metric('每日持仓', share.set_index("日期"))
-        result.add_metric('详细持仓', shareDetails)
-        result.add_metric('个股跟踪', shareDetailPositions.set_index("交易日期"))
+        if enabled(MetricGroup.SUMMARY):
+            result.add_lazy_metric('回测配置', self.__metric(ConfigSummaryAnalyzer, 'config_summary'))
+            result.add_lazy_metric('策略指标', self.__metric(MetricSummaryAnalyzer, 'metric_summary'),
+                                   formatter=reformat_row)
+        if enabled(MetricGroup.YEARLY):
+            result.add_lazy_metric('年度表现', self.__metric(YearlyExtendedMetricAnalyzer, 'summary'),
+                                   formatter=reformat_row)
+        if enabled(MetricGroup.NET_VALUE):
+            result.add_lazy_metric('策略净值', self.__metric(BenchAnalyzer, 'benchmark'), plot_func=plot_net_value)
+        if enabled(MetricGroup.DRAW_DOWN):
+            result.add_lazy_metric('回撤指标', self.__metric(DrawDownAnalyzer, 'draw_down_summary'),
+                                   formatter=reformat_row)
+            result.add_lazy_metric('回撤详情', self.__metric(DrawDownAnalyzer, 'draw_down'), plot_func=plot_drawback)
+        if enabled(MetricGroup.MONTHLY):
+            result.add_lazy_metric('分月度表现', self.__metric(MonthlyAggregatedMetricAnalyzer, 'summary'),
+                                   formatter=reformat_row)
+
+        custom_analyzer = self.__strategy.custom_analyzer
+        if custom_analyzer is not None and enabled(MetricGroup.CUSTOM):
+            for k in custom_analyzer.names():
+                result.add_lazy_metric(k, partial(custom_analyzer.entry, k))
+
+        if enabled(MetricGroup.MONTHLY):
+            result.add_lazy_metric('月频涨跌幅',
+                                   lambda: shared_monthly_change_by_date(self.__analyze(MonthlyMetricAnalyzer)))
+        if enabled(MetricGroup.WEEKLY):
+            result.add_lazy_metric('周频涨跌幅', self.__metric(WeeklyMetricAnalyzer, 'weekly_change'))
+        if enabled(MetricGroup.RECORDS):
+            # result.add_metric('交易流水', tracker.set_index("交易日期"))
+            result.add_lazy_metric('交易流水', lambda: strategy_tracker.transaction_records.set_index("交易日期"))
+            result.add_lazy_metric('未成交记录', lambda: strategy_tracker.unfilled_orders.set_index("交易时间"))
+            result.add_lazy_metric('每日持仓', lambda: strategy_tracker.total_position_records.set_index("日期"))
+            result.add_lazy_metric('详细持仓', lambda: strategy_tracker.position_records)
+            result.add_lazy_metric('个股跟踪', lambda: strategy_tracker.detailed_position_records.set_index("交易日期"))
 
         # result.add_metric('日胜率', context[DailyWinRatioAnalyzer])
 
         # 增加组合年收益率和月收益率
-        result.add_metric('月频净值截面', context[MonthlyMetricAnalyzer].benchmark_monthly)
-        result.add_metric('年频净值截面', context[YearlyMetricAnalyzer].benchmark_yearly)
-
-        result.add_metric('年频涨跌幅', context[YearlyMetricAnalyzer].yearly_change),
+        if enabled(MetricGroup.MONTHLY):
+            result.add_lazy_metric('月频净值截面', self.__metric(MonthlyMetricAnalyzer, 'benchmark_monthly'))
+        if enabled(MetricGroup.YEARLY):
+            result.add_lazy_metric('年频净值截面', self.__metric(YearlyMetricAnalyzer, 'benchmark_yearly'))
+            result.add_lazy_metric('年频涨跌幅', self.__metric(YearlyMetricAnalyzer, 'yearly_change'))
         # result.add_metric('年度夏普比', context[YearlyExtendedMetricAnalyzer].yearly_sharpe)
         # result.add_metric('年度卡玛比', context[YearlyExtendedMetricAnalyzer].yearly_calmar)
         # result.add_metric('年度回撤', context[YearlyExtendedMetricAnalyzer].yearly_draw_down)
         # result.add_metric('年度月胜率', context[YearlyExtendedMetricAnalyzer].yearly_month_win_ratio)
 
-
+        # 开启profile_runtime时附加各阶段的运行性能，先计算全部指标使其计入统计
+        profiler = current_profiler()
+        if profiler is not None:
+            result.materialize()
+            result.add_metric(PROFILE_SHEET_NAME, profiler.summary())
 
         self.__result = result
 
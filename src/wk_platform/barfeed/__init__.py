@@ -125,6 +125,17 @@ class BaseBarFeed(feed.BaseFeed):
         """Returns the last :class:`pyalgotrade.bar.Bar` for a given instrument, or None."""
         return self.__lastBars.get(instrument, None)
 
+    def export_status(self):
+        status = super().export_status()
+        status['current_bars'] = self.__currentBars
+        status['last_bars'] = dict(self.__lastBars)
+        return status
+
+    def update_status(self, status):
+        super().update_status(status)
+        self.__currentBars = status['current_bars']
+        self.__lastBars = dict(status['last_bars'])
+
     def getDefaultInstrument(self):
         """Returns the last instrument registered."""
         return self.__defaultInstrument
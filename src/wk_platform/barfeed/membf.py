@@ -18,6 +18,7 @@
 .. moduleauthor:: Gabriel Martin Becedillas Ruiz <gabriel.becedillas@gmail.com>
 """
 import typing
+import numpy as np
 import pandas as pd
 import six
 from collections import OrderedDict
@@ -27,6 +28,7 @@ from wk_util.tqdm import tqdm
 from wk_platform import barfeed
 from wk_platform.bar.base_bar import FastBars
 from wk_util.algo import bin_search
+from wk_platform.util.profiler import profiled
 
 
 # A non real-time BarFeed responsible for:
@@ -126,20 +128,150 @@ class BarFeed(barfeed.BaseBarFeed):
             pass
 
 
+class ColumnarRow(object):
+    """
+    列式数据中单行的轻量视图，提供与DataFrame.itertuples()行一致的属性访问方式，供RowParser解析使用
+    """
+    __slots__ = ('_columns', '_pos')
+
+    def __init__(self, columns, pos):
+        self._columns = columns
+        self._pos = pos
+
+    def __getattr__(self, name):
+        try:
+            column = self._columns[name]
+        except KeyError:
+            raise AttributeError(name)
+        return column.item(self._pos)
+
+
+def _column_values(series: pd.Series):
+    """
+    列式数据中一列的NumPy数组
+    日期时间类型的列转为Timestamp/Timedelta对象数组，否则ndarray.item()返回的是以纳秒为单位的整数，
+    与DataFrame.itertuples()的结果不一致
+    """
+    if series.dtype.kind in 'mM':
+        return series.to_numpy(dtype=object)
+    return series.to_numpy()
+
+
+class ColumnarBlock(object):
+    """
+    单个数据集在某一交易日的列式数据
+
+    各列为整个数据集的NumPy数组，当日数据对应其中[start, stop)区间，不额外复制数据
+    """
+    __slots__ = ('columns', 'start', 'stop', 'instruments', 'parser')
+
+    def __init__(self, columns, start, stop, instruments, parser):
+        self.columns = columns
+        self.start = start
+        self.stop = stop
+        self.instruments = instruments
+        self.parser = parser
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def parse(self, pos):
+        return self.parser.parse_row(ColumnarRow(self.columns, pos))
+
+
+class ColumnarBars(object):
+    """
+    列式数据对应的Bars，接口与 :class:`wk_platform.feed.bar.Bars` 一致
+
+    仅在通过__getitem__等方法访问某个标的时才解析生成对应的bar对象。
+    多个数据集包含同一标的时，与字典模式一致，以后添加的数据集为准
+    """
+
+    def __init__(self, date_time, blocks):
+        if len(blocks) == 0:
+            raise Exception("No bars supplied")
+        self.__dateTime = date_time
+        self.__blocks = blocks
+        self.__index = None
+        self.__cache = {}
+
+    def __get_index(self):
+        if self.__index is None:
+            index = {}
+            for block in self.__blocks:
+                for pos, instrument in enumerate(block.instruments[block.start:block.stop], block.start):
+                    index[instrument] = (block, pos)
+            self.__index = index
+        return self.__index
+
+    def __getitem__(self, instrument):
+        try:
+            return self.__cache[instrument]
+        except KeyError:
+            pass
+        block, pos = self.__get_index()[instrument]
+        _, bar_ = block.parse(pos)
+        self.__cache[instrument] = bar_
+        return bar_
+
+    def __contains__(self, instrument):
+        return instrument in self.__get_index()
+
+    def __len__(self):
+        return len(self.__get_index())
+
+    def items(self):
+        return [(instrument, self[instrument]) for instrument in self.__get_index().keys()]
+
+    def keys(self):
+        return list(self.__get_index().keys())
+
+    def getInstruments(self):
+        """Returns the instrument symbols."""
+        return list(self.__get_index().keys())
+
+    def getDateTime(self):
+        """Returns the :class:`datetime.datetime` for this set of bars."""
+        return self.__dateTime
+
+    def getBar(self, instrument):
+        """Returns the :class:`pyalgotrade.bar.Bar` for the given instrument or None if the instrument is not found."""
+        if instrument not in self.__get_index():
+            return None
+        return self[instrument]
+
+    def __reduce__(self):
+        # 各列为整个数据集的数组，序列化时只保留当日解析后的bar
+        return bar.Bars, (dict(self.items()),)
+
+
 class MacroBars:
     def __init__(self, bar_time):
         self.__bar_time = bar_time
         self.__data: dict[str, pd.DataFrame] = {}
         self.__parser: dict[str, typing.Callable] = {}
+        self.__blocks: dict[str, ColumnarBlock] = {}
         self.__cache = None
 
+    @property
+    def columnar(self):
+        return len(self.__blocks) > 0
+
     def add_data(self, name, df, parser):
         self.__data[name] = df
         self.__parser[name] = parser.parse_row
         # self.__parser[name] = parser.lazy_parser
         # self.parsed_bars()
 
+    def add_block(self, name, block: ColumnarBlock):
+        """
+        添加列式数据，列式数据不需要预先解析
+        """
+        self.__blocks[name] = block
+
     def parse_bars(self, force=False):
+        if self.columnar:
+            return
         if self.__cache is not None and not force:
             return
         result = {}
@@ -157,20 +289,37 @@ class MacroBars:
         return self.bars().items()
 
     def set_data(self, data):
+        self.__blocks = {}
         self.__cache = {k: v for k, v in data if not isinstance(v, float)}
 
     def bars(self):
+        if self.columnar:
+            return self.columnar_bars()
         if self.__cache is None:
             self.parse_bars()
         return self.__cache
 
+    def columnar_bars(self):
+        blocks = list(self.__blocks.values())
+        date_time = blocks[0].parser.parse_date(self.__bar_time)
+        return ColumnarBars(date_time, blocks)
+
+    def to_bars(self):
+        if self.columnar:
+            return self.columnar_bars()
+        return bar.Bars(self.bars())
+
 
 class FastBarFeed(barfeed.BaseBarFeed):
     """
     快速bar_feed，添加数据时为原始的DataFrame，回测调用时再实时解析具体的bar
+
+    columnar为True时使用列式存储，每个交易日的数据为整体NumPy数组上的区间，
+    回测时仅在访问具体标的时才生成bar对象，可显著降低加载时间和内存占用
     """
-    def __init__(self, frequency, maxLen=None):
+    def __init__(self, frequency, maxLen=None, columnar=False):
         super().__init__(frequency, maxLen)
+        self.__columnar = columnar
 
         self.__bars = {}
         self.__nextPos = {}
@@ -184,6 +333,10 @@ class FastBarFeed(barfeed.BaseBarFeed):
         self.__specified_range = False
         self.__current_feed_df = None
 
+    @property
+    def columnar(self):
+        return self.__columnar
+
     def reset(self):
         self.__cursor = 0
         self.__bar_time = sorted(self.__data_seq.keys())
@@ -208,6 +361,13 @@ class FastBarFeed(barfeed.BaseBarFeed):
         for k in bar_time[idx+1:]:
             del self.__data_seq[k]
 
+    def drop_until(self, date_str):
+        """
+        删除date_str及之前的数据，从状态快照恢复时只保留快照之后的交易日
+        """
+        for k in [k for k in self.__data_seq.keys() if k <= date_str]:
+            del self.__data_seq[k]
+
     def stop(self):
         pass
 
@@ -228,6 +388,8 @@ class FastBarFeed(barfeed.BaseBarFeed):
         self.registerInstrument(instrument)
 
     def add_data_from_dataframe(self, tag, time_field_name, data_frame: pd.DataFrame, row_parser, progress_bar=False):
+        if self.__columnar:
+            return self.__add_columnar_data(tag, time_field_name, data_frame, row_parser, progress_bar)
         group = data_frame.groupby(time_field_name)  # 按照windcode分类
         groups = data_frame.groupby(time_field_name).groups  # groups类型为dict
         max_date = None
@@ -244,6 +406,27 @@ class FastBarFeed(barfeed.BaseBarFeed):
                 max_date = bar_time
         return max_date
 
+    def __add_columnar_data(self, tag, time_field_name, data_frame: pd.DataFrame, row_parser, progress_bar=False):
+        if data_frame.empty:
+            return None
+        # 稳定排序，保证同一交易日内的顺序与groupby一致
+        data_frame = data_frame.sort_values(by=time_field_name, kind='stable')
+        columns = {col: _column_values(data_frame[col]) for col in data_frame.columns}
+        instruments = data_frame['windcode'].map(row_parser.instrument_name).to_numpy()
+        time_values = data_frame[time_field_name].astype(str).to_numpy()
+
+        bar_time_list, starts = np.unique(time_values, return_index=True)
+        stops = np.append(starts[1:], len(time_values))
+        for bar_time, start, stop in tqdm(list(zip(bar_time_list, starts, stops)), disable=(not progress_bar)):
+            block = ColumnarBlock(columns, int(start), int(stop), instruments, row_parser)
+            try:
+                macro_bars = self.__data_seq[bar_time]
+            except KeyError:
+                macro_bars = MacroBars(bar_time)
+                self.__data_seq[bar_time] = macro_bars
+            macro_bars.add_block(tag, block)
+        return data_frame[time_field_name].iloc[-1]
+
     def get_data_seq(self):
         return self.__data_seq
 
@@ -277,6 +460,7 @@ class FastBarFeed(barfeed.BaseBarFeed):
             result[k].set_data(zip(columns, value[1:]))
         self.__data_seq = result
 
+    @profiled('feed.prefetch')
     def prefetch(self, progress_bar=False, force=False):
         for k, v in tqdm(self.__data_seq.items(), disable=(not progress_bar)):
             v.parse_bars(force)
@@ -310,14 +494,14 @@ class FastBarFeed(barfeed.BaseBarFeed):
         if smallestDateTime is None:
             return None
 
-        bars = self.__data_seq[smallestDateTime].bars()
+        bars = self.__data_seq[smallestDateTime].to_bars()
         self.__cursor += 1
 
         # if self.__currDateTime == smallestDateTime:
         #     raise Exception("Duplicate bars found for %s on %s" % (list(ret.keys()), smallestDateTime))
 
         self.__currDateTime = smallestDateTime
-        return bar.Bars(bars)
+        return bars
 
     def loadAll(self):
         for dateTime, bars in self:
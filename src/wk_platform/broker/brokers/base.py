@@ -30,6 +30,7 @@ content:
 """
 import typing
 from abc import abstractmethod
+from contextlib import contextmanager
 from collections import OrderedDict
 from collections import deque
 from dataclasses import dataclass, field
@@ -37,6 +38,8 @@ from wk_util import logger
 from wk_platform import broker
 from wk_platform.config import StrategyConfiguration, PositionCostType, HedgeStrategyConfiguration  # , PriceType
 from wk_platform.stratanalyzer.record import UnfilledOrderInfo, TransactionRecord
+from wk_platform.stratanalyzer.ledger import TransactionLedger
+from wk_util.recorder import ColumnBuffer
 from wk_platform.broker.commission import *
 
 
@@ -53,8 +56,8 @@ class BrokerStatus:
     position_delta: dict[str, typing.Any] = field(default_factory=dict)  # 记录持仓盈亏
     buy_volume: dict[str, int] = field(default_factory=dict)  # 记录买入数量
     sell_volume: dict[str, int] = field(default_factory=dict)  # 记录卖出数量
-    transaction_tracker: deque = field(default_factory=deque)
-    unfilled_order_tracker: deque = field(default_factory=deque)
+    transaction_tracker: TransactionLedger = field(default_factory=TransactionLedger)
+    unfilled_order_tracker: ColumnBuffer = field(default_factory=lambda: ColumnBuffer.from_dataclass(UnfilledOrderInfo))
 
 
 class BaseBacktestBroker(broker.Broker):
@@ -68,9 +71,19 @@ class BaseBacktestBroker(broker.Broker):
     def __init__(self, bar_feed, config=StrategyConfiguration()):
         super(BaseBacktestBroker, self).__init__()
 
+        self.__config = config
+        self.__init_state(bar_feed)
+
+        # 交易流水按列保存，各broker共用
+        self.__transaction_tracker = TransactionLedger()
+
+    def __init_state(self, bar_feed):
+        """
+        初始化与行情feed相关的状态，构造时以及日内Broker更换交易日的feed时调用
+        """
+        config = self.__config
         self.__bar_feed = bar_feed
         self.__use_adjusted_values = True
-        self.__config = config
 
         self.__active_orders = OrderedDict()
 
@@ -97,8 +110,6 @@ class BaseBacktestBroker(broker.Broker):
         self.__long_amount = 0
         self.__short_amount = 0
 
-        self.__transaction_tracker: [TransactionRecord] = deque()
-
     def _reset_daily_amount(self):
         self.__long_amount = 0
         self.__short_amount = 0
@@ -138,6 +149,20 @@ class BaseBacktestBroker(broker.Broker):
     def bar_feed_subscribe(self, func):
         self.__bar_feed.getNewValuesEvent().subscribe(func)
 
+    def _replace_bar_feed(self, bar_feed):
+        """
+        更换行情feed，除交易流水外的状态恢复为新创建时的取值，交易流水由子类通过状态同步设置
+        """
+        self.__init_state(bar_feed)
+
+    @contextmanager
+    def rebalance_scope(self, price_type=None):
+        """
+        调仓作用域，返回进入作用域时的持仓市值
+        默认实现不做缓存，维护增量市值的券商类可覆盖此方法
+        """
+        yield self.getSharesValue(price_type)
+
     def _get_bar(self, bars, instrument):
         ret = bars.getBar(instrument)
         if ret is None:
@@ -223,7 +248,7 @@ class BaseBacktestBroker(broker.Broker):
         return self.commission
 
     @property
-    def transaction_tracker(self):
+    def transaction_tracker(self) -> TransactionLedger:
         """
         返回交易流水记录
         """
@@ -254,7 +279,7 @@ class BaseBacktestBroker(broker.Broker):
 
         if not self.__config.tracking_transaction:
             return
-        trans_rec = TransactionRecord(
+        self.__transaction_tracker.append(
             trade_dt,
             windcode,
             sec_name,
@@ -265,12 +290,11 @@ class BaseBacktestBroker(broker.Broker):
             direction,
             note
         )
-        self.__transaction_tracker.append(trans_rec)
 
     @abstractmethod
     def export_status(self):
         """导出当前Broker状态，用于日内Broker
-        TODO: 导出状态用于checkpoint
+        完整的回测状态快照（checkpoint）见 wk_platform.strategy.checkpoint
         导出信息包括：
         持仓详情，现金
         """
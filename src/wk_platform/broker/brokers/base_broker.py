@@ -1,4 +1,3 @@
-import copy
 import typing
 from collections import OrderedDict
 from collections import deque
@@ -10,6 +9,7 @@ from wk_platform.broker.fillstrategy import CommonFillStrategy
 from wk_platform.config import StrategyConfiguration, PositionCostType, HedgeStrategyConfiguration, \
     TradeRule, PriceType  # , PriceType
 from wk_platform.stratanalyzer.record import UnfilledOrderInfo, TransactionRecord
+from wk_util.recorder import ColumnBuffer
 from wk_data.constants import SuspensionType
 from wk_platform.feed.bar import StockBar, StockIndexFutureBar
 # from wk_platform.util import FutureUtil
@@ -21,6 +21,7 @@ from wk_platform.broker.order import LimitOrder
 from wk_platform.broker.order import StopOrder
 from wk_platform.broker.order import StopLimitOrder
 from wk_platform.broker.brokers.base import BrokerStatus, BaseBacktestBroker
+from wk_platform.util.profiler import profiled
 
 
 class Broker(BaseBacktestBroker):
@@ -46,7 +47,7 @@ class Broker(BaseBacktestBroker):
 
         self.__useAdjustedValues = True
 
-        self.__unfilled_orders = deque()
+        self.__unfilled_orders = ColumnBuffer.from_dataclass(UnfilledOrderInfo)
 
         """
         将activeOrders从字典类改为有序字典
@@ -633,7 +634,7 @@ class Broker(BaseBacktestBroker):
                 """
                 更新当天可卖持仓和最新卖出时间
                 """
-                self.__sharesCanSell[order.getInstrument()] += sharesDeltaRound
+                self.__sharesCanSell[order.getInstrument()] = self.__sharesCanSell.get(order.getInstrument(), 0) + sharesDeltaRound
                 self.__lastSellTime[order.getInstrument()] = dateTimeTemp
 
             else:  # 买入状态
@@ -761,7 +762,7 @@ class Broker(BaseBacktestBroker):
         else:
             assert False
 
-        self.__unfilled_orders.append(
+        self.__unfilled_orders.append_record(
             UnfilledOrderInfo(
                 order.getSubmitDateTime(),
                 order.getInstrument(),
@@ -859,6 +860,7 @@ class Broker(BaseBacktestBroker):
                 del self.__shares[inst]
                 del self.__amountTotal[inst]
 
+    @profiled('broker.onBars')
     def onBars(self, dateTime, bars):
         # Let the fill strategy know that new bars are being processed.
 
@@ -870,7 +872,7 @@ class Broker(BaseBacktestBroker):
         """
         self.__fillStrategy.onBars(self, bars)
         # 新增，具体位置有待商榷，此处需要check
-        self.__sharesCanSell = copy.deepcopy(self.__fillStrategy.getVolumeBegin())
+        self.__sharesCanSell = dict(self.__fillStrategy.getVolumeBegin())
 
         """
         改变订单的处理逻辑，当前逻辑为每天Feed来先触发broker onBars，计算当天允许成交的量，接着进入
@@ -951,7 +953,7 @@ class Broker(BaseBacktestBroker):
 
     def export_status(self):
         """导出当前Broker状态，用于日内Broker
-        TODO: 导出状态用于checkpoint
+        完整的回测状态快照（checkpoint）见 wk_platform.strategy.checkpoint
         TODO: 保存fill_strategy的状态
         导出信息包括：
         持仓详情，现金
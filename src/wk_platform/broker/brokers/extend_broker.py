@@ -2,11 +2,13 @@ from __future__ import annotations
 
 # import copy
 import typing
+from contextlib import contextmanager
 from collections import OrderedDict
 from collections import deque
 from dataclasses import dataclass, field
 # from dataclasses import dataclass, field
 from enum import Enum
+from types import MappingProxyType
 
 import numpy as np
 from pyalgotrade.bar import Frequency
@@ -17,9 +19,12 @@ from wk_platform import broker
 from wk_platform.broker.fillstrategy import CommonFillStrategy, CommonFillStrategyV2, FutureStrategy
 from wk_platform.config import StrategyConfiguration, PositionCostType, PriceType  # , PriceType
 from wk_platform.stratanalyzer.record import UnfilledOrderInfo
+from wk_platform.stratanalyzer.ledger import TransactionLedger
+from wk_util.recorder import ColumnBuffer
 from wk_data.constants import SuspensionType
 from wk_platform.feed.bar import StockBar, StockIndexFutureBar
 from wk_platform.util.future import FutureUtil
+from wk_platform.util.profiler import profiled
 # from wk_platform.strategy.position import Position
 from wk_platform.broker.commission import *
 # from wk_platform.broker import Order
@@ -45,8 +50,8 @@ class BrokerStatus:
     # position_delta: dict[str, typing.Any] = field(default_factory=dict)  # 记录持仓盈亏
     # buy_volume: dict[str, int] = field(default_factory=dict)  # 记录买入数量
     # sell_volume: dict[str, int] = field(default_factory=dict)  # 记录卖出数量
-    transaction_tracker: deque = field(default_factory=deque)
-    unfilled_order_tracker: deque = field(default_factory=deque)
+    transaction_tracker: TransactionLedger = field(default_factory=TransactionLedger)
+    unfilled_order_tracker: ColumnBuffer = field(default_factory=lambda: ColumnBuffer.from_dataclass(UnfilledOrderInfo))
 
 
 class NoPositionException(Exception):
@@ -58,10 +63,36 @@ class NoPositionException(Exception):
 
 
 class MixedPositionMixin(object):
+    """
+    股票、期货混合持仓
+
+    除全部持仓外，另按持仓类型维护股票持仓和期货持仓两个索引，在 open_position、set_position_zero、
+    simplify_position 等修改持仓的操作中同步更新，按类型查询持仓时不再遍历全部持仓。
+    持仓需通过上述方法修改，get_stock_dict/get_future_dict 返回只读视图
+    """
     def __init__(self, by_pass_future=True):
         self.__positions: {str: BasePosition} = {}
+        self.__stock_positions: {str: StockPosition} = {}
+        self.__future_positions: {str: FuturePosition} = {}
+        self.__positions_view = MappingProxyType(self.__positions)
+        self.__stock_view = MappingProxyType(self.__stock_positions)
+        self.__future_view = MappingProxyType(self.__future_positions)
         self.__by_pass_future = by_pass_future
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # 只读视图无法序列化，恢复时重新创建
+        del state['_MixedPositionMixin__positions_view']
+        del state['_MixedPositionMixin__stock_view']
+        del state['_MixedPositionMixin__future_view']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__positions_view = MappingProxyType(self.__positions)
+        self.__stock_view = MappingProxyType(self.__stock_positions)
+        self.__future_view = MappingProxyType(self.__future_positions)
+
     @property
     def by_pass_future(self):
         return self.__by_pass_future
@@ -70,50 +101,47 @@ class MixedPositionMixin(object):
     def by_pass_future(self, value):
         self.__by_pass_future = value
 
+    def __add_index(self, instrument, position):
+        if isinstance(position, StockPosition):
+            self.__stock_positions[instrument] = position
+        elif isinstance(position, FuturePosition):
+            self.__future_positions[instrument] = position
+
+    def __remove_index(self, instrument):
+        self.__stock_positions.pop(instrument, None)
+        self.__future_positions.pop(instrument, None)
+
     def get_stock_list(self):
         """
         获取持仓中的所有个股
         """
-        stocks = []
         if self.by_pass_future:
             return self.__positions.keys()
-        for k, v in self.__positions.items():
-            if isinstance(v, StockPosition):
-                stocks.append(k)
-        return stocks
+        return list(self.__stock_positions.keys())
 
     def get_stock_dict(self):
-        stock_items = {}
+        """
+        获取持仓中的所有个股，只读
+        """
         if self.by_pass_future:
-            return self.__positions
-        for k, v in self.__positions.items():
-            if isinstance(v, StockPosition):
-                stock_items[k] = v
-        return stock_items
+            return self.__positions_view
+        return self.__stock_view
 
     def get_future_list(self):
         """
         获取持仓中的所有期货
         """
-        futures = []
         if self.by_pass_future:
-            return futures
-        for k, v in self.__positions.items():
-            if isinstance(v, FuturePosition):
-                futures.append(k)
-        return futures
+            return []
+        return list(self.__future_positions.keys())
 
     def get_future_dict(self):
         """
-        获取持仓中的所有期货
+        获取持仓中的所有期货，只读
         """
-        future_items = {}
         if self.by_pass_future:
-            return future_items
-        for k, v in self.__positions.items():
-            if isinstance(v, FuturePosition):
-                future_items[k] = v
-        return future_items
+            return {}
+        return self.__future_view
 
     def get_position(self, instrument) -> BasePosition | None:
         try:
@@ -127,7 +155,8 @@ class MixedPositionMixin(object):
         except KeyError:
             position = position_cls(windcode=instrument, quantity=0)
             self.__positions[instrument] = position
-            return self.__positions[instrument]
+            self.__add_index(instrument, position)
+            return position
 
     def get_positions(self):
         return self.__positions
@@ -138,9 +167,12 @@ class MixedPositionMixin(object):
         """
         if instrument in self.__positions:
             del self.__positions[instrument]
+            self.__remove_index(instrument)
 
     def open_position(self, instrument, position):
+        self.__remove_index(instrument)
         self.__positions[instrument] = position
+        self.__add_index(instrument, position)
 
     def get_quantity(self, instrument):
         try:
@@ -158,10 +190,10 @@ class MixedPositionMixin(object):
         """
         从持仓中删去仓位为0的标的
         """
-        instruments = [k for k in self.__positions.keys()]
+        instruments = [k for k, v in self.__positions.items() if v.quantity == 0]
         for inst in instruments:
-            if self.__positions[inst].quantity == 0:
-                del self.__positions[inst]
+            del self.__positions[inst]
+            self.__remove_index(inst)
 
 
 class InstrumentTraitsMixin:
@@ -223,7 +255,7 @@ class OrderManageMixin:
     """
     def __init__(self, config):
         self.__nextOrderId = 1
-        self.__unfilled_orders = deque()
+        self.__unfilled_orders = ColumnBuffer.from_dataclass(UnfilledOrderInfo)
         self.__config = config
 
         """
@@ -236,6 +268,14 @@ class OrderManageMixin:
         self.__nextOrderId += 1
         return ret
 
+    @property
+    def next_order_id(self):
+        return self.__nextOrderId
+
+    @next_order_id.setter
+    def next_order_id(self, value):
+        self.__nextOrderId = value
+
     def register_order(self, order):
         # print('call _registerOrder')
         assert (order.getId() not in self.__activeOrders)
@@ -284,7 +324,7 @@ class OrderManageMixin:
         else:
             assert False
 
-        self.__unfilled_orders.append(
+        self.__unfilled_orders.append_record(
             UnfilledOrderInfo(
                 order.getSubmitDateTime(),
                 order.getInstrument(),
@@ -299,6 +339,10 @@ class OrderManageMixin:
     def unfilled_orders(self):
         return self.__unfilled_orders
 
+    @unfilled_orders.setter
+    def unfilled_orders(self, value):
+        self.__unfilled_orders = value
+
 
 class CashMixin:
     def __init__(self, init_cash, allow_negative_cash):
@@ -417,6 +461,10 @@ class BrokerV2(
         self.__hooks: {BrokerV2.Hook: typing.Callable} = {}
         # self.__margin_call_handler = need_implemented_func
 
+        # 股票持仓市值的增量缓存，按价格类型记录，仅对 __market_value_bars 对应的行情有效
+        self.__market_value_bars = None
+        self.__market_value: {PriceType: float} = {}
+
 
         # 股票佣金
         if config.commission is None:
@@ -508,6 +556,49 @@ class BrokerV2(
         assert False
         # return [instrument for instrument, shares in self.__shares.items() if shares != 0]
 
+    def set_position_zero(self, instrument):
+        super().set_position_zero(instrument)
+        self.invalidate_market_value()
+
+    def open_position(self, instrument, position):
+        super().open_position(instrument, position)
+        self.invalidate_market_value()
+
+    def set_quantity(self, instrument, quantity):
+        super().set_quantity(instrument, quantity)
+        self.invalidate_market_value()
+
+    def invalidate_market_value(self):
+        """
+        丢弃持仓市值缓存，下次查询时重新全量计算
+        """
+        self.__market_value_bars = None
+        self.__market_value = {}
+
+    def __update_market_value(self, instrument, shares_delta):
+        """
+        成交后按持仓变动量增量更新已缓存的持仓市值
+        """
+        if shares_delta == 0 or len(self.__market_value) == 0:
+            return
+        bars = self.current_bars
+        if bars is not self.__market_value_bars:
+            self.invalidate_market_value()
+            return
+        bar = self._getBar(bars, instrument)
+        for price_type in self.__market_value:
+            self.__market_value[price_type] += bar.get_price(price_type, self.use_adjusted_values) * shares_delta
+
+    @contextmanager
+    def rebalance_scope(self, price_type=None):
+        """
+        调仓作用域，进入时全量计算一次持仓市值，作用域内的成交只增量更新该市值，
+        因此每次下单查询总资产均为O(1)
+        返回进入作用域时的持仓市值
+        """
+        self.invalidate_market_value()
+        yield self.getSharesValue(price_type)
+
     def setShareZero(self, instrument):
         """
         清仓一只股票,20180107
@@ -565,6 +656,7 @@ class BrokerV2(
         position.quantity += new_share
         if position.price == 0:
             position.price = bar2.get_price()
+        self.invalidate_market_value()
 
 
         self._append_transaction(
@@ -721,9 +813,18 @@ class BrokerV2(
         bars = self.current_bars
         if bars is None:
             return ret
+        if bars is not self.__market_value_bars:
+            # 新的行情到来，缓存的市值失效
+            self.__market_value_bars = bars
+            self.__market_value = {}
+        try:
+            return self.__market_value[price_type]
+        except KeyError:
+            pass
         for instrument, position in self.get_stock_dict().items():
             instrumentPrice = self._getBar(bars, instrument).get_price(price_type, self.use_adjusted_values)
             ret += instrumentPrice * position.quantity
+        self.__market_value[price_type] = ret
         return ret
 
 
@@ -1127,6 +1228,8 @@ class BrokerV2(
             position.quantity =  updated_quantity
             position.amount_total =  updated_quantity * price
 
+        self.__update_market_value(instrument, sharesDelta)
+
 
 
 
@@ -1288,6 +1391,7 @@ class BrokerV2(
 
 
         position.quantity = final_quantity
+        self.invalidate_market_value()
         # if future_position.quantity == 0:
         #     del self.__futures[order.getInstrument()]
 
@@ -1506,11 +1610,13 @@ class BrokerV2(
 
 
 
+    @profiled('broker.onBars')
     def onBars(self, dateTime, bars):
         # Let the fill strategy know that new bars are being processed.
 
         self.__logger.info("onBars called")
         self._reset_daily_amount()
+        self.invalidate_market_value()
 
         """
         fillStrategy.onBars中进行可成交量volume的计算
@@ -1613,7 +1719,7 @@ class BrokerV2(
 
     def export_status(self):
         """导出当前Broker状态，用于日内Broker
-        TODO: 导出状态用于checkpoint
+        完整的回测状态快照（checkpoint）见 wk_platform.strategy.checkpoint
         TODO: 保存fill_strategy的状态
         导出信息包括：
         持仓详情，现金
@@ -1621,7 +1727,7 @@ class BrokerV2(
 
         status = BrokerStatus(
             cash=self.cash,
-            next_order_id=self.__nextOrderId,
+            next_order_id=self.next_order_id,
             # shares=self.__shares,
             # shares_can_sell=self.__sharesCanSell,
             # position_cost=self.__positionCost,
@@ -1632,7 +1738,7 @@ class BrokerV2(
             # sell_volume=self.__fillStrategy.sell_volume,
             # buy_volume=self.__fillStrategy.buy_volume,
             transaction_tracker=self.transaction_tracker,
-            unfilled_order_tracker=self.__unfilled_orders
+            unfilled_order_tracker=self.unfilled_orders
 
         )
         return status
@@ -1640,7 +1746,7 @@ class BrokerV2(
     def update_status(self, status: BrokerStatus):
         # noinspection DuplicatedCode
         self.cash = status.cash
-        self.__nextOrderId = status.next_order_id
+        self.next_order_id = status.next_order_id
         # self.__shares = status.shares
         # self.__sharesCanSell = status.shares_can_sell
         # self.__positionCost = status.position_cost
@@ -1648,9 +1754,8 @@ class BrokerV2(
         # self.__lastSellTime = status.last_sell_time
         # self.__amountTotal = status.amount_total
         # self.__positionDelta = status.position_delta
-        self.__nextOrderId = status.next_order_id
         # self.__fillStrategy.buy_volume = status.buy_volume
         # self.__fillStrategy.sell_volume = status.sell_volume
         self.transaction_tracker = status.transaction_tracker
-        self.__unfilled_orders = status.unfilled_order_tracker
+        self.unfilled_orders = status.unfilled_order_tracker
 
@@ -1,4 +1,3 @@
-import copy
 import typing
 from collections import OrderedDict
 from collections import deque
@@ -9,9 +8,11 @@ from wk_platform import broker
 from wk_platform.broker import fillstrategy
 from wk_platform.config import StrategyConfiguration, PositionCostType, HedgeStrategyConfiguration #, PriceType
 from wk_platform.stratanalyzer.record import UnfilledOrderInfo, TransactionRecord
+from wk_util.recorder import ColumnBuffer
 from wk_data.constants import SuspensionType
 from wk_platform.feed.bar import StockBar, StockIndexFutureBar
 from wk_platform.util.future import FutureUtil
+from wk_platform.util.profiler import profiled
 # from wk_platform.strategy.position import Position
 from wk_platform.broker.commission import *
 from wk_platform.broker import Order
@@ -52,8 +53,7 @@ class HedgeBroker(BaseBacktestBroker):
         self.__shares = {}  #
         self.__futures: {str: HedgeBroker.FuturePosition} = {}
 
-        self.__transaction_tracker: [TransactionRecord] = deque()
-        self.__unfilled_orders = deque()
+        self.__unfilled_orders = ColumnBuffer.from_dataclass(UnfilledOrderInfo)
 
         self.__fillStrategy = fillstrategy.CommonFillStrategy(config.volume_limit, config.trade_rule)
         self.__future_fill_strategy = fillstrategy.FutureStrategy(config.volume_limit)
@@ -791,7 +791,7 @@ class HedgeBroker(BaseBacktestBroker):
                 """
                 更新当天可卖持仓和最新卖出时间
                 """
-                self.__sharesCanSell[order.getInstrument()] += sharesDeltaRound
+                self.__sharesCanSell[order.getInstrument()] = self.__sharesCanSell.get(order.getInstrument(), 0) + sharesDeltaRound
                 self.__lastSellTime[order.getInstrument()] = dateTimeTemp
 
             else:  # 买入状态
@@ -921,7 +921,7 @@ class HedgeBroker(BaseBacktestBroker):
         else:
             assert False
 
-        self.__unfilled_orders.append(
+        self.__unfilled_orders.append_record(
             UnfilledOrderInfo(
                 order.getSubmitDateTime(),
                 order.getInstrument(),
@@ -999,6 +999,7 @@ class HedgeBroker(BaseBacktestBroker):
         self.__current_position = None
 
 
+    @profiled('broker.onBars')
     def onBars(self, dateTime, bars):
         # Let the fill strategy know that new bars are being processed.
 
@@ -1012,7 +1013,7 @@ class HedgeBroker(BaseBacktestBroker):
         self.__fillStrategy.onBars(self, bars)
         self.__future_fill_strategy.onBars(self, bars)
         # 新增，具体位置有待商榷，此处需要check
-        self.__sharesCanSell = copy.deepcopy(self.__fillStrategy.getVolumeBegin())
+        self.__sharesCanSell = dict(self.__fillStrategy.getVolumeBegin())
         self.update_future()
 
 
@@ -1,4 +1,3 @@
-import copy
 import typing
 from collections import OrderedDict
 from collections import deque
@@ -9,8 +8,10 @@ from wk_platform import broker
 from wk_platform.broker import fillstrategy
 from wk_platform.config import StrategyConfiguration, PositionCostType, HedgeStrategyConfiguration #, PriceType
 from wk_platform.stratanalyzer.record import UnfilledOrderInfo, TransactionRecord
+from wk_util.recorder import ColumnBuffer
 from wk_data.constants import SuspensionType
 from wk_platform.feed.bar import StockBar, StockIndexFutureBar
+from wk_platform.util.profiler import profiled
 # from wk_platform.util import FutureUtil
 # from wk_platform.strategy.position import Position
 from wk_platform.broker.commission import *
@@ -49,16 +50,7 @@ class IntraDayBroker(BaseBacktestBroker):
 
         assert (cash >= 0)
 
-        self.__use_adjusted_values = True
-
-        self.__unfilled_orders = deque()
-
-        """
-        将activeOrders从字典类改为有序字典
-        """
-        self.__active_orders = OrderedDict()
-
-        self.__fill_strategy = fillstrategy.IntraDayFillStrategy(config.volume_limit)
+        self.__unfilled_orders = ColumnBuffer.from_dataclass(UnfilledOrderInfo)
 
         self.__logger = logger.getLogger(self.LOGGER_NAME, disable=True)
 
@@ -66,10 +58,23 @@ class IntraDayBroker(BaseBacktestBroker):
 
         # It is VERY important that the broker subscribes to barfeed events before the strategy.
         bar_feed.getNewValuesEvent().subscribe(self.onBars)
+        self.__init_day_state(bar_feed)
 
+    def __init_day_state(self, bar_feed):
+        """
+        初始化当日的状态，构造时以及reset更换交易日时调用
+        """
         self.__bar_feed = bar_feed
+        self.__use_adjusted_values = True
         self.__allow_negative_cash = False
 
+        """
+        将activeOrders从字典类改为有序字典
+        """
+        self.__active_orders = OrderedDict()
+
+        self.__fill_strategy = fillstrategy.IntraDayFillStrategy(self.__config.volume_limit)
+
     def _get_next_order_id(self):
         ret = self.__status.next_order_id
         self.__status.next_order_id += 1
@@ -518,7 +523,8 @@ class IntraDayBroker(BaseBacktestBroker):
                 """
                 更新当天可卖持仓和最新卖出时间
                 """
-                self.__status.shares_can_sell[order.getInstrument()] += sharesDeltaRound
+                shares_can_sell = self.__status.shares_can_sell
+                shares_can_sell[order.getInstrument()] = shares_can_sell.get(order.getInstrument(), 0) + sharesDeltaRound
                 self.__status.last_sell_time[order.getInstrument()] = dateTime
 
             else:  # 买入状态
@@ -644,7 +650,7 @@ class IntraDayBroker(BaseBacktestBroker):
         else:
             assert False
 
-        self.__unfilled_orders.append(
+        self.__unfilled_orders.append_record(
             UnfilledOrderInfo(
                 order.getSubmitDateTime(),
                 order.getInstrument(),
@@ -728,6 +734,7 @@ class IntraDayBroker(BaseBacktestBroker):
                 del self.__status.shares[inst]
                 del self.__status.amount_total[inst]
 
+    @profiled('broker.onBars')
     def onBars(self, dateTime, bars):
         # Let the fill strategy know that new bars are being processed.
 
@@ -739,7 +746,7 @@ class IntraDayBroker(BaseBacktestBroker):
         """
         self.__fill_strategy.onBars(self, bars)
         # 新增，具体位置有待商榷，此处需要check
-        self.__status.shares_can_sell = copy.deepcopy(self.__fill_strategy.getVolumeBegin())
+        self.__status.shares_can_sell = dict(self.__fill_strategy.getVolumeBegin())
 
         """
         改变订单的处理逻辑，当前逻辑为每天Feed来先触发broker onBars，计算当天允许成交的量，接着进入
@@ -820,7 +827,7 @@ class IntraDayBroker(BaseBacktestBroker):
 
     def export_status(self):
         """导出当前Broker状态，用于日内Broker
-        TODO: 导出状态用于checkpoint
+        完整的回测状态快照（checkpoint）见 wk_platform.strategy.checkpoint
         导出信息包括：
         持仓详情，现金
         """
@@ -837,3 +844,26 @@ class IntraDayBroker(BaseBacktestBroker):
 
     def init_fill_strategy(self, bars):
         self.__fill_strategy.init_volume_at_begin(self, bars)
+
+    def reset(self, bar_feed, status: BrokerStatus, bars):
+        """
+        重置为新交易日的日内Broker，代替每个交易日重新创建Broker
+
+        更换日内行情feed，当日的状态（未处理的订单、fill strategy统计的买卖量、是否允许负现金等）
+        与基类中的状态都恢复为新创建时的取值；status中的持仓等数据直接引用，不做复制
+
+        Parameters
+        ==================
+        bar_feed:
+            当日的日内行情feed
+        status: BrokerStatus
+            日间Broker导出的状态
+        bars:
+            日间Broker当日的行情，用于初始化可卖数量
+        """
+        self.__bar_feed.getNewValuesEvent().unsubscribe(self.onBars)
+        bar_feed.getNewValuesEvent().subscribe(self.onBars)
+        self._replace_bar_feed(bar_feed)
+        self.__init_day_state(bar_feed)
+        self.update_status(status)
+        self.init_fill_strategy(bars)
@@ -29,7 +29,7 @@ content:
 """
 
 import abc
-import copy
+from collections import defaultdict
 
 from pyalgotrade.bar import Frequency
 
@@ -37,6 +37,7 @@ from pyalgotrade.broker.fillstrategy import DefaultStrategy
 
 from wk_util import logger
 from wk_platform.util.round import round_100_shares
+from wk_platform.util.profiler import profiled
 from wk_platform import broker
 import wk_platform.feed.bar
 from wk_platform.broker import slippage
@@ -155,6 +156,43 @@ class FillInfo(object):
         return self.__msg
 
 
+class LazyVolumeLeft(dict):
+    """
+    当日各标的的剩余可成交量
+
+    标的首次下单时才根据当日bar计算可成交量，未下单的标的不做任何计算，
+    没有bar或未设置成交量限制的非TRADE频率标的视为不存在，与逐标的计算时的结果一致
+    """
+
+    def __init__(self, bars, volume_limit):
+        super().__init__()
+        self.__bars = bars
+        self.__volume_limit = volume_limit
+
+    def __missing__(self, instrument):
+        bar = self.__bars.getBar(instrument)
+        if bar is None:
+            raise KeyError(instrument)
+        if bar.getFrequency() == Frequency.TRADE:
+            volume = bar.getVolume() * 100
+        elif self.__volume_limit is not None:
+            # 最大可成交数量计算，并进行整百处理, chenxiangdong, 20170723
+            volume = round_100_shares(bar.getVolume() * self.__volume_limit * 100)
+        else:
+            raise KeyError(instrument)
+        self[instrument] = volume
+        return volume
+
+    def __contains__(self, instrument):
+        return self.get(instrument) is not None
+
+    def get(self, instrument, default=None):
+        try:
+            return self[instrument]
+        except KeyError:
+            return default
+
+
 class CommonFillStrategy(DefaultStrategy):
     """
     Default fill strategy.
@@ -225,45 +263,20 @@ class CommonFillStrategy(DefaultStrategy):
     A股成交量的单位为手，处理时需要乘以100   chenxiangdong 20170719
     volume保留到小数点后两位，需要做整百处理
     """
+    @profiled('broker.fill_strategy.onBars')
     def onBars(self, broker_, bars):
-        volumeLeft = {}
-        volumeBegin = {}
-        
-        for instrument in bars.getInstruments():
-            bar = bars[instrument]
-            # Reset the volume available for each instrument.
-            #if bar.getFrequency() == wk_pyalgotrade.bar.Frequency.TRADE:
-            if bar.getFrequency() == Frequency.TRADE:
-                volumeLeft[instrument] = bar.getVolume() * 100
-            elif self.__volumeLimit is not None:
-                # We can't round here because there is no order to request the instrument traits.
-                """
-                最大可成交数量计算
-                """
-                volumeLeft[instrument] = bar.getVolume() * self.__volumeLimit * 100
-                          
-                """
-                进行整百处理, chenxiangdong, 20170723
-                """
-                volumeLeft[instrument] = round_100_shares(volumeLeft[instrument])
-                #self.__logger.info("%s input volume is %s, real useful volume is %s" %(instrument,bar.getVolume()*100,volumeLeft[instrument]))
-               
-            # Reset the volume used for each instrument.
-            self.__volumeUsed[instrument] = 0.0
-                                         
-            """
-            每天开盘时持仓量的更新
-            """
-            volumeBegin[instrument] = broker_.getPositions().get(instrument)
-
+        # 可成交量在标的首次下单时才计算，开盘持仓量只记录当日有行情的持仓标的，
+        # 每根bar的开销与持仓及交易的标的数量相关，而与全市场的标的数量无关
+        self.__volumeLeft = LazyVolumeLeft(bars, self.__volumeLimit)
+        self.__volumeUsed = defaultdict(float)
 
-            #volumeBegin[instrument] = copy.deepcopy(broker_.getPositions().get(instrument))
-            if volumeBegin[instrument] == None:
-                volumeBegin[instrument] = 0
-            #self.__logger.info("%s, original volume can use to sell today is %s" %(instrument, volumeBegin[instrument]))
-            
-        self.__volumeLeft = volumeLeft
-        self.__volume_at_begin = copy.deepcopy(volumeBegin)
+        """
+        每天开盘时持仓量的更新
+        """
+        self.__volume_at_begin = {
+            instrument: quantity for instrument, quantity in broker_.getPositions().items()
+            if instrument in bars
+        }
 
         if self.__trade_rule != TradeRule.NEVER:
             self.__sell_at_bar = {}
@@ -636,44 +649,19 @@ class CommonFillStrategyV2(CommonFillStrategy):
     volume保留到小数点后两位，需要做整百处理
     """
 
+    @profiled('broker.fill_strategy.onBars')
     def onBars(self, broker_, bars):
-        volumeLeft = {}
-        volumeBegin = {}
-
-        for instrument in bars.getInstruments():
-            bar = bars[instrument]
-            # Reset the volume available for each instrument.
-            # if bar.getFrequency() == wk_pyalgotrade.bar.Frequency.TRADE:
-            if bar.getFrequency() == Frequency.TRADE:
-                volumeLeft[instrument] = bar.getVolume() * 100
-            elif self.__volumeLimit is not None:
-                # We can't round here because there is no order to request the instrument traits.
-                """
-                最大可成交数量计算
-                """
-                volumeLeft[instrument] = bar.getVolume() * self.__volumeLimit * 100
-
-                """
-                进行整百处理, chenxiangdong, 20170723
-                """
-                volumeLeft[instrument] = round_100_shares(volumeLeft[instrument])
-                # self.__logger.info("%s input volume is %s, real useful volume is %s" %(instrument,bar.getVolume()*100,volumeLeft[instrument]))
+        # 可成交量在标的首次下单时才计算，开盘持仓量只记录当日有行情的持仓标的
+        self.__volumeLeft = LazyVolumeLeft(bars, self.__volumeLimit)
+        self.__volumeUsed = defaultdict(float)
 
-            # Reset the volume used for each instrument.
-            self.__volumeUsed[instrument] = 0.0
-
-            """
-            每天开盘时持仓量的更新
-            """
-            # volumeBegin[instrument] = broker_.getPositions().get(instrument)
-            volumeBegin[instrument] = broker_.get_quantity(instrument)
-            # volumeBegin[instrument] = copy.deepcopy(broker_.getPositions().get(instrument))
-            if volumeBegin[instrument] == None:
-                volumeBegin[instrument] = 0
-            # self.__logger.info("%s, original volume can use to sell today is %s" %(instrument, volumeBegin[instrument]))
-
-        self.__volumeLeft = volumeLeft
-        self.__volume_at_begin = copy.deepcopy(volumeBegin)
+        """
+        每天开盘时持仓量的更新
+        """
+        self.__volume_at_begin = {
+            instrument: broker_.get_quantity(instrument) for instrument in broker_.get_positions()
+            if instrument in bars
+        }
 
         if self.__trade_rule != TradeRule.NEVER:
             self.__sell_at_bar = {}
@@ -1032,11 +1020,11 @@ class IntraDayFillStrategy(DefaultStrategy):
         self.__logger = logger.getLogger(self.LOGGER_NAME, disable=True)
 
     def init_volume_at_begin(self, broker_, bars):
-        volume_begin = {}
-        for instrument in bars.getInstruments():
-            # 每天开盘时持仓量的更新
-            volume_begin[instrument] = broker_.getPositions().get(instrument, 0)
-        self.__volume_at_begin = copy.deepcopy(volume_begin)
+        # 每天开盘时持仓量的更新，只记录当日有行情的持仓标的
+        self.__volume_at_begin = {
+            instrument: quantity for instrument, quantity in broker_.getPositions().items()
+            if instrument in bars
+        }
 
     @property
     def sell_volume(self):
@@ -1059,34 +1047,12 @@ class IntraDayFillStrategy(DefaultStrategy):
     A股成交量的单位为手，处理时需要乘以100   chenxiangdong 20170719
     volume保留到小数点后两位，需要做整百处理
     """
+    @profiled('broker.fill_strategy.onBars')
     def onBars(self, broker_, bars):
-        volume_left = {}
-
-        for instrument in bars.getInstruments():
-            bar = bars[instrument]
-            # Reset the volume available for each instrument.
-            # if bar.getFrequency() == wk_pyalgotrade.bar.Frequency.TRADE:
-            if bar.getFrequency() == Frequency.TRADE:
-                volume_left[instrument] = bar.getVolume() * 100
-            elif self.__volumeLimit is not None:
-                # We can't round here because there is no order to request the instrument traits.
-                """
-                最大可成交数量计算
-                """
-                volume_left[instrument] = bar.getVolume() * self.__volumeLimit * 100
-
-                """
-                进行整百处理, chenxiangdong, 20170723
-                """
-                volume_left[instrument] = round_100_shares(volume_left[instrument])
-                # self.__logger.info("%s input volume is %s, real useful volume is %s" %(instrument,bar.getVolume()*100,volumeLeft[instrument]))
-
-            # Reset the volume used for each instrument.
-            self.__volumeUsed[instrument] = 0.0
-
-            # 不更新volume_at_begin，因为目前不支持T0
-
-        self.__volumeLeft = volume_left
+        # 可成交量在标的首次下单时才计算
+        self.__volumeLeft = LazyVolumeLeft(bars, self.__volumeLimit)
+        self.__volumeUsed = defaultdict(float)
+        # 不更新volume_at_begin，因为目前不支持T0
 
     def getVolumeLeft(self):
         return self.__volumeLeft
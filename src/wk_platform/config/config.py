@@ -64,7 +64,16 @@ class StrategyConfiguration:
                  detailed_position_track_level: TrackLevel | str = TrackLevel.TRADE_DAY,
                  position_track_level: TrackLevel | str =TrackLevel.TRADE_DAY,
                  calendar='a_share_market',
-                 profile_runtime=True):
+                 profile_runtime=False,
+                 profile_memory=False,
+                 columnar_feed=False,
+                 batch_rebalance=False,
+                 feed_cache=False,
+                 feed_workers=1,
+                 feed_executor='process',
+                 track_spill_dir=None,
+                 metric_groups=None,
+                 analyzer_workers=1):
         """
         Parameters
         ==================
@@ -126,7 +135,25 @@ class StrategyConfiguration:
         calendar: str
             回测使用的日历，默认a_share
         profile_runtime: bool
-            是否追踪运行性能
+            是否追踪运行性能，开启后在回测结果中增加“运行性能”表，记录行情加载、broker、策略、指标计算等阶段的耗时，默认关闭
+        profile_memory: bool
+            追踪运行性能时是否同时记录各阶段的内存分配，开启后运行速度明显下降，默认关闭
+        columnar_feed: bool
+            是否使用列式存储的行情feed，开启后按需生成bar对象，可降低加载时间和内存占用，默认关闭
+        batch_rebalance: bool
+            是否使用向量化的批量调仓，开启后按调仓前总资产一次性计算全部订单，仅适用于纯股票多头持仓，默认关闭
+        feed_cache: bool
+            是否将预处理后的行情数据缓存到数据目录下，数据更新后缓存自动失效，默认关闭
+        feed_workers: int | None
+            准备行情feed时各数据集的并发数，None表示每个数据集一个worker，默认为1即顺序准备
+        feed_executor: str
+            并发准备行情feed时使用的执行器，'process' 或 'thread'。h5格式的数据不是线程安全的，默认为'process'
+        track_spill_dir: str | None
+            持仓跟踪记录的落盘目录，设置后每日持仓等记录按parquet行组写入该目录以降低内存占用，需要安装pyarrow，默认不落盘
+        metric_groups: list[MetricGroup | str] | None
+            回测结果中需要输出的指标分组，未列出分组的指标及其依赖的计算和记录转换均不执行，默认输出全部指标
+        analyzer_workers: int | None
+            计算回测指标时相互独立的算子的并行线程数，None表示取算子数与CPU核数的较小值，默认为1即顺序计算
         """
 
         if isinstance(max_up_down_limit, str):
@@ -229,6 +256,28 @@ class StrategyConfiguration:
         self.__calendar = calendar
 
         self.__profile_runtime = profile_runtime
+        self.__profile_memory = profile_memory
+
+        self.__columnar_feed = columnar_feed
+
+        self.__batch_rebalance = batch_rebalance
+
+        self.__feed_cache = feed_cache
+
+        if feed_executor not in ('thread', 'process'):
+            raise ValueError(f"Unsupported feed executor `{feed_executor}`")
+        self.__feed_workers = feed_workers
+        self.__feed_executor = feed_executor
+
+        self.__track_spill_dir = track_spill_dir
+
+        if metric_groups is not None:
+            metric_groups = frozenset(
+                MetricGroup[group.upper()] if isinstance(group, str) else MetricGroup(group) for group in metric_groups
+            )
+        self.__metric_groups = metric_groups
+
+        self.__analyzer_workers = analyzer_workers
 
         self.__version = __version__
 
@@ -376,6 +425,42 @@ class StrategyConfiguration:
     def profile_runtime(self):
         return self.__profile_runtime
 
+    @property
+    def profile_memory(self):
+        return self.__profile_memory
+
+    @property
+    def columnar_feed(self):
+        return self.__columnar_feed
+
+    @property
+    def batch_rebalance(self):
+        return self.__batch_rebalance
+
+    @property
+    def feed_cache(self):
+        return self.__feed_cache
+
+    @property
+    def feed_workers(self):
+        return self.__feed_workers
+
+    @property
+    def feed_executor(self):
+        return self.__feed_executor
+
+    @property
+    def track_spill_dir(self):
+        return self.__track_spill_dir
+
+    @property
+    def metric_groups(self) -> frozenset[MetricGroup] | None:
+        return self.__metric_groups
+
+    @property
+    def analyzer_workers(self):
+        return self.__analyzer_workers
+
 
 # class StrategyConfiguration:
 #     def __init__(self, *args, **kwargs):
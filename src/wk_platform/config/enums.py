@@ -54,6 +54,20 @@ class DatasetType(Enum):
 
 
 
+class MetricGroup(Enum):
+    """
+    回测结果中的指标分组
+    """
+    SUMMARY = 0     # 回测配置、策略指标
+    NET_VALUE = 1   # 策略净值
+    DRAW_DOWN = 2   # 回撤指标、回撤详情
+    YEARLY = 3      # 年度表现、年频净值截面、年频涨跌幅
+    MONTHLY = 4     # 分月度表现、月频涨跌幅、月频净值截面
+    WEEKLY = 5      # 周频涨跌幅
+    RECORDS = 6     # 交易流水、未成交记录、每日持仓、详细持仓、个股跟踪
+    CUSTOM = 7      # 自定义跟踪记录
+
+
 class CalendarType(Enum):
     A_SHARE_MARKET = 0  # 使用A股交易日历
     A_AME = 1           # 使用A股美股交易日的并集
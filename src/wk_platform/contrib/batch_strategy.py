@@ -6,19 +6,61 @@ import pandas as pd
 
 from wk_platform import __version__
 from wk_platform.backtest import strategyOutput
+from wk_platform.backtest.benchmark import BenchmarkCache
+from wk_platform.util.profiler import runtime_profiler
 from wk_platform.config import HedgeStrategyConfiguration
 
 from wk_platform.backtest.result import BackTestResult, BackTestResultSet
+from wk_platform.contrib.util import fork_map, first_weight_date
 from wk_util.logger import console_log
 from wk_util.file_digest import md5
 
 
+def _run_batch_backtest(name, context):
+    """
+    执行批量回测中的单个权重文件，供BatchExecutor在当前进程或fork出的子进程中调用
+    """
+    strategy_cls = context['strategy_cls']
+    feed = context['feed']
+    begin_date, end_date = context['begin_date'], context['end_date']
+    config = context['config']
+    datVal = context['weights'][name].copy()
+
+    datVal['date'] = pd.to_datetime(datVal['date'], format='%Y%m%d')
+    datVal['date'] = [datetime.datetime.strftime(x, '%Y%m%d') for x in datVal['date']]
+    datVal = datVal[(datVal['date'] >= begin_date) & (datVal['date'] <= end_date)]
+
+    """
+    设定起始日期为首行日期
+    """
+    begin_date = datVal['date'].iloc[0]
+    try:
+        weight_strategy = strategy_cls(feed, datVal, begin_date, end_date, config,
+                                       ext_status_data=context['ext_status_data'],
+                                       mr_map=context['mr_map'], sign=context['signs'][name])
+        with runtime_profiler(config):
+            output = strategyOutput.StrategyOutput(weight_strategy, begin_date, end_date, config=config,
+                                                   bench_cache=context['bench_cache'])
+            output.pre_process()
+            weight_strategy.run()
+            output.bench_process()
+            output.post_process()
+            # 批量回测的结果需要返回或跨进程传递，在重置feed前计算全部指标，不再持有策略对象
+            result = output.result.materialize()
+        return result
+    finally:
+        feed.reset()
+
+
 class BatchExecutor:
     """
     批量执行权重回测的策略
+
+    max_process大于1时使用多进程执行，子进程通过fork共享已准备好的feed，执行失败的文件记录在result_set.errors中
     """
     def __init__(self, strategy_cls, files, begin_date, end_date=None, config=HedgeStrategyConfiguration(), max_process=1):
         console_log('platform version:', __version__)
+        self.__max_process = max_process
         self.__strategy_cls = strategy_cls.strategy_class()
         console_log('using strategy', self.__strategy_cls.strategy_name())
 
@@ -62,33 +104,29 @@ class BatchExecutor:
         feed, ext_status_df, mr_map = self.__strategy_cls.prepare_feed(begin_date, end_date,
                                                                        self.__get_instruments(),
                                                                        self.__config)
-
-        for name, weight_df in self.__weights.items():
-            datVal = weight_df
-
-            datVal['date'] = pd.to_datetime(datVal['date'], format='%Y%m%d')
-            datVal['date'] = [datetime.datetime.strftime(x, '%Y%m%d') for x in datVal['date']]
-            datVal = datVal[(datVal['date'] >= begin_date) & (datVal['date'] <= end_date)]
-
-            """
-            设定起始日期为首行日期
-            """
-            try:
-                tmp = datVal['date']
-                begin_date = tmp.iloc[0]
-                weight_strategy = self.__strategy_cls(feed, datVal, begin_date, end_date, self.__config,
-                                                      ext_status_data=ext_status_df.to_dict(orient="records"),
-                                                      mr_map=mr_map, sign=self.__signs[name])
-                output = strategyOutput.StrategyOutput(weight_strategy, begin_date, end_date, config=self.__config)
-                output.pre_process()
-                weight_strategy.run()
-                output.bench_process()
-                output.post_process()
-                self.__result_set[name] = output.result
-            except Exception as e:
-                console_log('in weight data', name, 'exception raised', e)
-            finally:
-                feed.reset()
+        # 在fork之前载入指数净值，子进程共享同一份
+        bench_cache = BenchmarkCache()
+        bench_cache.prefill([first_weight_date(w, begin_date, end_date) for w in self.__weights.values()],
+                            end_date, self.__config)
+        context = {
+            'strategy_cls': self.__strategy_cls,
+            'feed': feed,
+            'weights': self.__weights,
+            'signs': self.__signs,
+            'ext_status_data': ext_status_df.to_dict(orient="records"),
+            'mr_map': mr_map,
+            'begin_date': begin_date,
+            'end_date': end_date,
+            'config': self.__config,
+            'bench_cache': bench_cache
+        }
+        results, errors = fork_map(_run_batch_backtest, self.__weights.keys(), context,
+                                   max_process=self.__max_process)
+        for name, result in results.items():
+            self.__result_set[name] = result
+        for name, msg in errors.items():
+            console_log('in weight data', name, 'exception raised', msg)
+            self.__result_set.add_error(name, msg)
 
     @property
     def result_set(self) -> BackTestResultSet:
@@ -1,4 +1,4 @@
-from .weight_strategy import WeightStrategy, BatchWeightStrategy, WeightStrategyConfiguration
+from .weight_strategy import WeightStrategy, BatchWeightStrategy, WeightParameterSweep, WeightStrategyConfiguration
 from .hedge_strategy import HedgeStrategy, BatchHedgeStrategy
 from .weight_strategy_ex import WeightStrategyEx
 from .base_intra_day_strategy import IntraDayRatioStrategy, IntraDayRatioStrategyConfiguration
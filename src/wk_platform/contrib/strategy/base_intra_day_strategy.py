@@ -17,6 +17,7 @@ from pyalgotrade.bar import Frequency
 from wk_util.tqdm import tqdm
 from wk_platform import __version__
 from wk_platform.backtest import strategyOutput
+from wk_platform.util.profiler import runtime_profiler
 from wk_platform.config import  MaxUpDownType, PriceType, PositionCostType, TrackLevel
 from wk_platform.feed.fast_feed import StockFeed, StockIndexSynthETFFeed
 
@@ -77,30 +78,63 @@ def gen_intra_day_index_data(data: pd.DataFrame, intra_day_list):
     return final_data
 
 
-def build_intra_day_feeds(data: pd.DataFrame, intra_day_index_data, allow_synth=False, progress_bar=False):
-    feeds = OrderedDict()
-    data['date'] = data['trade_dt'].apply(lambda dt: dt[:8])
-    grouped_data = data.groupby('date')
-    console_log('load intra day bar')
-    for k, group in grouped_data:
-        if allow_synth:
+class IntraDayFeedSource:
+    """
+    按交易日生成日内feed
+
+    日内行情与指数行情各自按日期排序一次并记录每个交易日的区间，通过 source[date] 访问时才构建并解析当日的feed，
+    不保留已生成的feed，子策略运行结束后即可释放
+    """
+
+    def __init__(self, data: pd.DataFrame, intra_day_index_data: pd.DataFrame, allow_synth=False):
+        self.__allow_synth = allow_synth
+        self.__data, self.__data_range = self.__group(data)
+        self.__index_data, self.__index_range = self.__group(add_normal_ext_status(intra_day_index_data))
+
+    @staticmethod
+    def __group(data: pd.DataFrame):
+        data = data.assign(date=data['trade_dt'].str[:8]).sort_values('date', kind='stable')
+        dates = data['date'].to_numpy()
+        keys, starts = np.unique(dates, return_index=True)
+        stops = np.append(starts[1:], len(dates))
+        return data.reset_index(drop=True), dict(zip(keys, zip(starts, stops)))
+
+    def dates(self):
+        return list(self.__data_range.keys())
+
+    def __contains__(self, date):
+        return date in self.__data_range
+
+    def __len__(self):
+        return len(self.__data_range)
+
+    def __getitem__(self, date):
+        start, stop = self.__data_range[date]
+        if self.__allow_synth:
             feed = StockIndexSynthETFFeed(frequency=Frequency.TRADE)
         else:
             feed = StockFeed(frequency=Frequency.TRADE)
-        feed.add_stock_bars(group)
-        feeds[k] = feed
+        feed.add_stock_bars(self.__data.iloc[start:stop])
+        try:
+            start, stop = self.__index_range[date]
+        except KeyError:
+            return feed
+        group = self.__index_data.iloc[start:stop]
+        feed.add_index_bars(group)
+        if self.__allow_synth:
+            feed.add_synth_index_etf_bars(group)
+        feed.prefetch()
+        return feed
 
-    intra_day_index_data['date'] = intra_day_index_data['trade_dt'].apply(lambda dt: dt[:8])
 
-    intra_day_index_data = add_normal_ext_status(intra_day_index_data)
-    grouped_data = intra_day_index_data.groupby('date')
-    for k, group in tqdm(grouped_data, disable=(not progress_bar)):
-        feeds[k].add_index_bars(group)
-        if allow_synth:
-            feeds[k].add_synth_index_etf_bars(group)
-        feeds[k].prefetch()
+def build_intra_day_feeds(data: pd.DataFrame, intra_day_index_data, allow_synth=False):
+    """
+    各交易日的日内feed，在访问时按需生成，见 IntraDayFeedSource
 
-    return feeds
+    构建时只对行情排序分组，不再逐日解析，因此不提供进度条，回测进度由策略的进度条显示
+    """
+    console_log('load intra day bar')
+    return IntraDayFeedSource(data, intra_day_index_data, allow_synth=allow_synth)
 
 
 def build_trans_actions(trans_df):
@@ -217,6 +251,8 @@ class IntraDayRatioStrategyBase(MidFreqBacktestingStrategy, TradeDayTrackerMixin
 
         self.__exec_intra_day = False
         self.__intra_day_strategy = None
+        # 最近一次日内子策略的最后时间点
+        self.__last_intra_day_dt = None
 
         # 有交易操作的交易日
         self.__trade_date = deque()
@@ -259,15 +295,15 @@ class IntraDayRatioStrategyBase(MidFreqBacktestingStrategy, TradeDayTrackerMixin
     def on_finish(self, bars):
         self.getBroker().simplify_position()
 
-        if self.__prev_trade_dt != self.__intra_day_strategy.current_dt_str:
+        if self.__prev_trade_dt != self.__last_intra_day_dt:
             win_ratio_dict = self.calc_win_ratio(bars)
             self.custom_analyzer.track('调仓胜率',
-                                       date_range=self.__prev_trade_dt + '-' + self.__intra_day_strategy.current_dt_str,
+                                       date_range=self.__prev_trade_dt + '-' + self.__last_intra_day_dt,
                                        **win_ratio_dict)
 
             ret_dict = self.calc_ret(bars)
             self.custom_analyzer.track('调仓收益率',
-                                       date_range=self.__prev_trade_dt + '-' + self.__intra_day_strategy.current_dt_str,
+                                       date_range=self.__prev_trade_dt + '-' + self.__last_intra_day_dt,
                                        **ret_dict)
 
         if self.__pbar:
@@ -381,17 +417,23 @@ class IntraDayRatioStrategyBase(MidFreqBacktestingStrategy, TradeDayTrackerMixin
         if len(self.__trade_date) > 0 and self.current_date_str == self.__trade_date[0]:
             self.__trade_date.popleft()
             # print(date_str)
+            # 当日的日内feed在此时生成，下一个调仓日更换feed后即可释放
             feed = self.__intra_day_feeds[self.current_date_str]
 
             self.__exec_intra_day = True
-            self.__intra_day_strategy = MidFreqIntraDaySubStrategy(feed, broker_cls=IntraDayBroker, config=self.__config)
-
-            self.__intra_day_strategy.register_hook('on_bars', lambda bars: self.__intra_day_change_position(bars))
-            self.__intra_day_strategy.switch_broker_status(self.broker, self.__intra_day_strategy.getBroker())
-            self.__intra_day_strategy.getBroker().init_fill_strategy(bars)
+            if self.__intra_day_strategy is None:
+                self.__intra_day_strategy = MidFreqIntraDaySubStrategy(feed, broker_cls=IntraDayBroker,
+                                                                      config=self.__config)
+                self.__intra_day_strategy.register_hook('on_bars', lambda bars: self.__intra_day_change_position(bars))
+                self.__intra_day_strategy.switch_broker_status(self.broker, self.__intra_day_strategy.getBroker())
+                self.__intra_day_strategy.getBroker().init_fill_strategy(bars)
+            else:
+                # 子策略及日内Broker只创建一次，之后的调仓日只更换feed并同步状态
+                self.__intra_day_strategy.reset(feed, self.broker.export_status(), bars)
             self.__intra_day_strategy.run()
             self.__intra_day_strategy.switch_broker_status(self.__intra_day_strategy.getBroker(), self.broker)
             self.__exec_intra_day = False
+            self.__last_intra_day_dt = self.__intra_day_strategy.current_dt_str
 
             # self.__change_position(bars)
             self.reset_stop_pnl_excluded()
@@ -408,6 +450,7 @@ class IntraDayRatioStrategyBase(MidFreqBacktestingStrategy, TradeDayTrackerMixin
         data = filter_market_data(data, instruments)
         ext_status_df = data[data['ext_status'] != ExtStatus.NORMAL.value].sort_values(by="trade_dt")
 
+        # 指数行情只读取一次，日线feed与日内feed共用
         index_data = wk_data.get('index_market', begin_date=begin_date, end_date=end_date)
         console_log("preparing feed...")
 
@@ -420,26 +463,18 @@ class IntraDayRatioStrategyBase(MidFreqBacktestingStrategy, TradeDayTrackerMixin
         if config.stop_pnl_replacement is None and not config.allow_synth_etf:
             feed = StockFeed()
             feed.add_stock_bars(data)
-
-            # index_data = ds.get_index_data(begin_date=begin_date, end_date=end_date)
-            index_data = wk_data.get('index_market', begin_date=begin_date, end_date=end_date)
             feed.add_index_bars(index_data)
         else:
 
             feed = StockIndexSynthETFFeed()
             feed.add_stock_bars(data)
 
-            # index_data = ds.get_index_data(begin_date=begin_date, end_date=end_date)
-            index_data = wk_data.get('index_market', begin_date=begin_date, end_date=end_date)
-            index_data = add_normal_ext_status(index_data)
+            index_data = add_normal_ext_status(index_data.copy())
             feed.add_index_bars(index_data)
             feed.add_synth_index_etf_bars(index_data)
 
         feed.prefetch(progress_bar=config.progress_bar)
-        # id_feed = StockFeed(frequency=Frequency.TRADE)
-        # id_feed.add_stock_bars(intra_day_data)
-        id_feeds = build_intra_day_feeds(intra_day_data, id_index_data, allow_synth=config.allow_synth_etf,
-                                         progress_bar=config.progress_bar)
+        id_feeds = build_intra_day_feeds(intra_day_data, id_index_data, allow_synth=config.allow_synth_etf)
 
         return feed, id_feeds, ext_status_df, mr_map, end_date
 
@@ -543,11 +578,12 @@ class IntraDayRatioStrategy:
             mr_map=self.__mr_map, sign=self.__sign
         )
 
-        output = strategyOutput.StrategyOutput(weight_strategy, begin_date, end_date, config=self.__config)
-        output.pre_process()
-        weight_strategy.run()
-        output.bench_process()
-        output.post_process()
+        with runtime_profiler(self.__config):
+            output = strategyOutput.StrategyOutput(weight_strategy, begin_date, end_date, config=self.__config)
+            output.pre_process()
+            weight_strategy.run()
+            output.bench_process()
+            output.post_process()
         self.__result = output.result
 
     @classmethod
@@ -13,6 +13,8 @@ from collections import OrderedDict
 from wk_platform import strategy
 from wk_platform import __version__
 from wk_platform.backtest import strategyOutput
+from wk_platform.backtest.benchmark import BenchmarkCache
+from wk_platform.util.profiler import runtime_profiler
 from wk_platform.config import HedgeStrategyConfiguration
 from wk_platform.util.future import FutureUtil
 
@@ -25,7 +27,7 @@ from wk_platform.feed.fast_feed import StockFutureFeed
 from wk_platform.broker.brokers import HedgeBroker
 import wk_util.logger
 import wk_db
-from wk_platform.contrib.util import check_weight_df
+from wk_platform.contrib.util import check_weight_df, fork_map, first_weight_date
 
 
 class HedgeStrategyBase(strategy.BacktestingStrategy):
@@ -630,11 +632,12 @@ class HedgeStrategy:
                                             ext_status_data=self.__ext_status_df.to_dict(orient="records"),
                                             mr_map=self.__mr_map, sign=self.__sign)
 
-        output = strategyOutput.StrategyOutput(weight_strategy, begin_date, end_date, config=self.__config)
-        output.pre_process()
-        weight_strategy.run()
-        output.bench_process()
-        output.post_process()
+        with runtime_profiler(self.__config):
+            output = strategyOutput.StrategyOutput(weight_strategy, begin_date, end_date, config=self.__config)
+            output.pre_process()
+            weight_strategy.run()
+            output.bench_process()
+            output.post_process()
         self.__result = output.result
 
     @classmethod
@@ -646,12 +649,51 @@ class HedgeStrategy:
         return self.__result
 
 
+def _run_batch_hedge_backtest(name, context):
+    """
+    执行批量回测中的单个权重文件，供BatchHedgeStrategy在当前进程或fork出的子进程中调用
+    """
+    feed = context['feed']
+    begin_date, end_date = context['begin_date'], context['end_date']
+    config = context['config']
+    datVal = context['weights'][name].copy()
+
+    datVal['date'] = pd.to_datetime(datVal['date'], format='%Y%m%d')
+    datVal['date'] = [datetime.datetime.strftime(x, '%Y%m%d') for x in datVal['date']]
+    datVal = datVal[(datVal['date'] >= begin_date) & (datVal['date'] <= end_date)]
+
+    """
+    设定起始日期为首行日期
+    """
+    begin_date = datVal['date'].iloc[0]
+    try:
+        weight_strategy = HedgeStrategyBase(feed, datVal, begin_date, end_date, config,
+                                            ext_status_data=context['ext_status_data'],
+                                            mr_map=context['mr_map'], sign=context['signs'][name])
+
+        with runtime_profiler(config):
+            output = strategyOutput.StrategyOutput(weight_strategy, begin_date, end_date, config=config,
+                                                   bench_cache=context['bench_cache'])
+            output.pre_process()
+            weight_strategy.run()
+            output.bench_process()
+            output.post_process()
+            # 批量回测的结果需要返回或跨进程传递，在重置feed前计算全部指标，不再持有策略对象
+            result = output.result.materialize()
+        return result
+    finally:
+        feed.reset()
+
+
 class BatchHedgeStrategy:
     """
     批量执行权重回测的策略
+
+    max_process大于1时使用多进程执行，子进程通过fork共享已准备好的feed，执行失败的文件记录在result_set.errors中
     """
     def __init__(self, files, begin_date, end_date=None, config=HedgeStrategyConfiguration(), max_process=1):
         console_log('platform version:', __version__)
+        self.__max_process = max_process
         self.__result_set = [None for f in files]
         self.__files = []
         for file in files:
@@ -699,34 +741,38 @@ class BatchHedgeStrategy:
         # print(instruments.index('603195.SH'))
         data = pd.DataFrame({"windcode": instruments}).merge(data, on="windcode")
         self.__ext_status_df = data[data['ext_status'] != ExtStatus.NORMAL.value].sort_values(by="trade_dt")
-        self.__feed = None # prepare_feed(data, self.__begin_date, self.__end_date, self.__config.progress_bar)
 
-    def run(self):
-        self.__prepare_feed()
-        begin_date, end_date = self.__begin_date, self.__end_date
-        for name, weight_df in self.__weights.items():
-            datVal = weight_df
-
-            datVal['date'] = pd.to_datetime(datVal['date'], format='%Y%m%d')
-            datVal['date'] = [datetime.datetime.strftime(x, '%Y%m%d') for x in datVal['date']]
-            datVal = datVal[(datVal['date'] >= begin_date) & (datVal['date'] <= end_date)]
+        self.__feed = StockFutureFeed()
+        self.__feed.add_stock_bars(data)
 
-            """
-            设定起始日期为首行日期
-            """
-            tmp = datVal['date']
-            begin_date = tmp.iloc[0]
-            weight_strategy = HedgeStrategyBase(self.__feed, datVal, begin_date, end_date, self.__config,
-                                                 ext_status_data=self.__ext_status_df.to_dict(orient="records"),
-                                                 mr_map=self.__mr_map, sign=self.__signs[name])
+        future_data = ds.get_spif_data(self.__config.code, begin_date, end_date)
+        self.__feed.add_future_bars(future_data)
+        self.__feed.prefetch(progress_bar=self.__config.progress_bar)
 
-            output = strategyOutput.StrategyOutput(weight_strategy, begin_date, end_date, config=self.__config)
-            output.pre_process()
-            weight_strategy.run()
-            output.bench_process()
-            output.post_process()
-            self.__result_set[name] = output.result
-            self.__feed.reset()
+    def run(self):
+        self.__prepare_feed()
+        # 在fork之前载入指数净值，子进程共享同一份
+        bench_cache = BenchmarkCache()
+        bench_cache.prefill([first_weight_date(w, self.__begin_date, self.__end_date)
+                             for w in self.__weights.values()], self.__end_date, self.__config)
+        context = {
+            'feed': self.__feed,
+            'weights': self.__weights,
+            'signs': self.__signs,
+            'ext_status_data': self.__ext_status_df.to_dict(orient="records"),
+            'mr_map': self.__mr_map,
+            'begin_date': self.__begin_date,
+            'end_date': self.__end_date,
+            'config': self.__config,
+            'bench_cache': bench_cache
+        }
+        results, errors = fork_map(_run_batch_hedge_backtest, self.__weights.keys(), context,
+                                   max_process=self.__max_process)
+        for name, result in results.items():
+            self.__result_set[name] = result
+        for name, msg in errors.items():
+            console_log('in weight data', name, 'exception raised', msg)
+            self.__result_set.add_error(name, msg)
 
     @property
     def result_set(self) -> BackTestResultSet:
@@ -0,0 +1,100 @@
+"""
+向量化的目标权重调仓计算
+
+以调仓前的总资产为基准，一次性计算全部标的的订单数量和执行顺序，
+计算逻辑与WeightStrategyBase中 close_long_position -> reduce_long_position -> open_long_position 的逐笔流程保持一致；
+停牌、涨跌停、无有效价格等无法执行的订单仍由券商的check_inst_status处理
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from enum import IntEnum
+
+import numpy as np
+
+
+class RebalancePhase(IntEnum):
+    """
+    订单执行阶段，与逐笔调仓的先卖后买顺序一致
+    """
+    CLOSE_LONG = 0
+    REDUCE_LONG = 1
+    OPEN_LONG = 2
+
+
+@dataclass
+class RebalancePlan:
+    """
+    调仓订单列表，各数组按执行顺序排列
+    index: 订单对应标的在输入数组中的位置
+    quantity: 带符号的订单数量，正数买入，负数卖出；无有效价格的订单数量无意义
+    valid_price: 是否有有效价格，没有时与逐笔调仓一致提交数量为空的订单
+    """
+    index: np.ndarray
+    quantity: np.ndarray
+    valid_price: np.ndarray
+
+    def __len__(self):
+        return len(self.index)
+
+
+def plan_rebalance(quantity, price, weight, in_target, ext_normal, total_equity,
+                   buy_price_ratio=1.0) -> RebalancePlan:
+    """
+    计算调仓订单
+
+    Parameters
+    ==================
+    quantity: np.ndarray
+        当前持仓数量
+    price: np.ndarray
+        下单价格，按配置的price_type取得
+    weight: np.ndarray
+        目标权重，不在目标持仓中的标的为0
+    in_target: np.ndarray[bool]
+        是否在目标持仓中
+    ext_normal: np.ndarray[bool]
+        扩展状态是否正常，非正常的标的不加仓
+    total_equity: float
+        调仓前总资产
+    buy_price_ratio: float
+        买入时对价格的放大比例，用于计入佣金
+    """
+    quantity = np.asarray(quantity, dtype=np.float64)
+    price = np.asarray(price, dtype=np.float64)
+    weight = np.asarray(weight, dtype=np.float64)
+    in_target = np.asarray(in_target, dtype=bool)
+
+    amount = quantity * price
+    weight_old = amount / total_equity
+
+    close_long = ~in_target & (quantity > 0)
+    reduce_long = in_target & (weight_old >= weight) & (weight_old > 0)
+    open_long = in_target & np.asarray(ext_normal, dtype=bool) & (weight > weight_old) & (weight_old >= 0)
+
+    valid_price = price != 0
+    cash_amount = total_equity * weight - amount
+    order_price = np.where(cash_amount > 0, price * buy_price_ratio, price)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight_quantity = np.floor_divide(cash_amount, np.where(valid_price, order_price, 1.0))
+    # 清仓时直接卖出全部持仓，避免舍入误差导致超卖
+    weight_quantity = np.where(weight == 0, -quantity, weight_quantity)
+
+    order_quantity = np.where(close_long, -quantity, weight_quantity)
+    by_weight = reduce_long | open_long
+    invalid_price = by_weight & ~valid_price
+
+    phase = np.full(len(quantity), -1, dtype=np.int8)
+    phase[close_long] = RebalancePhase.CLOSE_LONG
+    phase[reduce_long] = RebalancePhase.REDUCE_LONG
+    phase[open_long] = RebalancePhase.OPEN_LONG
+
+    selected = (phase >= 0) & ((order_quantity != 0) | invalid_price)
+
+    index = np.flatnonzero(selected)
+    index = index[np.argsort(phase[index], kind='stable')]
+    return RebalancePlan(
+        index=index,
+        quantity=order_quantity[index].astype(np.int64),
+        valid_price=~invalid_price[index]
+    )
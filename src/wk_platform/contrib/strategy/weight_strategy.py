@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import inspect
+import itertools
 import math
 
 from collections import deque
@@ -17,6 +18,7 @@ from collections import OrderedDict
 from dataclasses import dataclass
 from functools import partial
 
+from wk_platform import broker
 from wk_platform.broker.brokers.base_broker import Broker
 
 from wk_util.data import filter_data
@@ -27,6 +29,7 @@ from wk_util.tqdm import tqdm
 
 from wk_platform import __version__
 from wk_platform.backtest import strategyOutput
+from wk_platform.backtest.benchmark import BenchmarkCache
 
 from wk_platform.backtest.result import BackTestResult, BackTestResultSet
 from wk_platform.contrib.strategy.tracker_mixin import (
@@ -35,14 +38,14 @@ from wk_platform.contrib.strategy.tracker_mixin import (
     TradeDayRecord,
     TradeDayTrackerMixin
 )
-from wk_data.constants import ExtStatus
+from wk_data.constants import ExtStatus, SuspensionType
 from wk_util.logger import console_log
 from wk_util.file_digest import md5
 from wk_platform.feed.bar import SynthIndexETFBar, PositionDummyBar
 from wk_data.constants import BENCH_INDEX
 from wk_platform.strategy.low_frequency_strategy import LowFreqBacktestingStrategy
 import wk_db
-from wk_platform.contrib.util import check_weight_df, PreprocessorSeq
+from wk_platform.contrib.util import check_weight_df, PreprocessorSeq, fork_map, first_weight_date
 from wk_platform.util.data import align_calendar, add_normal_ext_status, filter_market_data
 
 from wk_platform.feed.mixed_feed import MixedFeed
@@ -52,12 +55,17 @@ from wk_platform.feed.parser import IndexDataRowParser
 from wk_platform.feed.parser import SyntheticIndexETFRowParser
 from wk_platform.feed.parser import FundNavDataRowParser
 # import wk_platform.util.data
-from wk_platform.config import StrategyConfiguration, PriceType, DatasetType, CalendarType
+from wk_platform.config import StrategyConfiguration, PriceType, DatasetType, CalendarType, MetricGroup
 
 from .weight_strategy_config import WeightStrategyConfiguration
+from .rebalance import plan_rebalance
 from ...broker.brokers.extend_broker import BrokerV2
 from ...feed.strategy_feed import FeedRegistry
+from ...feed.feed_cache import FeedCache
 from ...util.future import FutureUtil
+from ...util.profiler import profiled, runtime_profiler
+from ...strategy.checkpoint import StrategySnapshot, take_snapshot, restore_snapshot
+from ...strategy.position import LongPosition, ShortPosition, DummyPosition
 
 
 class WeightStrategyBase(LowFreqBacktestingStrategy, TradeDayTrackerMixin):
@@ -98,9 +106,40 @@ class WeightStrategyBase(LowFreqBacktestingStrategy, TradeDayTrackerMixin):
             self.getBroker().register_hook(BrokerV2.Hook.MARGIN_CALL, self.margin_call_handler)
             # self.getBroker().register_hook(BrokerV2.Hook.MATURITY, self.transform_maturities)
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # 进度条不参与状态快照
+        state['_WeightStrategyBase__pbar'] = None
+        return state
+
     def get_trade_date(self):
         return self.__buy_date
 
+    def extend(self, end_date, ext_status_data=None, weight=None):
+        """
+        从状态快照恢复后延长回测区间
+
+        Parameters
+        ==================
+        end_date: str
+            新的结束日期
+        ext_status_data: list[dict] | None
+            快照之后交易日的特殊状态记录
+        weight: pd.DataFrame | None
+            快照之后交易日的调仓权重，date列为 yyyymmdd 格式的字符串
+        """
+        super().extend(end_date, ext_status_data)
+        if weight is None or weight.empty:
+            return
+        # 原回测的权重表中可能已包含快照之后的调仓日（如end_date默认为下一个交易日），这些日期不再重复添加
+        weight = weight[(weight['date'] > self.current_date_str) & ~weight['date'].isin(set(self.__weight['date']))]
+        if weight.empty:
+            return
+        self.__weight = pd.concat([self.__weight, weight], ignore_index=True)
+        new_date = sorted(set(weight['date']))
+        self.__buy_date += new_date
+        self.__trade_date.extend(new_date)
+
     def close_long_position(self, bars, target_position):
         """
         清仓不在目标持仓表中的多头仓位
@@ -189,6 +228,61 @@ class WeightStrategyBase(LowFreqBacktestingStrategy, TradeDayTrackerMixin):
             if weight < weight_old <= 0:
                 self.enterLongShortWeight(bars, inst, weight, False, False)
 
+    def batch_rebalance(self, bars, target_position):
+        """
+        向量化批量调仓，以调仓前总资产一次性计算全部订单数量后按先卖后买的顺序逐笔提交
+        订单与逐笔调仓一样通过Position提交，停牌、涨跌停、无有效价格由券商的check_inst_status撤单并记录；
+        与逐笔调仓的区别仅在于买入数量按调仓前而不是当前的总资产计算，调仓过程中支付的佣金和印花税不影响后续订单
+        仅支持BrokerV2下的纯股票多头持仓，不满足条件时返回False，由调用方回退到逐笔调仓
+        """
+        broker_ = self.getBroker()
+        if not isinstance(broker_, BrokerV2):
+            return False
+        if len(broker_.get_future_list()) > 0:
+            return False
+        for inst, weight in target_position.items():
+            if weight < 0 or FutureUtil.is_index_future(inst):
+                return False
+
+        positions = broker_.get_stock_dict()
+        instruments = [inst for inst in positions.keys() if inst not in target_position]
+        instruments.extend(target_position.keys())
+
+        quantity = np.empty(len(instruments))
+        price = np.empty(len(instruments))
+        ext_normal = np.empty(len(instruments), dtype=bool)
+        for i, inst in enumerate(instruments):
+            position = positions.get(inst)
+            quantity[i] = 0 if position is None else position.quantity
+            bar = bars[inst]
+            price[i] = bar.get_price(self.__config.price_type)
+            ext_normal[i] = bar.ext_status == ExtStatus.NORMAL
+        if np.any(quantity < 0):
+            return False
+
+        weight = np.fromiter((target_position.get(inst, 0) for inst in instruments), dtype=np.float64,
+                             count=len(instruments))
+        in_target = np.fromiter((inst in target_position for inst in instruments), dtype=bool,
+                                count=len(instruments))
+
+        buy_price_ratio = 1.0
+        if self.__config.price_with_commission:
+            buy_price_ratio += self.__config.commission.percentage
+
+        plan = plan_rebalance(quantity, price, weight, in_target, ext_normal,
+                              broker_.get_total_equity(), buy_price_ratio)
+
+        for i, order_quantity, valid_price in zip(plan.index, plan.quantity.tolist(), plan.valid_price):
+            inst = instruments[i]
+            if not valid_price:
+                # 与enterLongShortWeight一致，以空数量的买单记录
+                DummyPosition(self, bars, inst, None, None, None, False, False)
+            elif order_quantity > 0:
+                LongPosition(self, bars, inst, None, None, order_quantity, False, False)
+            else:
+                ShortPosition(self, bars, inst, None, None, -order_quantity, False, False)
+        return True
+
     def margin_call_handler(self, bars, current_cash, cash_requirement):
         required_weight = (cash_requirement - current_cash) / self.getBroker().get_total_equity()
         cash_weight = current_cash / self.getBroker().get_total_equity()
@@ -275,6 +369,7 @@ class WeightStrategyBase(LowFreqBacktestingStrategy, TradeDayTrackerMixin):
 
         return target_position
 
+    @profiled('strategy.rebalance')
     def __change_position(self, bars):
         """
         按照权重调仓
@@ -297,21 +392,22 @@ class WeightStrategyBase(LowFreqBacktestingStrategy, TradeDayTrackerMixin):
                                        date_range=self.__prev_trade_date + '-' + date_str,
                                        **ret_dict)
 
-        shares_value = self.getBroker().getSharesValue()
-
-        # 此处依照先卖后买的基本顺序
-        # 清仓不在目标持仓中的股票
-        self.close_long_position(bars, target_position)
+        # 调仓期间总资产由券商增量维护，避免每笔订单全量重算持仓市值
+        with self.getBroker().rebalance_scope() as shares_value:
+            if not (self.__config.batch_rebalance and self.batch_rebalance(bars, target_position)):
+                # 此处依照先卖后买的基本顺序
+                # 清仓不在目标持仓中的股票
+                self.close_long_position(bars, target_position)
 
-        # 先多头减仓，以最大化可用现金
-        self.reduce_long_position(bars, target_position)
-        self.close_short_position(bars, target_position)
+                # 先多头减仓，以最大化可用现金
+                self.reduce_long_position(bars, target_position)
+                self.close_short_position(bars, target_position)
 
-        self.reduce_short_position(bars, target_position)
+                self.reduce_short_position(bars, target_position)
 
-        # 最后对要买入的进行处理
-        self.open_short_position(bars, target_position)
-        self.open_long_position(bars, target_position)
+                # 最后对要买入的进行处理
+                self.open_short_position(bars, target_position)
+                self.open_long_position(bars, target_position)
 
         total_amount = self.getBroker().long_amount + self.getBroker().short_amount
 
@@ -425,6 +521,7 @@ class WeightStrategyBase(LowFreqBacktestingStrategy, TradeDayTrackerMixin):
         return "WeightStrategy"
 
 
+@profiled('feed.build')
 def prepare_feed(begin_date, end_date, instruments, config):
     console_log("preparing feed...")
 
@@ -433,7 +530,8 @@ def prepare_feed(begin_date, end_date, instruments, config):
     calendar = wk_data.get('trade_calendar', begin_date=begin_date, end_date=end_date, calendar=config.calendar)
     align_func = partial(align_calendar, calendar=calendar)
 
-    feed = MixedFeed()
+    cache = FeedCache(calendar=config.calendar) if config.feed_cache else None
+    feed = MixedFeed(columnar=config.columnar_feed, cache=cache)
     max_time_list = []
 
     for dataset in config.datasets:
@@ -444,7 +542,7 @@ def prepare_feed(begin_date, end_date, instruments, config):
                                      preprocessor=PreprocessorSeq(
                                          partial(filter_market_data, instruments=instruments),
                                          align_func
-                                     ))
+                                     ), cache_tag=instruments)
             max_time_list.append(max_time)
             data = feed.get_processed_data('a_share_market')
             ext_status_df = data[data['ext_status'] != ExtStatus.NORMAL.value].sort_values(by="trade_dt")
@@ -502,6 +600,7 @@ def prepare_feed(begin_date, end_date, instruments, config):
 
 #
 
+@profiled('feed.build')
 def incremental_prepare_feed(feed: MixedFeed, end_date, instruments, config):
     console_log("add feed...")
 
@@ -552,7 +651,7 @@ class WeightStrategy:
     """
 
     def __init__(self, weight, begin_date, end_date=None, config=WeightStrategyConfiguration(),
-                 is_tag=False, tqdm_cls=tqdm, user_benchmark=None, broker_cls=Broker):
+                 is_tag=False, tqdm_cls=tqdm, user_benchmark=None, broker_cls=Broker, checkpoint=False):
         """
         Parameters
         ----------
@@ -567,6 +666,9 @@ class WeightStrategy:
 
         config: StrategyConfiguration
             策略配置类
+
+        checkpoint: bool
+            是否在回测结束时保存状态快照，之后可以通过 WeightStrategy.resume 从快照继续回测新增的交易日
         """
         console_log('platform version:', __version__)
         if is_tag:
@@ -594,6 +696,8 @@ class WeightStrategy:
         console_log("backtest range:", self.__begin_date, self.__end_date)
 
         self.__broker_cls = broker_cls
+        self.__checkpoint = checkpoint
+        self.__snapshot = None
 
     def instruments(self):
         dat_val = self.__weight_df
@@ -615,10 +719,12 @@ class WeightStrategy:
             instruments = instruments + ext_instrument
         return instruments
 
-    def __prepare_feed(self):
-        weight_df = self.__weight_df
-        instruments = weight_df['windcode'].unique().tolist()
-        feed_registry = FeedRegistry(self.__begin_date, self.__end_date, config=self.__config)
+    def __prepare_feed(self, begin_date=None, instruments=None):
+        if begin_date is None:
+            begin_date = self.__begin_date
+        if instruments is None:
+            instruments = self.__weight_df['windcode'].unique().tolist()
+        feed_registry = FeedRegistry(begin_date, self.__end_date, config=self.__config)
         for data_name in self.__config.datasets:
             if DatasetType[data_name.upper()] == DatasetType.A_SHARE_MARKET \
                     or DatasetType[data_name.upper()] == DatasetType.A_SHARE_MARKET_VWAP_M15 \
@@ -628,49 +734,166 @@ class WeightStrategy:
             else:
                 feed_registry.register(data_name)
 
-        self.__feed, self.__ext_status_df = feed_registry.build_feed()
+        self.__feed, self.__ext_status_df = feed_registry.build_feed(max_workers=self.__config.feed_workers,
+                                                                     executor=self.__config.feed_executor)
 
     def run(self, feed=None, ext_status_df=None):
-        if feed is None:
-            self.__prepare_feed()
-        else:
-            self.__feed, self.__ext_status_df = feed, ext_status_df
-
-        begin_date, end_date = self.__begin_date, self.__end_date
-        dat_val = self.__weight_df
-
-        dat_val['date'] = pd.to_datetime(dat_val['date'], format='%Y%m%d')
-        dat_val['date'] = [datetime.datetime.strftime(x, '%Y%m%d') for x in dat_val['date']]
-        dat_val = dat_val[(dat_val['date'] >= begin_date) & (dat_val['date'] <= end_date)]
-
-        # 设定起始日期为首行日期
-        tmp = dat_val['date']
-        begin_date = tmp.iloc[0]
-        weight_strategy = WeightStrategyBase(self.__feed, dat_val, begin_date, end_date, self.__config,
-                                             ext_status_data=self.__ext_status_df.to_dict(orient="records"),
-                                             sign=self.__sign,
-                                             tqdm_cls=self.__tqdm_cls, broker_cls=self.__broker_cls)
-
-        output = strategyOutput.StrategyOutput(weight_strategy, begin_date, end_date,
-                                               config=self.__config, user_benchmark=self.__user_benchmark)
-        output.pre_process()
-        weight_strategy.run()
+        with runtime_profiler(self.__config):
+            if feed is None:
+                self.__prepare_feed()
+            else:
+                self.__feed, self.__ext_status_df = feed, ext_status_df
+
+            begin_date, end_date = self.__begin_date, self.__end_date
+            dat_val = self.__weight_df
+
+            dat_val['date'] = pd.to_datetime(dat_val['date'], format='%Y%m%d')
+            dat_val['date'] = [datetime.datetime.strftime(x, '%Y%m%d') for x in dat_val['date']]
+            dat_val = dat_val[(dat_val['date'] >= begin_date) & (dat_val['date'] <= end_date)]
+
+            # 设定起始日期为首行日期
+            tmp = dat_val['date']
+            begin_date = tmp.iloc[0]
+            weight_strategy = WeightStrategyBase(self.__feed, dat_val, begin_date, end_date, self.__config,
+                                                 ext_status_data=self.__ext_status_df.to_dict(orient="records"),
+                                                 sign=self.__sign,
+                                                 tqdm_cls=self.__tqdm_cls, broker_cls=self.__broker_cls)
+
+            output = strategyOutput.StrategyOutput(weight_strategy, begin_date, end_date,
+                                                   config=self.__config, user_benchmark=self.__user_benchmark)
+            output.pre_process()
+            weight_strategy.run(finish=not self.__checkpoint)
+            self.__finish(weight_strategy, output, {
+                'begin_date': begin_date,
+                'instruments': dat_val['windcode'].unique().tolist(),
+                'config': self.__config
+            })
+
+    def __finish(self, weight_strategy, output, meta):
+        if self.__checkpoint:
+            # 快照需在onFinish之前保存，onFinish中的收尾操作在恢复后的最后一个交易日再执行
+            self.__snapshot = take_snapshot(weight_strategy, output, meta=meta)
+            weight_strategy.finish()
         output.bench_process()
         output.post_process()
         self.__result = output.result
 
+    @classmethod
+    def resume(cls, snapshot: StrategySnapshot | str | pathlib.Path, end_date=None, weight=None,
+               checkpoint=True, tqdm_cls=tqdm) -> WeightStrategy:
+        """
+        从状态快照继续回测至end_date，只加载并运行快照之后新增交易日的行情
+
+        Parameters
+        ==================
+        snapshot: StrategySnapshot | str | pathlib.Path
+            状态快照，或 StrategySnapshot.dump 保存的文件
+        end_date: str | None
+            新的结束日期，yyyymmdd 格式的日期字符串
+        weight: pd.DataFrame | str | None
+            包含新增交易日调仓权重的权重列表，快照及之前日期的记录被忽略，None表示之后不再调仓
+        checkpoint: bool
+            是否在回测结束时保存新的状态快照
+
+        Returns
+        ==================
+        WeightStrategy，result为从原起始日期至end_date的完整回测结果
+        """
+        if not isinstance(snapshot, StrategySnapshot):
+            snapshot = StrategySnapshot.load(snapshot)
+        if weight is None:
+            weight = pd.DataFrame({'date': pd.Series(dtype=str), 'windcode': pd.Series(dtype=str),
+                                   'weight': pd.Series(dtype=float)})
+        strategy = cls(weight, snapshot.meta['begin_date'], end_date, config=snapshot.meta['config'],
+                       tqdm_cls=tqdm_cls, checkpoint=checkpoint)
+        strategy.__resume(snapshot)
+        return strategy
+
+    def __resume(self, snapshot: StrategySnapshot):
+        with runtime_profiler(self.__config):
+            last_date = snapshot.last_date
+            console_log('resume from snapshot:', last_date)
+            dat_val = self.__weight_df
+            if not dat_val.empty:
+                dat_val['date'] = pd.to_datetime(dat_val['date'], format='%Y%m%d')
+                dat_val['date'] = [datetime.datetime.strftime(x, '%Y%m%d') for x in dat_val['date']]
+            dat_val = dat_val[(dat_val['date'] > last_date) & (dat_val['date'] <= self.__end_date)]
+
+            instruments = list(dict.fromkeys(snapshot.meta['instruments'] + dat_val['windcode'].unique().tolist()))
+            # 从快照的最后一个交易日开始加载，使新增交易日的缺失行情可以按之前的行情填充，之后再删除该交易日
+            self.__prepare_feed(begin_date=last_date, instruments=instruments)
+            self.__feed.drop_until(last_date)
+            ext_status_df = self.__ext_status_df
+            if not ext_status_df.empty:
+                ext_status_df = ext_status_df[ext_status_df['trade_dt'] > last_date]
+
+            weight_strategy, (output, ) = restore_snapshot(snapshot, self.__feed)
+            weight_strategy.extend(self.__end_date, ext_status_data=ext_status_df.to_dict(orient="records"),
+                                   weight=dat_val)
+            output.extend(self.__end_date)
+            weight_strategy.resume(finish=not self.__checkpoint)
+            self.__finish(weight_strategy, output, {
+                **snapshot.meta,
+                'instruments': instruments
+            })
+
     @classmethod
     def strategy_class(cls):
         return WeightStrategyBase
 
+    @property
+    def snapshot(self) -> StrategySnapshot | None:
+        """
+        回测结束时的状态快照，未开启checkpoint时为None
+        """
+        return self.__snapshot
+
     @property
     def result(self) -> BackTestResult:
         return self.__result
 
 
+def _run_batch_weight_backtest(name, context):
+    """
+    执行批量回测中的单个权重文件，供BatchWeightStrategy在当前进程或fork出的子进程中调用
+    """
+    feed = context['feed']
+    begin_date, end_date = context['begin_date'], context['end_date']
+    config = context['config']
+    dat_val = context['weights'][name].copy()
+
+    dat_val['date'] = pd.to_datetime(dat_val['date'], format='%Y%m%d')
+    dat_val['date'] = [datetime.datetime.strftime(x, '%Y%m%d') for x in dat_val['date']]
+    dat_val = dat_val[(dat_val['date'] >= begin_date) & (dat_val['date'] <= end_date)]
+
+    """
+    设定起始日期为首行日期
+    """
+    begin_date = dat_val['date'].iloc[0]
+    try:
+        weight_strategy = WeightStrategyBase(feed, dat_val, begin_date, end_date, config,
+                                             ext_status_data=context['ext_status_data'],
+                                             sign=context['signs'][name])
+
+        with runtime_profiler(config):
+            output = strategyOutput.StrategyOutput(weight_strategy, begin_date, end_date, config=config,
+                                                   bench_cache=context['bench_cache'])
+            output.pre_process()
+            weight_strategy.run()
+            output.bench_process()
+            output.post_process()
+            # 批量回测的结果需要返回或跨进程传递，在重置feed前计算全部指标，不再持有策略对象
+            result = output.result.materialize()
+        return result
+    finally:
+        feed.reset()
+
+
 class BatchWeightStrategy:
     """
     批量执行权重回测的策略
+
+    max_process大于1时使用多进程执行，子进程通过fork共享已准备好的feed，执行失败的文件记录在result_set.errors中
     """
 
     def __init__(self, files, begin_date, end_date=None, config=WeightStrategyConfiguration(), max_process=1):
@@ -709,42 +932,240 @@ class BatchWeightStrategy:
             instruments += weight_df['windcode'].unique().tolist()
         instruments = list(set(instruments))
 
-        self.__feed, self.__ext_status_df = WeightStrategyBase.prepare_feed(
+        self.__feed, self.__ext_status_df = prepare_feed(
             self.__begin_date, self.__end_date,
             instruments=instruments, config=self.__config
         )
 
     def run(self):
         self.__prepare_feed()
-        begin_date, end_date = self.__begin_date, self.__end_date
-        for name, weight_df in self.__weights.items():
-            try:
-                dat_val = weight_df
-
-                dat_val['date'] = pd.to_datetime(dat_val['date'], format='%Y%m%d')
-                dat_val['date'] = [datetime.datetime.strftime(x, '%Y%m%d') for x in dat_val['date']]
-                dat_val = dat_val[(dat_val['date'] >= begin_date) & (dat_val['date'] <= end_date)]
-
-                """
-                设定起始日期为首行日期
-                """
-                tmp = dat_val['date']
-                begin_date = tmp.iloc[0]
-                weight_strategy = WeightStrategyBase(self.__feed, dat_val, begin_date, end_date, self.__config,
-                                                     ext_status_data=self.__ext_status_df.to_dict(orient="records"),
-                                                     sign=self.__signs[name])
-
-                output = strategyOutput.StrategyOutput(weight_strategy, begin_date, end_date, config=self.__config)
-                output.pre_process()
-                weight_strategy.run()
-                output.bench_process()
-                output.post_process()
-                self.__result_set[name] = output.result
-                self.__feed.reset()
-            except Exception as e:
-                console_log(f'failed back test {name} ', e)
-                continue
+        # 在fork之前载入指数净值，子进程共享同一份
+        bench_cache = BenchmarkCache()
+        bench_cache.prefill([first_weight_date(w, self.__begin_date, self.__end_date)
+                             for w in self.__weights.values()], self.__end_date, self.__config)
+        context = {
+            'feed': self.__feed,
+            'weights': self.__weights,
+            'signs': self.__signs,
+            'ext_status_data': self.__ext_status_df.to_dict(orient="records"),
+            'begin_date': self.__begin_date,
+            'end_date': self.__end_date,
+            'config': self.__config,
+            'bench_cache': bench_cache
+        }
+        results, errors = fork_map(_run_batch_weight_backtest, self.__weights.keys(), context,
+                                   max_process=self.__max_process)
+        for name, result in results.items():
+            self.__result_set[name] = result
+        for name, msg in errors.items():
+            console_log(f'failed back test {name} ', msg)
+            self.__result_set.add_error(name, msg)
 
     @property
     def result_set(self) -> BackTestResultSet:
         return self.__result_set
+
+
+class _DrawDownGuardWeightStrategy(WeightStrategyBase):
+    """
+    参数扫描使用的权重策略，每日收盘后检查净值回撤，超过阈值时提前终止回测
+    """
+
+    def __init__(self, *args, abort_draw_down=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__abort_draw_down = abort_draw_down
+        self.__peak_equity = None
+        self.__max_draw_down = 0.0
+        self.__abort_date = None
+
+    @property
+    def max_draw_down(self):
+        return self.__max_draw_down
+
+    @property
+    def abort_date(self):
+        return self.__abort_date
+
+    def end_of_bar_hook(self, bars):
+        super().end_of_bar_hook(bars)
+        if self.__abort_draw_down is None:
+            return
+        equity = self.getBroker().getEquity()
+        if self.__peak_equity is None or equity > self.__peak_equity:
+            self.__peak_equity = equity
+        if self.__peak_equity > 0:
+            self.__max_draw_down = max(self.__max_draw_down, 1 - equity / self.__peak_equity)
+        if self.__abort_date is None and self.__max_draw_down > self.__abort_draw_down:
+            self.__abort_date = self.current_date_str
+            self.stop()
+
+
+def _run_sweep_backtest(key, context):
+    """
+    执行参数扫描中的单组配置，供WeightParameterSweep在当前进程或fork出的子进程中调用，返回该配置的汇总指标
+    """
+    feed = context['feed']
+    begin_date, end_date = context['begin_date'], context['end_date']
+    config = context['configs'][key]
+    dat_val = context['weight'].copy()
+
+    dat_val['date'] = pd.to_datetime(dat_val['date'], format='%Y%m%d')
+    dat_val['date'] = [datetime.datetime.strftime(x, '%Y%m%d') for x in dat_val['date']]
+    dat_val = dat_val[(dat_val['date'] >= begin_date) & (dat_val['date'] <= end_date)]
+    begin_date = dat_val['date'].iloc[0]
+    try:
+        weight_strategy = _DrawDownGuardWeightStrategy(feed, dat_val, begin_date, end_date, config,
+                                                       ext_status_data=context['ext_status_data'],
+                                                       abort_draw_down=context['abort_draw_down'])
+        with runtime_profiler(config):
+            output = strategyOutput.StrategyOutput(weight_strategy, begin_date, end_date, config=config,
+                                                   bench_cache=context['bench_cache'])
+            output.pre_process()
+            weight_strategy.run()
+            if weight_strategy.abort_date is not None:
+                # 提前终止的回测不再计算基准和指标，仅记录终止日期和终止时的回撤
+                return {'状态': '提前终止', '终止日期': weight_strategy.abort_date,
+                        '最大回撤': weight_strategy.max_draw_down}
+            output.bench_process()
+            output.post_process()
+            summary = output.result['策略指标'].iloc[0]
+        return {'状态': '完成', '终止日期': None, **summary.to_dict()}
+    finally:
+        feed.reset()
+
+
+class WeightParameterSweep:
+    """
+    对同一权重列表按多组配置参数执行回测，返回每组配置的汇总指标
+
+    行情feed按数据集相关的配置分组，每组只准备一次，组内各配置通过fork_map共享feed执行，
+    max_process大于1时使用多进程。用法::
+
+        sweep = WeightParameterSweep(weight_df, '20200101', '20201231',
+                                     grid={'stop_loss': [None, -0.1, -0.05], 'commission': [0.0003, 0.001]},
+                                     max_process=4, abort_draw_down=0.3)
+        sweep.run()
+        sweep.result  # 每行一组配置，包含覆盖的参数列和策略指标列
+    """
+    # 影响行情feed准备的配置项，取值相同的配置共享同一个feed
+    FEED_FIELDS = ('datasets', 'calendar', 'columnar_feed', 'feed_cache')
+
+    def __init__(self, weight, begin_date, end_date=None, config=WeightStrategyConfiguration(), grid=None,
+                 max_process=1, abort_draw_down=None):
+        """
+        Parameters
+        ==================
+        weight: pd.DataFrame or str
+            调仓权重列表，或权重文件路径
+        begin_date: str
+            yyyymmdd 格式的日期字符串
+        end_date: str
+            yyyymmdd 格式的日期字符串
+        config: WeightStrategyConfiguration
+            基础配置，各组参数在其初始化参数的基础上覆盖
+        grid: dict[str, list] | list[dict]
+            参数网格，字典形式时取各参数取值的笛卡尔积，列表形式时每个元素为一组覆盖的参数
+        max_process: int
+            最大进程数
+        abort_draw_down: float | None
+            回撤阈值，取值为0~1，回测过程中净值回撤超过该值时提前终止并不再计算指标，None表示不提前终止
+        """
+        console_log('platform version:', __version__)
+        if isinstance(weight, pd.DataFrame):
+            self.__weight_df = weight.sort_values(['date', 'windcode'])
+        else:
+            assert isinstance(weight, str) or isinstance(weight, pathlib.Path)
+            self.__weight_df = pd.read_csv(weight, encoding="gbk").sort_values(['date', 'windcode'])
+        check_weight_df(self.__weight_df)
+
+        self.__begin_date = begin_date
+        self.__end_date = end_date
+        if self.__end_date is None:
+            self.__end_date = (datetime.datetime.now() + timedelta(days=1)).strftime("%Y%m%d")
+        self.__config = config
+        self.__max_process = max_process
+        if abort_draw_down is not None:
+            assert 0 < abort_draw_down < 1
+        self.__abort_draw_down = abort_draw_down
+
+        self.__overrides = self.__expand_grid(grid)
+        # 提前创建全部配置，参数有误时在准备feed前报错
+        self.__configs = [
+            config.replace(**overrides, progress_bar=False, metric_groups=[MetricGroup.SUMMARY])
+            for overrides in self.__overrides
+        ]
+        self.__result = None
+        self.__errors = {}
+        console_log("backtest range:", self.__begin_date, self.__end_date)
+        console_log('total configurations:', len(self.__configs))
+
+    @staticmethod
+    def __expand_grid(grid):
+        if grid is None:
+            return [{}]
+        if isinstance(grid, dict):
+            names = list(grid.keys())
+            return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+        return [dict(overrides) for overrides in grid]
+
+    def __feed_key(self, config):
+        key = []
+        for field in self.FEED_FIELDS:
+            value = getattr(config, field)
+            key.append(tuple(sorted(value)) if field == 'datasets' else value)
+        return tuple(key)
+
+    def run(self):
+        groups = OrderedDict()
+        for i, config in enumerate(self.__configs):
+            groups.setdefault(self.__feed_key(config), []).append(i)
+
+        instruments = self.__weight_df['windcode'].unique().tolist()
+        begin_date = first_weight_date(self.__weight_df, self.__begin_date, self.__end_date)
+        bench_cache = BenchmarkCache()
+        rows = {}
+        for keys in groups.values():
+            feed, ext_status_df = prepare_feed(self.__begin_date, self.__end_date,
+                                               instruments=instruments, config=self.__configs[keys[0]])
+            # 在fork之前载入指数净值，子进程共享同一份
+            for key in keys:
+                bench_cache.prefill([begin_date], self.__end_date, self.__configs[key])
+            context = {
+                'feed': feed,
+                'weight': self.__weight_df,
+                'ext_status_data': ext_status_df.to_dict(orient="records"),
+                'begin_date': self.__begin_date,
+                'end_date': self.__end_date,
+                'configs': self.__configs,
+                'abort_draw_down': self.__abort_draw_down,
+                'bench_cache': bench_cache
+            }
+            results, errors = fork_map(_run_sweep_backtest, keys, context, max_process=self.__max_process,
+                                       progress_bar=self.__config.progress_bar)
+            rows.update(results)
+            for key, msg in errors.items():
+                console_log(f'failed back test {self.__overrides[key]} ', msg)
+                self.__errors[key] = msg
+                rows[key] = {'状态': '失败', '终止日期': None}
+
+        params = pd.DataFrame(self.__overrides, index=range(len(self.__overrides)))
+        metrics = pd.DataFrame([rows[i] for i in range(len(self.__configs))], index=params.index)
+        # 指标列按策略指标表的顺序排列，不受首行是否提前终止影响
+        completed = [row for row in rows.values() if row['状态'] == '完成']
+        if completed:
+            metrics = metrics[list(completed[0].keys())]
+        self.__result = pd.concat([params, metrics], axis=1)
+
+    @property
+    def result(self) -> pd.DataFrame:
+        """
+        每组配置一行，依次为覆盖的参数、运行状态（完成、提前终止、失败）、终止日期和策略指标
+        """
+        return self.__result
+
+    @property
+    def errors(self) -> dict:
+        """
+        执行失败的配置序号及异常信息
+        """
+        return self.__errors
@@ -87,7 +87,16 @@ class WeightStrategyConfiguration(StrategyConfiguration):
                  detailed_position_track_level='trade_day',
                  position_track_level='trade_day',
                  calendar='a_share_market',
-                 profile_runtime=True):
+                 profile_runtime=False,
+                 profile_memory=False,
+                 columnar_feed=False,
+                 batch_rebalance=False,
+                 feed_cache=False,
+                 feed_workers=1,
+                 feed_executor='process',
+                 track_spill_dir=None,
+                 metric_groups=None,
+                 analyzer_workers=1):
         """
         Parameters
         ==================
@@ -151,10 +160,29 @@ class WeightStrategyConfiguration(StrategyConfiguration):
         position_track_level: TrackLevel
             持仓记录级别，默认记录调仓日
         profile_runtime: bool
-            是否追踪运行性能
+            是否追踪运行性能，开启后在回测结果中增加“运行性能”表，记录行情加载、broker、策略、指标计算等阶段的耗时，默认关闭
+        profile_memory: bool
+            追踪运行性能时是否同时记录各阶段的内存分配，开启后运行速度明显下降，默认关闭
+        columnar_feed: bool
+            是否使用列式存储的行情feed，开启后按需生成bar对象，可降低加载时间和内存占用，默认关闭
+        batch_rebalance: bool
+            是否使用向量化的批量调仓，开启后按调仓前总资产一次性计算全部订单，仅适用于纯股票多头持仓，默认关闭
+        feed_cache: bool
+            是否将预处理后的行情数据缓存到数据目录下，数据更新后缓存自动失效，默认关闭
+        feed_workers: int | None
+            准备行情feed时各数据集的并发数，None表示每个数据集一个worker，默认为1即顺序准备
+        feed_executor: str
+            并发准备行情feed时使用的执行器，'process' 或 'thread'。h5格式的数据不是线程安全的，默认为'process'
+        track_spill_dir: str | None
+            持仓跟踪记录的落盘目录，设置后每日持仓等记录按parquet行组写入该目录以降低内存占用，需要安装pyarrow，默认不落盘
+        metric_groups: list[MetricGroup | str] | None
+            回测结果中需要输出的指标分组，未列出分组的指标及其依赖的计算和记录转换均不执行，默认输出全部指标
+        analyzer_workers: int | None
+            计算回测指标时相互独立的算子的并行线程数，None表示取算子数与CPU核数的较小值，默认为1即顺序计算
         """
 
         kwargs = {k: v for k, v in inspect.currentframe().f_locals.items() if k != 'self' and k != "__class__"}
+        self.__init_kwargs = dict(kwargs)
         datasets = kwargs.pop('datasets')
         if stop_pnl_replacement is not None:
             datasets = list(datasets)
@@ -174,6 +202,20 @@ class WeightStrategyConfiguration(StrategyConfiguration):
 
         super().__init__(**kwargs)
 
+    def replace(self, **overrides) -> WeightStrategyConfiguration:
+        """
+        使用相同的初始化参数创建新的配置，overrides中的参数覆盖原有取值
+
+        Parameters
+        ==================
+        overrides:
+            需要修改的初始化参数，例如 stop_loss=-0.1
+        """
+        unknown = set(overrides) - set(self.__init_kwargs)
+        if unknown:
+            raise TypeError(f"unknown configuration parameters: {sorted(unknown)}")
+        return self.__class__(**{**self.__init_kwargs, **overrides})
+
     @property
     def deposit(self):
         return self.__deposit
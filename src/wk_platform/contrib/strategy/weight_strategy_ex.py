@@ -16,6 +16,7 @@ from dataclasses import dataclass
 from wk_util.tqdm import tqdm
 from wk_platform import __version__
 from wk_platform.backtest import strategyOutput
+from wk_platform.util.profiler import runtime_profiler
 from wk_platform.config import StrategyConfiguration
 
 from wk_platform.feed.fast_feed import StockIndexSynthETFFeed
@@ -372,11 +373,12 @@ class WeightStrategyEx:
                                                ext_status_data=self.__ext_status_df.to_dict(orient="records"),
                                                sign=self.__sign)
 
-        output = strategyOutput.StrategyOutput(weight_strategy, begin_date, end_date, config=self.__config)
-        output.pre_process()
-        weight_strategy.run()
-        output.bench_process()
-        output.post_process()
+        with runtime_profiler(self.__config):
+            output = strategyOutput.StrategyOutput(weight_strategy, begin_date, end_date, config=self.__config)
+            output.pre_process()
+            weight_strategy.run()
+            output.bench_process()
+            output.post_process()
         self.__result = output.result
 
     @classmethod
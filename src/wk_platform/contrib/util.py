@@ -1,6 +1,10 @@
 from collections import deque
 
+import multiprocessing
 import pathlib
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from typing import List
 
 import numpy as np
@@ -16,6 +20,7 @@ from dataclasses import dataclass
 from wk_util.tqdm import tqdm
 from wk_platform import __version__
 from wk_platform.backtest import strategyOutput
+from wk_platform.util.profiler import runtime_profiler
 from wk_platform.config import StrategyConfiguration
 
 # from wk_platform.feed.mixed_feed import StockIndexSynthETFFeed
@@ -44,6 +49,10 @@ class PreprocessorSeq:
         for f in args:
             self.__pre_proc_list.append(f)
 
+    @property
+    def pre_proc_list(self):
+        return self.__pre_proc_list
+
     def __call__(self, data):
         for f in self.__pre_proc_list:
             data = f(data)
@@ -64,6 +73,78 @@ def check_weight_df(weight_df: pd.DataFrame, group_field='date', unique_field='w
     # return result
 
 
+def first_weight_date(weight_df: pd.DataFrame, begin_date, end_date):
+    """
+    权重列表在回测区间内的首个调仓日，即批量回测中单个回测的起始日期，区间内没有调仓时返回None
+    """
+    dates = pd.to_datetime(weight_df['date'], format='%Y%m%d').dt.strftime('%Y%m%d')
+    dates = dates[(dates >= begin_date) & (dates <= end_date)]
+    return dates.min() if not dates.empty else None
+
+
+_FORK_CONTEXT = {}
+
+
+def _fork_map_worker(func, key):
+    try:
+        return key, func(key, _FORK_CONTEXT), None
+    except Exception:
+        return key, None, traceback.format_exc()
+
+
+def fork_map(func, keys, context, max_process=1, progress_bar=False):
+    """
+    批量执行 func(key, context)，捕获每个任务的异常
+
+    max_process大于1且系统支持fork时使用进程池执行。context在创建进程池前设置为模块级变量，
+    子进程通过fork以copy-on-write的方式继承，不需要序列化feed等大对象；
+    func需为模块级函数，返回值需可序列化。子进程异常退出导致进程池损坏时，尚未完成的任务记入errors。
+
+    Returns
+    ----------
+    results: dict
+        key对应的执行结果，仅包含执行成功的任务，顺序与keys一致
+    errors: dict
+        key对应的异常信息
+    """
+    global _FORK_CONTEXT
+    keys = list(keys)
+    results = {}
+    errors = {}
+    use_fork = max_process is not None and max_process > 1 and len(keys) > 1 \
+        and 'fork' in multiprocessing.get_all_start_methods()
+    if max_process is not None and max_process > 1 and not use_fork and len(keys) > 1:
+        console_log('fork is not supported on this platform, running in a single process')
+
+    if not use_fork:
+        for key in tqdm(keys, disable=(not progress_bar)):
+            try:
+                results[key] = func(key, context)
+            except Exception:
+                errors[key] = traceback.format_exc()
+        return results, errors
+
+    _FORK_CONTEXT = context
+    try:
+        mp_context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=min(max_process, len(keys)), mp_context=mp_context) as executor:
+            futures = {executor.submit(_fork_map_worker, func, key): key for key in keys}
+            for future in tqdm(as_completed(futures), total=len(futures), disable=(not progress_bar)):
+                try:
+                    key, result, error = future.result()
+                except BrokenProcessPool:
+                    # 子进程异常退出（如被系统终止）后进程池不可用，未完成的任务记为失败，保留已完成的结果
+                    key, result, error = futures[future], None, traceback.format_exc()
+                if error is None:
+                    results[key] = result
+                else:
+                    errors[key] = error
+    finally:
+        _FORK_CONTEXT = {}
+    results = {k: results[k] for k in keys if k in results}
+    return results, errors
+
+
 class StrategyWrapper:
     """
     根据权重列表定期调仓的回测策略
@@ -141,11 +222,12 @@ class StrategyWrapper:
                                                ext_status_data=self.__ext_status_df.to_dict(orient="records"),
                                                sign=self.__sign, **self.__kwargs)
 
-        output = strategyOutput.StrategyOutput(weight_strategy, begin_date, end_date, config=self.__config)
-        output.pre_process()
-        weight_strategy.run()
-        output.bench_process()
-        output.post_process()
+        with runtime_profiler(self.__config):
+            output = strategyOutput.StrategyOutput(weight_strategy, begin_date, end_date, config=self.__config)
+            output.pre_process()
+            weight_strategy.run()
+            output.bench_process()
+            output.post_process()
         self.__result = output.result
 
     def strategy_class(self):
@@ -116,6 +116,18 @@ class BaseFeed(observer.Subject):
             self.__event.emit(dateTime, values)
         return dateTime is not None
 
+    def export_status(self):
+        """
+        导出运行状态，用于保存回测状态快照。行情数据本身不导出，只导出新数据事件及其订阅者
+        """
+        return {'event': self.__event}
+
+    def update_status(self, status):
+        """
+        使用export_status导出的状态替换当前状态，恢复快照时原feed上的订阅者迁移到当前feed
+        """
+        self.__event = status['event']
+
     def getKeys(self):
         return list(self.__ds.keys())
 
@@ -72,7 +72,7 @@ class StockBar(Bar, WindBarMixin):
         '__high',
         '__low',
         '__volume',
-        '__amount',
+        '__pre_close',
         '__adj_factor',
         
         #新增列
@@ -137,7 +137,7 @@ class StockBar(Bar, WindBarMixin):
           self.__high,
           self.__low,
           self.__volume,
-          self.__amount,
+          self.__pre_close,
           self.__adj_factor,
 
 
@@ -162,7 +162,7 @@ class StockBar(Bar, WindBarMixin):
             self.__high,
             self.__low,
             self.__volume,
-            self.__amount,
+            self.__pre_close,
             self.__adj_factor,
 
             self.__new_column,
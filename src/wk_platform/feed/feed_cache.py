@@ -0,0 +1,115 @@
+"""
+预处理后行情数据的磁盘缓存
+
+缓存内容为经过过滤、日历对齐后的DataFrame，键由数据集、日期区间、标的范围等参数计算，
+并按数据布局文件（data_spec.toml）的修订号分目录存放。数据更新后修订号改变，旧缓存不再命中，
+并在写入新缓存时被清理
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import pathlib
+import shutil
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from wk_data.data_spec import DataSpec
+from wk_util.configuration import Configuration
+from wk_util.logger import console_log
+
+
+def preprocessor_name(func):
+    """
+    预处理函数的名称，参与缓存键的计算以区分不同的预处理流程
+    """
+    if hasattr(func, 'pre_proc_list'):
+        return '|'.join(preprocessor_name(f) for f in func.pre_proc_list)
+    if isinstance(func, partial):
+        # 绑定的参数同样影响预处理结果，需要参与缓存键的计算
+        args = [_argument_name(v) for v in func.args]
+        args += [f"{k}={_argument_name(v)}" for k, v in sorted(func.keywords.items())]
+        return f"{preprocessor_name(func.func)}({', '.join(args)})"
+    return getattr(func, '__qualname__', type(func).__qualname__)
+
+
+def _argument_name(value):
+    """
+    partial绑定参数的名称，函数等对象的repr中包含内存地址，使用其名称代替
+    """
+    if callable(value):
+        return preprocessor_name(value)
+    return repr(value)
+
+
+class FeedCache:
+    CACHE_DIR_NAME = 'feed_cache'
+
+    def __init__(self, cache_dir=None, **context):
+        """
+        Parameters
+        ==================
+        cache_dir: str | pathlib.Path | None
+            缓存目录，默认为数据目录下的feed_cache
+        context:
+            所有缓存键共用的参数，如交易日历
+        """
+        if cache_dir is None:
+            cache_dir = Configuration().data_dir.joinpath(self.CACHE_DIR_NAME)
+        self.__root = pathlib.Path(cache_dir)
+        self.__context = context
+
+    @property
+    def root(self):
+        return self.__root
+
+    @staticmethod
+    def revision():
+        return DataSpec(Configuration().data_dir).revision
+
+    def make_key(self, **kwargs):
+        """
+        由参数计算缓存键，列表类参数按排序后的内容参与计算
+        """
+        items = dict(self.__context, **kwargs)
+        hash_md5 = hashlib.md5()
+        for k in sorted(items.keys()):
+            v = items[k]
+            if isinstance(v, (list, tuple, set, pd.Series, np.ndarray)):
+                v = sorted(v)
+            hash_md5.update(f"{k}={v!r};".encode())
+        return hash_md5.hexdigest()
+
+    def __revision_dir(self):
+        return self.__root.joinpath(self.revision())
+
+    def load(self, key) -> pd.DataFrame | None:
+        path = self.__revision_dir().joinpath(f"{key}.pkl")
+        try:
+            return pd.read_pickle(path)
+        except FileNotFoundError:
+            return None
+
+    def dump(self, key, data: pd.DataFrame):
+        revision_dir = self.__revision_dir()
+        if not revision_dir.exists():
+            self.clear(keep=revision_dir.name)
+            revision_dir.mkdir(parents=True, exist_ok=True)
+        path = revision_dir.joinpath(f"{key}.pkl")
+        # 先写临时文件再替换，避免并行回测的多个进程读到不完整的文件
+        tmp_path = revision_dir.joinpath(f"{key}.{os.getpid()}.tmp")
+        data.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+
+    def clear(self, keep=None):
+        """
+        清理缓存，keep为需要保留的修订号
+        """
+        if not self.__root.exists():
+            return
+        for p in self.__root.iterdir():
+            if p.is_dir() and p.name != keep:
+                console_log(f"removing stale feed cache {p.name}")
+                shutil.rmtree(p, ignore_errors=True)
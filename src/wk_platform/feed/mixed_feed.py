@@ -14,6 +14,7 @@ from wk_platform.feed.parser import SyntheticIndexETFRowParser
 from wk_util.tqdm import tqdm
 import wk_data
 from wk_platform.barfeed.membf import FastBarFeed
+from wk_platform.feed.feed_cache import preprocessor_name
 
 
 class MixedFeed(FastBarFeed):
@@ -21,8 +22,13 @@ class MixedFeed(FastBarFeed):
     个股与模拟指数ETF的行情
     """
 
-    def __init__(self, frequency=Frequency.DAY, timezone=None):
-        super().__init__(frequency)
+    def __init__(self, frequency=Frequency.DAY, timezone=None, columnar=False, cache=None):
+        """
+        cache: FeedCache | None
+            预处理后数据的磁盘缓存，为None时不使用缓存
+        """
+        super().__init__(frequency, columnar=columnar)
+        self.__cache = cache
         self.__barFilter = None
         self.__dailyTime = datetime.time(0, 0, 0) if frequency == Frequency.DAY else None
         self.__timezone = timezone
@@ -43,11 +49,21 @@ class MixedFeed(FastBarFeed):
         self.__dailyTime = time
 
     def add_bars(self, dataset, parser_cls, begin_date, end_date=None, bars_name=None,
-                 preprocessor=lambda x: x, progress_bar=False):
+                 preprocessor=lambda x: x, progress_bar=False, cache_tag=None):
+        """
+        cache_tag:
+            影响预处理结果的额外参数（如标的列表），参与缓存键的计算
+        """
         if bars_name is None:
             bars_name = dataset
-        data = wk_data.get(dataset, begin_date=begin_date, end_date=end_date)
-        data = preprocessor(data)
+        data = load_feed_data(dataset, parser_cls, begin_date, end_date, bars_name, preprocessor,
+                              cache=self.__cache, cache_tag=cache_tag)
+        return self.add_processed_bars(bars_name, data, parser_cls, progress_bar=progress_bar)
+
+    def add_processed_bars(self, bars_name, data, parser_cls, progress_bar=False):
+        """
+        添加已经完成预处理的数据
+        """
         self.__data[bars_name] = data
         row_parser = parser_cls(self.getDailyBarTime(), self.getFrequency(), self.__timezone)
         self.__bar_types.append(row_parser.bar_type)
@@ -55,3 +71,56 @@ class MixedFeed(FastBarFeed):
 
     def get_processed_data(self, dataset):
         return self.__data[dataset]
+
+
+def load_feed_data(dataset, parser_cls, begin_date, end_date, bars_name, preprocessor, cache=None, cache_tag=None):
+    """
+    读取并预处理数据集，优先使用磁盘缓存
+    """
+    if cache is None:
+        return preprocessor(wk_data.get(dataset, begin_date=begin_date, end_date=end_date))
+
+    key = cache.make_key(dataset=dataset, bars_name=bars_name, parser=parser_cls.__qualname__,
+                         preprocessor=preprocessor_name(preprocessor),
+                         begin_date=begin_date, end_date=end_date, tag=cache_tag)
+    data = cache.load(key)
+    if data is None:
+        data = preprocessor(wk_data.get(dataset, begin_date=begin_date, end_date=end_date))
+        cache.dump(key, data)
+    return data
+
+
+class StagedFeed:
+    """
+    暂存数据集的加载结果而不修改feed，用于在线程/进程池中并发准备各数据集，之后通过commit按固定顺序合并到MixedFeed
+
+    仅提供数据集准备函数中用到的add_bars与get_processed_data
+    """
+
+    def __init__(self, cache=None):
+        self.__cache = cache
+        self.__entries = []
+        self.__data = {}
+
+    def add_bars(self, dataset, parser_cls, begin_date, end_date=None, bars_name=None,
+                 preprocessor=lambda x: x, progress_bar=False, cache_tag=None):
+        if bars_name is None:
+            bars_name = dataset
+        data = load_feed_data(dataset, parser_cls, begin_date, end_date, bars_name, preprocessor,
+                              cache=self.__cache, cache_tag=cache_tag)
+        self.__entries.append((bars_name, data, parser_cls))
+        self.__data[bars_name] = data
+        if data.empty:
+            return None
+        # 与add_data_from_dataframe的返回值一致
+        return data['trade_dt'].max()
+
+    def get_processed_data(self, dataset):
+        return self.__data[dataset]
+
+    def commit(self, feed: MixedFeed, progress_bar=False):
+        """
+        按add_bars的调用顺序将数据添加到feed
+        """
+        for bars_name, data, parser_cls in self.__entries:
+            feed.add_processed_bars(bars_name, data, parser_cls, progress_bar=progress_bar)
@@ -72,6 +72,12 @@ class RowParser(BaseRowParser):
     def parse_row(self, row_data):
         raise NotImplementedError()
 
+    def instrument_name(self, windcode):
+        """
+        返回解析后bar对应的标的名称，需与parse_row返回的名称保持一致
+        """
+        return windcode
+
     def lazy_parser(self, row):
         def parse():
             return self.parse_row(row)
@@ -140,10 +146,13 @@ class SyntheticIndexETFRowParser(RowParser):
     def __init__(self, daily_bar_time, frequency, timezone=None, sanitize=False):
         super().__init__(SynthIndexETFBar, daily_bar_time, frequency, timezone, sanitize)
 
+    def instrument_name(self, windcode):
+        return SynthIndexETFBar.synth_name(windcode)
+
     def parse_row(self, row_data):
 
         return (
-            SynthIndexETFBar.synth_name(row_data.windcode),
+            self.instrument_name(row_data.windcode),
             SynthIndexETFBar(
                 date_time=self.parse_date(row_data.trade_dt),
                 windcode=row_data.windcode,
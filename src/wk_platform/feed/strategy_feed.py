@@ -1,3 +1,5 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from functools import partial
 
 import pandas as pd
@@ -7,11 +9,13 @@ from wk_platform.config.enums import DatasetType, PriceType
 
 import wk_data
 from wk_platform.contrib.util import PreprocessorSeq
-from wk_platform.feed.mixed_feed import MixedFeed
+from wk_platform.feed.mixed_feed import MixedFeed, StagedFeed
+from wk_platform.feed.feed_cache import FeedCache
 from wk_platform.feed.parser import StockDataRowParser, SyntheticIndexETFRowParser, IndexETFRowParser, \
     FundDataRowParser, FundNavDataRowParser, FutureDataRowParser, PositionDummyRowParser, IndexDataRowParser
 from wk_platform.util.data import align_calendar, filter_market_data, add_normal_ext_status
 from wk_util.logger import console_log
+from wk_platform.util.profiler import profiled, profile_section
 
 DATASET_FEED_MAPPING = {}
 
@@ -31,7 +35,7 @@ def prepare_feed_a_share_market_common(dataset, feed, config, begin_date, end_da
                   preprocessor=PreprocessorSeq(
                       partial(filter_market_data, instruments=instruments),
                       align_func
-                  ))
+                  ), cache_tag=instruments)
     data = feed.get_processed_data(dataset)
     ext_status_df = data[data['ext_status'] != ExtStatus.NORMAL.value].sort_values(by="trade_dt")
     ext_status_df = ext_status_df[
@@ -135,6 +139,28 @@ def prepare_feed_etf_func_subset_1(feed, config, begin_date, end_date, align_fun
     return max_time, ext_status_df
 
 
+def prepare_feed_dummy_data(feed, config, begin_date, end_date, align_func):
+    feed.add_bars('dummy_data', PositionDummyRowParser, begin_date=begin_date, end_date=end_date,
+                  preprocessor=align_func)
+    return None, None
+
+
+def prepare_feed_index_market(feed, config, begin_date, end_date, align_func):
+    feed.add_bars('index_market', IndexDataRowParser, begin_date=begin_date, end_date=end_date,
+                  preprocessor=align_func)
+    return None, None
+
+
+def _stage_dataset(prepare_func, config, begin_date, end_date, align_func, cache, kwargs):
+    """
+    在暂存feed上执行数据集准备函数，供线程/进程池调用
+    """
+    staged = StagedFeed(cache)
+    with profile_section(f'feed.build.{prepare_func.__name__}'):
+        max_dt, ext_status_df = prepare_func(staged, config, begin_date, end_date, align_func, **kwargs)
+    return staged, max_dt, ext_status_df
+
+
 class FeedRegistry:
     def __init__(self, begin_date, end_date, config):
         self.begin_date = begin_date
@@ -146,33 +172,64 @@ class FeedRegistry:
         key = DatasetType[dataset_name.upper()]
         self.context[key] = kwargs
 
-    def build_feed(self):
+    @profiled('feed.build')
+    def build_feed(self, max_workers=1, executor='process'):
+        """
+        各数据集的读取与预处理相互独立，可以在线程/进程池中并发执行，完成后按数据集的注册顺序合并到feed中，
+        合并结果与顺序执行一致。回测中的取值来自配置项 feed_workers 和 feed_executor
+
+        Parameters
+        ==================
+        max_workers: int | None
+            并发数，None表示每个数据集一个worker，默认为1即顺序执行
+        executor: str
+            'process' 或 'thread'，进程池要求数据集准备函数及其参数可以被pickle。
+            数据集以h5格式存储时不应使用线程池，PyTables/HDF5不是线程安全的
+        """
         console_log("preparing feed...")
 
         local_calendar = wk_data.get('trade_calendar', begin_date=self.begin_date, end_date=self.end_date,
                                      calendar=self.config.calendar)
         align_func = partial(align_calendar, calendar=local_calendar)
-        feed = MixedFeed()
-        ext_status_df = pd.DataFrame()
-        max_dt_list = []
+        cache = FeedCache(calendar=self.config.calendar) if self.config.feed_cache else None
+        feed = MixedFeed(columnar=self.config.columnar_feed, cache=cache)
+
+        jobs = []
         for dataset in self.config.datasets:
             dataset = DatasetType[dataset.upper()]
-            kwargs = self.context[dataset]
-            prepare_func = DATASET_FEED_MAPPING[dataset]
-            max_dt, ret_ext_df = prepare_func(feed, self.config, self.begin_date, self.end_date, align_func, **kwargs)
+            jobs.append((DATASET_FEED_MAPPING[dataset], self.context[dataset]))
+        jobs.append((prepare_feed_dummy_data, {}))
+        jobs.append((prepare_feed_index_market, {}))
+
+        stage = partial(_stage_dataset, config=self.config, begin_date=self.begin_date, end_date=self.end_date,
+                        align_func=align_func, cache=cache)
+        if max_workers is None:
+            max_workers = len(jobs)
+        if max_workers <= 1:
+            results = [stage(func, kwargs=kwargs) for func, kwargs in jobs]
+        else:
+            if executor not in ('thread', 'process'):
+                raise ValueError(f"Unsupported executor `{executor}`")
+            pool_cls = ThreadPoolExecutor if executor == 'thread' else ProcessPoolExecutor
+            with pool_cls(max_workers=min(max_workers, len(jobs))) as pool:
+                if executor == 'thread':
+                    # 在提交时的上下文中执行，使线程内的耗时统计记入当前的RuntimeProfiler
+                    futures = [pool.submit(contextvars.copy_context().run, stage, func, kwargs=kwargs)
+                               for func, kwargs in jobs]
+                else:
+                    futures = [pool.submit(stage, func, kwargs=kwargs) for func, kwargs in jobs]
+                results = [f.result() for f in futures]
+
+        ext_status_df = pd.DataFrame()
+        max_dt_list = []
+        for staged, max_dt, ret_ext_df in results:
+            staged.commit(feed)
             if max_dt is not None:
                 max_dt_list.append(max_dt)
             if ret_ext_df is not None:
                 assert ext_status_df.empty
                 ext_status_df = ret_ext_df
 
-        feed.add_bars('dummy_data', PositionDummyRowParser, begin_date=self.begin_date, end_date=self.end_date,
-                      preprocessor=align_func)
-
-        feed.add_bars('index_market', IndexDataRowParser, begin_date=self.begin_date, end_date=self.end_date,
-                      preprocessor=align_func)
-
         feed.prefetch(self.config.progress_bar)
 
         return feed, ext_status_df
-
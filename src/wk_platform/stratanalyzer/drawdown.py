@@ -24,6 +24,8 @@ from wk_platform import stratanalyzer
 import datetime
 import pandas as pd
 
+from wk_platform.stratanalyzer.drawdown_kernel import draw_down_matrix
+
 
 class DrawDownHelper(object):
     def __init__(self):
@@ -189,15 +191,4 @@ class DrawDown(stratanalyzer.StrategyAnalyzer):
 def draw_down(s, base=None):
     if len(s) == 0:
         return []
-    if base is None:
-        current_max = s[0]
-    else:
-        current_max = base
-    draw_down_s = []
-    for i in range(0, len(s)):
-        if s[i] >= current_max:
-            current_max = s[i]
-            draw_down_s.append(0)
-        else:
-            draw_down_s.append(s[i] / current_max - 1)
-    return draw_down_s
+    return draw_down_matrix(s, base).tolist()
@@ -0,0 +1,172 @@
+"""
+回撤计算的向量化实现
+
+输入为净值矩阵（行为时间，列为策略及各基准、对冲序列），所有列在一次 `np.fmax.accumulate` 中完成计算，
+与逐点循环的实现结果一致：空值不会成为新的高点，对应位置的回撤为空值
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+def _as_matrix(values) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, np.newaxis]
+    return values
+
+
+def running_peak(values, base=None) -> np.ndarray:
+    """
+    截至每个时点（含当前时点）的历史最高净值
+
+    Parameters
+    ==================
+    values: array_like
+        净值序列或净值矩阵
+    base: float | None
+        初始高点，为None时使用各列首个值
+    """
+    values = _as_matrix(values)
+    if len(values) == 0:
+        return values.copy()
+    initial = values[0] if base is None else np.full(values.shape[1], base, dtype=np.float64)
+    peak = np.fmax.accumulate(np.vstack([initial, values]), axis=0)[1:]
+    # 初始高点为空值时逐点比较始终不成立，整列回撤均为空值
+    peak[:, np.isnan(initial)] = np.nan
+    return peak
+
+
+def draw_down_matrix(values, base=None) -> np.ndarray:
+    """
+    回撤序列，创新高（含持平）时为0，否则为 净值 / 历史最高净值 - 1
+
+    Parameters
+    ==================
+    values: array_like
+        净值序列或净值矩阵，一维输入时返回一维结果
+    base: float | None
+        初始高点，为None时使用各列首个值
+    """
+    one_dim = np.ndim(values) == 1
+    matrix = _as_matrix(values)
+    peak = running_peak(matrix, base)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = np.where(matrix >= peak, 0.0, matrix / peak - 1)
+    return result[:, 0] if one_dim else result
+
+
+def draw_down_frame(frame: pd.DataFrame, base=None) -> pd.DataFrame:
+    """
+    DataFrame各列的回撤序列
+    """
+    return pd.DataFrame(draw_down_matrix(frame.to_numpy(dtype=np.float64), base),
+                        index=frame.index, columns=frame.columns)
+
+
+@dataclass
+class MaxDrawDown:
+    """
+    各列的最大回撤信息，位置均为行号，未发生回撤时为-1
+    """
+    max_draw_down: np.ndarray
+    peak: np.ndarray
+    trough: np.ndarray
+    recovery: np.ndarray
+
+    @property
+    def duration(self) -> np.ndarray:
+        """
+        高点到低点经历的行数
+        """
+        return np.where(self.trough >= 0, self.trough - self.peak, 0)
+
+
+def max_draw_down(values, base=1.0) -> MaxDrawDown:
+    """
+    最大回撤及其高点、低点和恢复位置
+
+    净值严格超过之前的高点时记为新高点，回撤幅度为 (高点 - 净值) / 高点，取首次达到最大回撤的位置为低点；
+    恢复位置为低点之后净值首次回到高点的位置，尚未恢复时为-1
+
+    Parameters
+    ==================
+    values: array_like
+        净值序列或净值矩阵
+    base: float
+        初始高点
+    """
+    matrix = _as_matrix(values)
+    n, k = matrix.shape
+    max_dd = np.zeros(k)
+    peak_pos = np.full(k, -1)
+    trough_pos = np.full(k, -1)
+    recovery_pos = np.full(k, -1)
+    if n == 0:
+        return MaxDrawDown(max_dd, peak_pos, trough_pos, recovery_pos)
+
+    peak = running_peak(matrix, base)
+    previous = np.vstack([np.full(k, base, dtype=np.float64), peak[:-1]])
+    with np.errstate(invalid='ignore'):
+        new_high = matrix > previous
+        dd = (peak - matrix) / peak
+    dd[new_high] = np.nan
+    # 高点位置：截至当前最近一次创新高的行号，初始高点记为-1
+    high_pos = np.maximum.accumulate(np.where(new_high, np.arange(n)[:, np.newaxis], -1), axis=0)
+
+    has_dd = (dd > 0).any(axis=0)
+    for j in np.flatnonzero(has_dd):
+        trough = int(np.nanargmax(dd[:, j]))
+        max_dd[j] = dd[trough, j]
+        trough_pos[j] = trough
+        peak_pos[j] = high_pos[trough, j]
+        recovered = np.flatnonzero(matrix[trough:, j] >= peak[trough, j])
+        if len(recovered) > 0:
+            recovery_pos[j] = trough + recovered[0]
+    return MaxDrawDown(max_dd, peak_pos, trough_pos, recovery_pos)
+
+
+def grouped_max_draw_down(values, groups, base=None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    按周期分组计算各列的最大回撤（回撤序列的最小值），各组单独计算历史高点
+
+    组内回撤序列首个值为空值时结果为空值，其余空值忽略，与对回撤列表取 `min` 的结果一致
+
+    Parameters
+    ==================
+    values: array_like
+        净值矩阵，行按时间排序
+    groups: array_like
+        每行所属的周期，同一周期的行必须连续
+    base: float | None
+        每个周期的初始高点，为None时使用周期内首个值
+
+    Returns
+    ==================
+    (周期, 最大回撤矩阵)，周期按出现顺序排列
+    """
+    matrix = _as_matrix(values)
+    groups = np.asarray(groups)
+    if len(groups) == 0:
+        return groups, np.empty((0, matrix.shape[1]))
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    ends = np.r_[starts[1:], len(groups)]
+
+    result = np.empty((len(starts), matrix.shape[1]))
+    for i, (begin, end) in enumerate(zip(starts, ends)):
+        dd = draw_down_matrix(matrix[begin:end], base)
+        with np.errstate(invalid='ignore'):
+            lowest = np.fmin.reduce(dd, axis=0)
+        result[i] = np.where(np.isnan(dd[0]), np.nan, lowest)
+    return groups[starts], result
+
+
+def grouped_max_draw_down_frame(frame: pd.DataFrame, groups, base=None) -> pd.DataFrame:
+    """
+    DataFrame各列按周期分组的最大回撤，以周期为索引
+    """
+    keys, result = grouped_max_draw_down(frame.to_numpy(dtype=np.float64), groups, base)
+    return pd.DataFrame(result, index=keys, columns=frame.columns)
@@ -0,0 +1,223 @@
+"""
+按列存储的成交流水
+
+每条成交拆分为两部分保存在固定大小的numpy分块中：日期、证券代码、证券名称、成交方向、备注等字符串字段
+驻留为整数编号，价格、数量、佣金、印花税保存为float64。分块写满后新建分块，追加记录时不复制已有数据。
+
+各broker共用同一种流水，分析器可以直接在编号和数值数组上做聚合（每日成交额、费用，个股收益等），
+只有输出交易流水表时才转换为DataFrame
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from wk_platform.stratanalyzer.record import TransactionRecord
+
+DIRECTIONS = ('买入', '卖出', '换入', '换出', '退市卖出', '到期转为现金')
+# 各成交方向的资金流向，卖出类为正，买入类为负；其他方向（如clean_position传入的自定义说明）按0计，不计入买卖
+DIRECTION_SIGN = {'买入': -1, '卖出': 1, '换入': -1, '换出': 1, '退市卖出': 1, '到期转为现金': 1}
+
+_STR_FIELDS = ('trade_dt', 'windcode', 'sec_name', 'direction', 'note')
+_NUM_FIELDS = ('price', 'volume', 'commission', 'stamp_tax')
+
+
+class _Interner:
+    """
+    字符串驻留表，相同的值对应同一编号
+    """
+
+    def __init__(self):
+        self.values = []
+        self.ids = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def id_of(self, value):
+        try:
+            return self.ids[value]
+        except KeyError:
+            ret = self.ids[value] = len(self.values)
+            self.values.append(value)
+            return ret
+
+    def decode(self, ids) -> np.ndarray:
+        table = np.empty(len(self.values), dtype=object)
+        table[:] = self.values
+        return table[ids]
+
+
+class TransactionLedger:
+    """
+    只追加的成交流水
+
+    转换得到的DataFrame与逐条TransactionRecord转换的结果一致：数值列全部为整数时为int64列，否则为float64列
+    """
+    CHUNK_SIZE = 4096
+
+    def __init__(self):
+        self.__tables = {name: _Interner() for name in _STR_FIELDS}
+        self.__id_chunks: list[np.ndarray] = []
+        self.__num_chunks: list[np.ndarray] = []
+        self.__size = 0
+        # 各数值列是否只写入过整数
+        self.__integer = [True] * len(_NUM_FIELDS)
+
+    def __len__(self):
+        return self.__size
+
+    def __iter__(self):
+        for record in self.to_dataframe().itertuples(index=False):
+            yield TransactionRecord(*record)
+
+    def append(self, trade_dt, windcode, sec_name, price, volume, commission, stamp_tax, direction, note=''):
+        """
+        追加一条成交记录
+        """
+        pos = self.__size % self.CHUNK_SIZE
+        if pos == 0:
+            self.__id_chunks.append(np.empty((self.CHUNK_SIZE, len(_STR_FIELDS)), dtype=np.int32))
+            self.__num_chunks.append(np.empty((self.CHUNK_SIZE, len(_NUM_FIELDS)), dtype=np.float64))
+        tables = self.__tables
+        self.__id_chunks[-1][pos] = (
+            tables['trade_dt'].id_of(trade_dt),
+            tables['windcode'].id_of(windcode),
+            tables['sec_name'].id_of(sec_name),
+            tables['direction'].id_of(direction),
+            tables['note'].id_of(note),
+        )
+        values = (price, volume, commission, stamp_tax)
+        for i, value in enumerate(values):
+            if self.__integer[i] and not isinstance(value, (int, np.integer)):
+                self.__integer[i] = False
+        self.__num_chunks[-1][pos] = values
+        self.__size += 1
+
+    def append_record(self, record: TransactionRecord):
+        self.append(record.trade_dt, record.windcode, record.sec_name, record.price, record.volume,
+                    record.commission, record.stamp_tax, record.direction, record.note)
+
+    def __concat(self, chunks, width, dtype):
+        if not chunks:
+            return np.empty((0, width), dtype=dtype)
+        ret = np.concatenate(chunks) if len(chunks) > 1 else chunks[0]
+        return ret[:self.__size]
+
+    def ids(self, name) -> np.ndarray:
+        """
+        字符串字段的编号数组，编号对应的值见 values
+        """
+        return self.__concat(self.__id_chunks, len(_STR_FIELDS), np.int32)[:, _STR_FIELDS.index(name)]
+
+    def values(self, name):
+        """
+        字符串字段的驻留表（列表），或数值字段的数组
+        """
+        if name in self.__tables:
+            return self.__tables[name].values
+        return self.__concat(self.__num_chunks, len(_NUM_FIELDS), np.float64)[:, _NUM_FIELDS.index(name)]
+
+    def __direction_sign(self):
+        table = self.__tables['direction'].values
+        signs = np.array([DIRECTION_SIGN.get(direction, 0) for direction in table], dtype=np.float64)
+        return signs[self.ids('direction')] if len(table) > 0 else np.empty(0)
+
+    def __direction_mask(self, direction):
+        try:
+            direction_id = self.__tables['direction'].ids[direction]
+        except KeyError:
+            return np.zeros(self.__size, dtype=bool)
+        return self.ids('direction') == direction_id
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        转换为DataFrame，列与TransactionRecord的字段一致
+        """
+        ids = self.__concat(self.__id_chunks, len(_STR_FIELDS), np.int32)
+        nums = self.__concat(self.__num_chunks, len(_NUM_FIELDS), np.float64)
+        data = {}
+        for name in TransactionRecord.__dataclass_fields__.keys():
+            if name in self.__tables:
+                data[name] = self.__tables[name].decode(ids[:, _STR_FIELDS.index(name)])
+            else:
+                i = _NUM_FIELDS.index(name)
+                column = nums[:, i]
+                data[name] = column.astype(np.int64) if self.__integer[i] and len(column) > 0 else column
+        if self.__size == 0:
+            return pd.DataFrame({name: [] for name in data})
+        return pd.DataFrame(data)
+
+    def daily_summary(self) -> pd.DataFrame:
+        """
+        按交易日汇总的成交额与费用
+
+        日内broker记录的成交时间（如 2020-01-02 09:31）按其日期部分汇总
+
+        Returns
+        ==================
+        以交易日为索引的DataFrame，列为 buy_amount（买入金额）、sell_amount（卖出金额）、turnover（成交额）、
+        commission（佣金）、stamp_tax（印花税）、count（成交笔数），成交额只包含买入和卖出
+        """
+        # 驻留的成交时间先映射到所属交易日，再按交易日编号聚合
+        day_of, days = pd.factorize(np.array([str(v).split(' ')[0] for v in self.__tables['trade_dt'].values],
+                                             dtype=object))
+        dates = day_of[self.ids('trade_dt')]
+        n = len(days)
+        amount = self.values('price') * self.values('volume')
+        buy = np.bincount(dates, weights=np.where(self.__direction_mask('买入'), amount, 0), minlength=n)
+        sell = np.bincount(dates, weights=np.where(self.__direction_mask('卖出'), amount, 0), minlength=n)
+        return pd.DataFrame({
+            'buy_amount': buy,
+            'sell_amount': sell,
+            'turnover': buy + sell,
+            'commission': np.bincount(dates, weights=self.values('commission'), minlength=n),
+            'stamp_tax': np.bincount(dates, weights=self.values('stamp_tax'), minlength=n),
+            'count': np.bincount(dates, minlength=n),
+        }, index=pd.Index(days, name='trade_dt'))
+
+    def instrument_summary(self, market_value=None) -> pd.DataFrame:
+        """
+        按证券汇总的成交与收益
+
+        收益按成交金额的资金流向计算：卖出类成交为正，买入类成交为负，其他方向的成交不计入买卖，
+        扣除佣金和印花税后加上当前持仓市值。
+        期货按名义金额计算，不包含每日盯市的盈亏
+
+        Parameters
+        ==================
+        market_value: dict | pd.Series | None
+            各证券当前的持仓市值，为None时不计持仓市值，收益只包含已实现的部分
+
+        Returns
+        ==================
+        以证券代码为索引的DataFrame，列为 buy_volume、sell_volume、buy_amount、sell_amount、commission、
+        stamp_tax、pnl
+        """
+        codes = self.ids('windcode')
+        n = len(self.__tables['windcode'])
+        volume = self.values('volume')
+        sign = self.__direction_sign()
+        amount = self.values('price') * volume
+        commission = np.bincount(codes, weights=self.values('commission'), minlength=n)
+        stamp_tax = np.bincount(codes, weights=self.values('stamp_tax'), minlength=n)
+        index = pd.Index(self.__tables['windcode'].values, name='windcode')
+
+        pnl = np.bincount(codes, weights=sign * amount, minlength=n) - commission - stamp_tax
+        if market_value is not None:
+            pnl = pnl + pd.Series(market_value, dtype=np.float64).reindex(index).fillna(0).to_numpy()
+        return pd.DataFrame({
+            'buy_volume': np.bincount(codes, weights=np.where(sign < 0, volume, 0), minlength=n),
+            'sell_volume': np.bincount(codes, weights=np.where(sign > 0, volume, 0), minlength=n),
+            'buy_amount': np.bincount(codes, weights=np.where(sign < 0, amount, 0), minlength=n),
+            'sell_amount': np.bincount(codes, weights=np.where(sign > 0, amount, 0), minlength=n),
+            'commission': commission,
+            'stamp_tax': stamp_tax,
+            'pnl': pnl,
+        }, index=index)
+
+    def clear(self):
+        """
+        清空全部记录
+        """
+        self.__init__()
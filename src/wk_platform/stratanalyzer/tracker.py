@@ -1,7 +1,6 @@
 
 
-import copy
-from collections import deque, OrderedDict
+from collections import OrderedDict
 from enum import Enum
 import numpy as np
 import pandas as pd
@@ -11,14 +10,16 @@ from wk_util import logger
 from wk_platform.stratanalyzer.record import BaseRecordType
 from wk_platform.stratanalyzer.record import UnfilledOrderInfo
 from wk_platform.stratanalyzer.record import TransactionRecord
+from wk_platform.stratanalyzer.ledger import TransactionLedger
 from wk_platform.stratanalyzer.record import DetailedPositionRecord
 from wk_platform.stratanalyzer.record import PositionRecord
 from wk_platform.stratanalyzer.record import TotalPositionRecord
 from wk_platform.stratanalyzer.record import TotalPositionRecord2
-from wk_util.recorder import dataclass_list_to_dataframe
+from wk_util.recorder import dataclass_list_to_dataframe, ColumnBuffer
 from wk_platform.config import PositionCostType, TrackLevel, PriceType
 from wk_platform.config import HedgeStrategyConfiguration
 from wk_platform.broker.brokers import HedgeBroker
+from wk_platform.util.profiler import profiled
 
 
 class StrategyTracker(stratanalyzer.StrategyAnalyzer):
@@ -37,14 +38,14 @@ class StrategyTracker(stratanalyzer.StrategyAnalyzer):
 
         self.__strategy = None
 
-        # 用来存储每日持仓
-        self.__total_position_tracker = deque()
+        # 用来存储每日持仓，记录按列保存在ColumnBuffer中
+        self.__total_position_tracker = ColumnBuffer.from_dataclass(TotalPositionRecord)
 
         self.__detailed_position_track_level = TrackLevel.TRADE_DAY
-        self.__detailed_position_tracker: [DetailedPositionRecord] = deque()
+        self.__detailed_position_tracker = ColumnBuffer.from_dataclass(DetailedPositionRecord)
 
         self.__position_track_level = TrackLevel.TRADE_DAY
-        self.__position_tracker = deque()
+        self.__position_tracker = ColumnBuffer.from_dataclass(PositionRecord)
 
         self.__hedge_strategy = False
 
@@ -57,6 +58,15 @@ class StrategyTracker(stratanalyzer.StrategyAnalyzer):
         if isinstance(self.__strategy.config, HedgeStrategyConfiguration):
             self.__hedge_strategy = True
 
+        total_position_record = TotalPositionRecord2 if self.__hedge_strategy else TotalPositionRecord
+        spill_dir = getattr(self.__strategy.config, 'track_spill_dir', None)
+        self.__total_position_tracker = ColumnBuffer.from_dataclass(
+            total_position_record, spill_dir=spill_dir, name='total_position')
+        self.__detailed_position_tracker = ColumnBuffer.from_dataclass(
+            DetailedPositionRecord, spill_dir=spill_dir, name='detailed_position')
+        self.__position_tracker = ColumnBuffer.from_dataclass(
+            PositionRecord, spill_dir=spill_dir, name='position')
+
     def track_position(self, strat, bars):
         datetime_str = bars.getDateTime().strftime("%Y-%m-%d")
         # bars.
@@ -64,13 +74,12 @@ class StrategyTracker(stratanalyzer.StrategyAnalyzer):
         for k, position in positions.items():
             if not isinstance(position, int):
                 position = position.quantity
-            rec = PositionRecord(
+            self.__position_tracker.append(
                 trade_dt=datetime_str,
                 windcode=k,
                 volume=position,
                 value=bars[k].get_price(self.__strategy.config.price_type) * position
             )
-            self.__position_tracker.append(rec)
 
     def track_total_position(self, strat, bars):
         datetime_str = bars.getDateTime().strftime("%Y%m%d")
@@ -81,15 +90,14 @@ class StrategyTracker(stratanalyzer.StrategyAnalyzer):
         position_ratio = shares_value * 1.0 / total_equity
         assert total_equity == cash + shares_value
 
-        rec = TotalPositionRecord(
+        # 每日总资产跟踪
+        self.__total_position_tracker.append(
             trade_dt=datetime_str,
             equity=total_equity,
             value=shares_value,
             cash=cash,
             position=position_ratio
         )
-        # 每日总资产跟踪
-        self.__total_position_tracker.append(rec)
 
     def track_total_position2(self, strat, bars):
         """
@@ -115,7 +123,8 @@ class StrategyTracker(stratanalyzer.StrategyAnalyzer):
         else:
             hedge_ratio = - future_value / shares_value
 
-        rec = TotalPositionRecord2(
+        # 每日总资产跟踪
+        self.__total_position_tracker.append(
             trade_dt=datetime_str,
             equity=total_equity,
             stock_value=shares_value,
@@ -125,8 +134,6 @@ class StrategyTracker(stratanalyzer.StrategyAnalyzer):
             future_profit=future_profit,
             hedge_ratio=hedge_ratio
         )
-        # 每日总资产跟踪
-        self.__total_position_tracker.append(rec)
 
 
     def track_detailed_position(self, strat, bars):
@@ -135,8 +142,8 @@ class StrategyTracker(stratanalyzer.StrategyAnalyzer):
         """
         broker = strat.getBroker()
         datetime_str = bars.getDateTime().strftime("%Y-%m-%d")
-        sharesDict = copy.deepcopy(broker.getPositions())
-        for instrument, shares in sharesDict.items():
+        # 只读取持仓标的，遍历过程中不修改持仓，无需复制持仓字典
+        for instrument in list(broker.getPositions().keys()):
             sec_name = bars[instrument].getSecName() # 持仓应当包含在当日行情中，否则应抛出错误
             # 获取当天的股票持仓，当存在持仓时输出该股票的具体信息
             shares = broker.getShares(instrument)
@@ -150,7 +157,7 @@ class StrategyTracker(stratanalyzer.StrategyAnalyzer):
             position_cost = broker.getPositionCost(instrument)
             position_pnl = broker.getPositionDelta(bars, instrument)
 
-            pos_rec = DetailedPositionRecord(
+            self.__detailed_position_tracker.append(
                 trade_dt=datetime_str,
                 windcode=instrument,
                 sec_name=sec_name,
@@ -164,8 +171,6 @@ class StrategyTracker(stratanalyzer.StrategyAnalyzer):
                 pnl=position_pnl
             )
 
-            self.__detailed_position_tracker.append(pos_rec)
-
     def __track(self, func, level, strat, bars):
         datetime_str = bars.getDateTime().strftime("%Y%m%d")
         if level == TrackLevel.TRADE_DAY:
@@ -185,6 +190,7 @@ class StrategyTracker(stratanalyzer.StrategyAnalyzer):
     def beforeOnBars(self, strat, bars):
         pass
 
+    @profiled('tracker.after_on_bars')
     def after_on_bars(self, strat, bars):
         """
         该函数在每个bars处理完后调用，用来统计今天的结果及输出
@@ -215,7 +221,7 @@ class StrategyTracker(stratanalyzer.StrategyAnalyzer):
             position: float # 总仓位
         """
         if not self.__hedge_strategy:
-            data = dataclass_list_to_dataframe(self.__total_position_tracker, TotalPositionRecord)
+            data = self.__total_position_tracker.to_dataframe()
             data.rename(columns={
                 "trade_dt": "日期",
                 "equity": "总资产",
@@ -224,7 +230,7 @@ class StrategyTracker(stratanalyzer.StrategyAnalyzer):
                 "position": "总仓位"
             }, inplace=True)
         else:
-            data = dataclass_list_to_dataframe(self.__total_position_tracker, TotalPositionRecord2)
+            data = self.__total_position_tracker.to_dataframe()
             data.rename(columns={
                 "trade_dt": "日期",
                 "equity": "总资产",
@@ -245,7 +251,7 @@ class StrategyTracker(stratanalyzer.StrategyAnalyzer):
             windcode: str  # 股票代码
             volume: str  # 持仓数量
         """
-        data = dataclass_list_to_dataframe(self.__position_tracker, PositionRecord)
+        data = self.__position_tracker.to_dataframe()
         data.rename(columns={
             "trade_dt": "交易日期",
             "windcode": "股票代码",
@@ -270,7 +276,7 @@ class StrategyTracker(stratanalyzer.StrategyAnalyzer):
             cost: float         # 持仓成本
             pnl: float          # 持仓盈亏
         """
-        data = dataclass_list_to_dataframe(self.__detailed_position_tracker, DetailedPositionRecord)
+        data = self.__detailed_position_tracker.to_dataframe()
         data.rename(columns={
             "trade_dt": "交易日期",
             "windcode": "证券代码",
@@ -286,6 +292,13 @@ class StrategyTracker(stratanalyzer.StrategyAnalyzer):
         }, inplace=True)
         return data
 
+    @property
+    def transaction_ledger(self) -> TransactionLedger:
+        """
+        按列存储的交易流水，可直接用于每日成交额、费用及个股收益等汇总，见 TransactionLedger
+        """
+        return self.__strategy.getBroker().transaction_tracker
+
     @property
     def transaction_records(self):
         """
@@ -302,8 +315,7 @@ class StrategyTracker(stratanalyzer.StrategyAnalyzer):
             note: str           # 备注
         """
 
-        transaction_tracker = self.__strategy.getBroker().transaction_tracker
-        data = dataclass_list_to_dataframe(transaction_tracker, TransactionRecord)
+        data = self.transaction_ledger.to_dataframe()
         data.rename(columns={
             "trade_dt": "交易日期",
             "windcode": "证券代码",
@@ -359,18 +371,24 @@ class StrategyCustomTracker(stratanalyzer.StrategyAnalyzer):
             pass
 
         self._trackers_type[name] = record_type
-        self._trackers[name] = deque()
+        self._trackers[name] = ColumnBuffer.from_dataclass(record_type)
 
     def track(self, name_, **kwargs):
         try:
             record_cls = self._trackers_type[name_]
         except KeyError:
             raise ValueError(f'Tracker {name_} does not exist')
-        self._trackers[name_].append(record_cls(**kwargs))
+        self._trackers[name_].append_record(record_cls(**kwargs))
+
+    def names(self):
+        return list(self._trackers.keys())
+
+    def entry(self, name):
+        return dataclass_list_to_dataframe_with_annotation(self._trackers[name], self._trackers_type[name])
 
     def entries(self):
         for name in self._trackers.keys():
-            yield name, dataclass_list_to_dataframe_with_annotation(self._trackers[name], self._trackers_type[name])
+            yield name, self.entry(name)
 
     def beforeAttach(self, strat):
         pass
@@ -381,6 +399,7 @@ class StrategyCustomTracker(stratanalyzer.StrategyAnalyzer):
     def attached(self, strategy):
         self._strategy = strategy
 
+    @profiled('custom_tracker.after_on_bars')
     def after_on_bars(self, strat, bars):
         pass
 
@@ -0,0 +1,139 @@
+"""
+回测状态快照
+
+快照保存策略、broker（含fill strategy）、策略分析器及各类跟踪记录在某一交易日结束时的完整状态。
+行情feed不参与序列化：保存时以占位符代替feed，恢复时由调用方提供只包含快照之后交易日的feed，
+各对象对feed的引用直接指向新的feed，feed上的事件订阅、当前bar等运行状态通过 export_status/update_status 迁移。
+
+用法::
+
+    strategy.run(finish=False)
+    snapshot = take_snapshot(strategy, output, meta={...})
+    strategy.finish()
+
+    feed = ...  # 只包含 snapshot.last_date 之后交易日的feed
+    strategy, (output, ) = restore_snapshot(snapshot, feed)
+    strategy.resume()
+"""
+from __future__ import annotations
+
+import io
+import pathlib
+import pickle
+import types
+from dataclasses import dataclass, field
+
+from wk_platform import __version__
+from wk_util.logger import console_log
+
+_FEED_ID = 'feed'
+
+
+class _SnapshotPickler(pickle.Pickler):
+    def __init__(self, file, feed):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.__feed = feed
+
+    def persistent_id(self, obj):
+        if obj is self.__feed:
+            return _FEED_ID
+        return None
+
+    def reducer_override(self, obj):
+        # 绑定方法按方法名序列化，私有方法（如事件订阅的__onBars）需使用改写后的名称，否则恢复时无法取回
+        if isinstance(obj, types.MethodType):
+            name = obj.__func__.__name__
+            if name.startswith('__') and not name.endswith('__'):
+                owner = obj.__func__.__qualname__.rsplit('.', 2)[-2]
+                return getattr, (obj.__self__, f"_{owner.lstrip('_')}{name}")
+        return NotImplemented
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    def __init__(self, file, feed):
+        super().__init__(file)
+        self.__feed = feed
+
+    def persistent_load(self, pid):
+        if pid == _FEED_ID:
+            return self.__feed
+        raise pickle.UnpicklingError(f"unsupported persistent id `{pid}`")
+
+
+@dataclass
+class StrategySnapshot:
+    """
+    回测状态快照
+
+    Parameters
+    ==================
+    last_date: str
+        快照对应的最后一个交易日，yyyymmdd 格式，恢复后从下一个交易日开始运行
+    payload: bytes
+        序列化后的策略及相关对象
+    meta: dict
+        恢复时准备feed等所需的信息，如回测起始日期、标的列表和配置
+    version: str
+        生成快照时的平台版本
+    """
+    last_date: str
+    payload: bytes
+    meta: dict = field(default_factory=dict)
+    version: str = __version__
+
+    def dump(self, path):
+        """
+        保存到文件
+        """
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path) -> StrategySnapshot:
+        """
+        从文件读取
+        """
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+        if not isinstance(snapshot, cls):
+            raise TypeError(f"`{path}` is not a strategy snapshot")
+        return snapshot
+
+
+def take_snapshot(strategy, *objects, meta=None) -> StrategySnapshot:
+    """
+    保存策略当前的状态，需在行情结束之后、调用onFinish之前（或在某个交易日的全部处理完成之后）调用
+
+    Parameters
+    ==================
+    strategy: BaseStrategy
+        策略
+    objects:
+        需要一同保存的其他对象，如StrategyOutput，与策略共享的对象（分析器等）恢复后仍为同一对象
+    meta: dict | None
+        附加信息，原样保存在快照中
+    """
+    feed = strategy.getFeed()
+    bars = feed.getCurrentBars()
+    if bars is None:
+        raise ValueError('the strategy has not processed any bars yet')
+    buffer = io.BytesIO()
+    _SnapshotPickler(buffer, feed).dump((feed.export_status(), strategy, objects))
+    return StrategySnapshot(bars.getDateTime().strftime("%Y%m%d"), buffer.getvalue(), dict(meta or {}))
+
+
+def restore_snapshot(snapshot: StrategySnapshot, feed):
+    """
+    恢复快照中的策略及其他对象，原feed替换为传入的feed
+
+    Returns
+    ==================
+    (策略, 其他对象的元组)
+    """
+    if snapshot.version != __version__:
+        console_log(f'restoring snapshot created by platform version {snapshot.version}')
+    feed_status, strategy, objects = _SnapshotUnpickler(io.BytesIO(snapshot.payload), feed).load()
+    feed.update_status(feed_status)
+    return strategy, objects
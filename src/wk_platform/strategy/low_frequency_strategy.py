@@ -49,6 +49,22 @@ class LowFreqBacktestingStrategy(BacktestingStrategy):
     def current_date_str(self):
         return self.__current_date_str
 
+    def extend(self, end_date, ext_status_data=None):
+        """
+        从状态快照恢复后延长回测区间
+
+        Parameters
+        ==================
+        end_date: str
+            新的结束日期
+        ext_status_data: list[dict] | None
+            快照之后交易日的特殊状态记录，按日期排序
+        """
+        self.__end_date = end_date
+        for record in ext_status_data or []:
+            self.__ext_status_data.append(record)
+            self.__ext_date.append(record['trade_dt'])
+
     def __handle_ext_status(self, bars):
         record = self.__ext_status_data[0]
         date_str = bars.getDateTime().strftime("%Y%m%d")
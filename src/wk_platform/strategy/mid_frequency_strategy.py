@@ -146,6 +146,10 @@ class MidFreqBacktestingStrategy(BacktestingStrategy):
 
 
 class MidFreqIntraDaySubStrategy(BacktestingStrategy):
+    """
+    日内子策略，创建一次后在每个调仓日通过reset更换日内行情feed并同步日间Broker的状态
+    """
+
     def __init__(self, bar_feed, *,
                  broker_cls=None, config=StrategyConfiguration()):
         super().__init__(bar_feed, broker_cls, config)
@@ -172,6 +176,27 @@ class MidFreqIntraDaySubStrategy(BacktestingStrategy):
     def on_bars(self, bars):
         pass
 
+    def reset(self, bar_feed, broker_status, bars):
+        """
+        准备运行新交易日的日内行情，除注册的回调外，策略及Broker的状态均恢复为新创建时的取值
+
+        Parameters
+        ==================
+        bar_feed:
+            当日的日内行情feed
+        broker_status: BrokerStatus
+            日间Broker导出的状态
+        bars:
+            日间策略当日的行情
+        """
+        # broker需要先于策略订阅feed的事件
+        self.getBroker().reset(bar_feed, broker_status, bars)
+        self._replace_feed(bar_feed)
+        # 日志时间取自新的dispatcher
+        self.setUseEventDateTimeInLogs(True)
+        self.__current_dt_str = None
+        self.__stop_pnl_exclude = {}
+
     @classmethod
     def switch_broker_status(cls, source_broker: BaseBacktestBroker, target_broker: BaseBacktestBroker):
         status = source_broker.export_status()
@@ -37,6 +37,7 @@ from pyalgotrade import dispatcher
 from pyalgotrade.barfeed import resampled
 from wk_platform.config.enums import PriceType
 from wk_platform.util.future import FutureUtil
+from wk_platform.util.profiler import profile_section
 
 from wk_util import logger
 
@@ -1074,7 +1075,8 @@ class BaseStrategy(object, metaclass=abc.ABCMeta):
         self.__notifyAnalyzers(lambda s: s.beforeOnBars(self, bars))
 
         self.__logger.info("onBars called")
-        self.onBars(bars)
+        with profile_section('strategy.on_bars'):
+            self.onBars(bars)
 
         # 修改了顺序
         # self.__logger.info("__onBars call notifyAnalyzer beforeOnBars")
@@ -1083,16 +1085,60 @@ class BaseStrategy(object, metaclass=abc.ABCMeta):
         # 3: Notify that the bars were processed.
         self.__barsProcessedEvent.emit(self, bars)
 
-    def run(self):
-        """Call once (**and only once**) to run the strategy."""
+    def run(self, finish=True):
+        """Call once (**and only once**) to run the strategy.
+
+        finish为False时行情结束后不调用onFinish，可以先保存状态快照（见 :mod:`wk_platform.strategy.checkpoint`），
+        之后再调用finish结束回测
+        """
         self.__logger.info("run called")
         self.__dispatcher.run()
 
+        if finish:
+            self.finish()
+
+    def finish(self):
+        """
+        行情结束后调用onFinish
+        """
         if self.__barFeed.getCurrentBars() is not None:
             self.onFinish(self.__barFeed.getCurrentBars())
         else:
             raise Exception("Feed was empty")
 
+    def resume(self, finish=True):
+        """
+        从状态快照恢复后继续运行feed中新增交易日的行情，不再触发onStart
+        """
+        self.__rebuild_dispatcher(on_start=False)
+        self.run(finish)
+
+    def __rebuild_dispatcher(self, on_start):
+        self.__dispatcher = dispatcher.Dispatcher()
+        if on_start:
+            self.__dispatcher.getStartEvent().subscribe(self.onStart)
+        self.__dispatcher.getIdleEvent().subscribe(self.__onIdle)
+        self.__dispatcher.addSubject(self.__broker)
+        self.__dispatcher.addSubject(self.__barFeed)
+
+    def _replace_feed(self, bar_feed):
+        """
+        更换行情feed，用于重复使用的子策略：取消对原feed的订阅并订阅新的feed，之后可以再次调用run
+
+        与原feed相关的持仓对象、已注册的分析器及bar处理事件的订阅一并丢弃，与新创建的策略一致；
+        broker对feed的订阅由broker自行处理
+        """
+        self.__barFeed.getNewValuesEvent().unsubscribe(self.__onBars)
+        self.__barFeed = bar_feed
+        self.__barFeed.getNewValuesEvent().subscribe(self.__onBars)
+        self.__activePositions = set()
+        self.__orderToPosition = {}
+        self.__barsProcessedEvent = observer.Event()
+        self.__analyzers = []
+        self.__namedAnalyzers = {}
+        self.__resampledBarFeeds = []
+        self.__rebuild_dispatcher(on_start=True)
+
     def stop(self):
         """Stops a running strategy."""
         self.__dispatcher.stop()
@@ -61,6 +61,86 @@ def filter_market_data(data, instruments, with_mr=True):
 
 
 def align_calendar(data, calendar: List):
+    """
+    将每个标的的行情对齐到交易日历，缺失的交易日使用前一交易日的数据填充，ext_status标记为UNTRADABLE_FILLED_BAR
+    每个标的的对齐区间从其首个行情日开始，最后一条记录为非正常状态（如退市）时截止到最后一个行情日，否则截止到日历结束
+
+    以 (windcode, trade_dt) 的区间一次性生成全部目标行，通过位置索引前向填充缺失的交易日，
+    结果与逐标的groupby.apply的实现一致
+    """
+    if data.empty:
+        return data
+
+    columns = data.columns
+    has_ext_status = 'ext_status' in columns
+    calendar = np.sort(np.asarray(calendar, dtype=object))
+
+    # 先对标的和日期编码，排序和日历查找只在整数和去重后的日期上进行
+    code_id, code_uniques = pd.factorize(data['windcode'], sort=True)
+    date_id, date_uniques = pd.factorize(data['trade_dt'], sort=True)
+    order = np.argsort(code_id * (len(date_uniques) + 1) + date_id, kind='stable')
+    order = order[code_id[order] >= 0]  # 去掉windcode为空的行
+    code_id, date_id = code_id[order], date_id[order]
+
+    date_uniques = np.asarray(date_uniques)
+    unique_pos = np.searchsorted(calendar, date_uniques, side='left')
+    unique_in_calendar = calendar[np.minimum(unique_pos, len(calendar) - 1)] == date_uniques
+
+    # 各标的在排序后数据中的起止位置
+    boundary = np.flatnonzero(code_id[1:] != code_id[:-1]) + 1
+    first = np.concatenate([[0], boundary])
+    last = np.concatenate([boundary, [len(code_id)]]) - 1
+    codes = np.asarray(code_uniques)[code_id[first]]
+
+    lo = unique_pos[date_id[first]]
+    hi = np.full(len(first), len(calendar))
+    if has_ext_status:
+        delisted = data['ext_status'].to_numpy()[order[last]] != ExtStatus.NORMAL.value
+        last_date = date_id[last[delisted]]
+        hi[delisted] = unique_pos[last_date] + unique_in_calendar[last_date]
+
+    counts = np.maximum(hi - lo, 0)
+    grid_start = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    total = counts.sum()
+
+    # 原数据每一行在目标网格中的位置，不在日历中或超出对齐区间的行被丢弃
+    group = np.repeat(np.arange(len(first)), last - first + 1)
+    cal_pos = unique_pos[date_id]
+    in_calendar = unique_in_calendar[date_id]
+    rel_pos = cal_pos - lo[group]
+    valid = in_calendar & (rel_pos >= 0) & (rel_pos < counts[group])
+    grid_pos = grid_start[group[valid]] + rel_pos[valid]
+    if len(np.unique(grid_pos)) != len(grid_pos):
+        # 同一标的同一交易日存在多条记录，回退到逐标的实现以保持一致
+        return _align_calendar_groupby(data, calendar)
+
+    source = np.full(total, -1)
+    source[grid_pos] = np.flatnonzero(valid)
+
+    # 缺失的交易日取同一标的内最近一个有数据的行
+    present = source >= 0
+    last_present = np.maximum.accumulate(np.where(present, np.arange(total), -1))
+    last_present[last_present < np.repeat(grid_start, counts)] = -1
+    take = np.where(last_present >= 0, source[np.maximum(last_present, 0)], -1)
+
+    fill_columns = [c for c in columns if c not in ('windcode', 'trade_dt')]
+    result = data.iloc[order[np.maximum(take, 0)]].reset_index(drop=True)
+    if (take < 0).any():
+        result.loc[take < 0, fill_columns] = np.nan
+    result['windcode'] = np.repeat(codes, counts)
+    result['trade_dt'] = calendar[np.arange(total) - np.repeat(grid_start - lo, counts)]
+    if has_ext_status:
+        result['ext_status'] = result['ext_status'].where(present, ExtStatus.UNTRADABLE_FILLED_BAR.value)
+    if result[fill_columns].isna().to_numpy().any():
+        # 原数据本身存在空值时按列前向填充
+        result[fill_columns] = result.groupby('windcode', sort=False)[fill_columns].ffill()
+    return result[columns]
+
+
+def _align_calendar_groupby(data, calendar: List):
+    """
+    逐标的groupby.apply的对齐实现，重复记录时的回退实现，也用于结果核对与性能对比
+    """
     calendar = pd.DataFrame({'trade_dt': calendar})
 
     # def fill_untradable_day(df):
@@ -0,0 +1,160 @@
+"""
+回测运行性能追踪
+
+开启StrategyConfiguration.profile_runtime后，在回测的各个阶段记录耗时和内存分配，
+结果以“运行性能”表的形式添加到BackTestResult中，用于定位回测变慢的阶段
+"""
+from __future__ import annotations
+
+import functools
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+import pandas as pd
+
+PROFILE_SHEET_NAME = '运行性能'
+
+_current_profiler: ContextVar[RuntimeProfiler | None] = ContextVar('wk_platform_runtime_profiler', default=None)
+
+# 未开启性能追踪时复用同一个空上下文，避免每根bar创建新对象
+_NULL_SECTION = nullcontext()
+
+
+class _SectionStat:
+    __slots__ = ('calls', 'total', 'max', 'alloc', 'max_alloc')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.alloc = 0
+        self.max_alloc = 0
+
+
+class RuntimeProfiler:
+    """
+    按阶段名称累计调用次数、耗时与内存分配
+
+    阶段之间允许嵌套，嵌套阶段的耗时同时计入外层阶段，阶段名称使用 `.` 分隔层级
+    """
+
+    def __init__(self, trace_memory=False):
+        """
+        Parameters
+        ==================
+        trace_memory: bool
+            是否使用tracemalloc记录内存分配，开启后运行速度明显下降，各阶段耗时只适合相互比较
+        """
+        self.__trace_memory = trace_memory
+        self.__stats: OrderedDict[str, _SectionStat] = OrderedDict()
+        self.__started_tracemalloc = False
+
+    @property
+    def trace_memory(self):
+        return self.__trace_memory
+
+    @contextmanager
+    def section(self, name):
+        try:
+            stat = self.__stats[name]
+        except KeyError:
+            stat = self.__stats[name] = _SectionStat()
+
+        mem_begin = tracemalloc.get_traced_memory()[0] if self.__trace_memory else 0
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - begin
+            stat.calls += 1
+            stat.total += elapsed
+            if elapsed > stat.max:
+                stat.max = elapsed
+            if self.__trace_memory:
+                delta = tracemalloc.get_traced_memory()[0] - mem_begin
+                stat.alloc += delta
+                if delta > stat.max_alloc:
+                    stat.max_alloc = delta
+
+    @contextmanager
+    def activate(self):
+        """
+        将当前profiler设为活动状态，期间各阶段通过profile_section记录到该profiler
+        """
+        if self.__trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.__started_tracemalloc = True
+        token = _current_profiler.set(self)
+        try:
+            yield self
+        finally:
+            _current_profiler.reset(token)
+            if self.__started_tracemalloc:
+                tracemalloc.stop()
+                self.__started_tracemalloc = False
+
+    def summary(self) -> pd.DataFrame:
+        """
+        各阶段的统计结果，按首次出现的顺序排列
+        """
+        records = []
+        for name, stat in self.__stats.items():
+            record = {
+                '阶段': name,
+                '调用次数': stat.calls,
+                '总耗时(秒)': stat.total,
+                '平均耗时(毫秒)': stat.total / stat.calls * 1000 if stat.calls else 0.0,
+                '最大耗时(毫秒)': stat.max * 1000,
+            }
+            if self.__trace_memory:
+                record['净分配内存(MB)'] = stat.alloc / 2 ** 20
+                record['单次最大分配(MB)'] = stat.max_alloc / 2 ** 20
+            records.append(record)
+        return pd.DataFrame(records, columns=None if records else ['阶段']).set_index('阶段')
+
+
+def current_profiler() -> RuntimeProfiler | None:
+    return _current_profiler.get()
+
+
+def profile_section(name):
+    """
+    在活动的profiler中记录一个阶段，未开启性能追踪时不做任何操作
+
+    用法::
+
+        with profile_section('broker.onBars'):
+            ...
+    """
+    profiler = _current_profiler.get()
+    if profiler is None:
+        return _NULL_SECTION
+    return profiler.section(name)
+
+
+def profiled(name):
+    """
+    将被装饰函数的每次调用记录为一个阶段，未开启性能追踪时直接调用原函数
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _current_profiler.get()
+            if profiler is None:
+                return func(*args, **kwargs)
+            with profiler.section(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def runtime_profiler(config):
+    """
+    根据配置创建并激活profiler，未开启profile_runtime时返回空上下文
+    """
+    if not getattr(config, 'profile_runtime', False):
+        return nullcontext()
+    return RuntimeProfiler(trace_memory=getattr(config, 'profile_memory', False)).activate()
@@ -91,6 +91,10 @@ class DummyLogger(logging.Logger):
     def setLevel(self, level=None):
         pass
 
+    def __reduce__(self):
+        # 未注册到logging中，不能按名称取回，序列化时重新创建
+        return DummyLogger, (self.name,)
+
 
 def init_handler(handler):
     handler.setFormatter(Formatter(log_format))
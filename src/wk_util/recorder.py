@@ -1,5 +1,13 @@
+from __future__ import annotations
+
+import dataclasses
+import os
+import pathlib
+import tempfile
+import weakref
 from dataclasses import dataclass
 
+import numpy as np
 import pandas as pd
 
 
@@ -7,6 +15,8 @@ def dataclass_list_to_dataframe(data, cls: dataclass = None, exclude=None) -> pd
     """
     将列表形式的dataclass对象转换为DataFrame
     """
+    if isinstance(data, ColumnBuffer):
+        return data.to_dataframe()
     if cls is None:
         assert len(data) > 0
         cls = data[0].__class__
@@ -24,3 +34,221 @@ def dataclass_list_to_dataframe(data, cls: dataclass = None, exclude=None) -> pd
 
     df = pd.DataFrame(data_dict)
     return df
+
+
+def _remove_files(paths):
+    for path in paths:
+        path.unlink(missing_ok=True)
+
+
+def _read_spill_file(path):
+    return pd.read_parquet(path) if path.suffix == '.parquet' else pd.read_pickle(path)
+
+
+def _column_dtype(value):
+    """
+    根据列中第一个值确定存储类型，bool以及非数值类型统一使用object存储
+    """
+    if isinstance(value, (bool, np.bool_)):
+        return object
+    if isinstance(value, (int, np.integer)):
+        return np.int64
+    if isinstance(value, (float, np.floating)):
+        return np.float64
+    return object
+
+
+class ColumnBuffer:
+    """
+    按列存储的记录缓冲区
+
+    每个字段保存在一个numpy数组中，容量不足时按两倍扩容。整数和浮点数使用对应的数值类型存储，
+    整数列写入浮点数时提升为浮点列，写入其他类型时退化为object列；bool以及其他类型使用object存储，
+    转换为DataFrame时按列表推断类型，因此结果与逐条记录的dataclass列表转换得到的一致
+
+    设置spill_dir后，内存中的记录达到spill_rows行时写入spill_dir下的临时文件，每个文件为一个parquet行组；
+    未安装pyarrow或记录无法用parquet表示时使用pickle格式。落盘后新分配的数组沿用各列已提升的类型，
+    各块类型仍不一致的列（如object列各块分别推断）在拼接后按全部记录重新推断类型
+    """
+    INITIAL_CAPACITY = 256
+
+    def __init__(self, fields, spill_dir=None, spill_rows=65536, name='records'):
+        """
+        Parameters
+        ==================
+        fields: list[str]
+            字段名称，按该顺序输出列
+        spill_dir: str | pathlib.Path | None
+            落盘目录，为None时全部记录保存在内存中
+        spill_rows: int
+            每次落盘的行数，即parquet行组的大小
+        name: str
+            落盘文件名前缀
+        """
+        self.__fields = list(fields)
+        self.__columns: dict[str, np.ndarray] | None = None
+        # 已落盘记录中各列的存储类型，落盘后重新分配数组时沿用，避免各块的类型来回变化
+        self.__dtypes: dict[str, np.dtype] | None = None
+        self.__size = 0
+        self.__capacity = 0
+
+        self.__spill_dir = spill_dir
+        self.__spill_rows = spill_rows
+        self.__name = name
+        self.__spill_files: list[pathlib.Path] = []
+        self.__spilled_rows = 0
+        # 缓冲区被回收时删除落盘文件
+        weakref.finalize(self, _remove_files, self.__spill_files)
+
+    @classmethod
+    def from_dataclass(cls, record_type, exclude=None, **kwargs):
+        """
+        使用dataclass的字段作为列，ClassVar不作为列
+        """
+        exclude = exclude or []
+        fields = [f.name for f in dataclasses.fields(record_type) if f.name not in exclude]
+        return cls(fields, **kwargs)
+
+    @property
+    def fields(self):
+        return self.__fields
+
+    def __len__(self):
+        return self.__spilled_rows + self.__size
+
+    def __allocate(self, values):
+        self.__capacity = self.INITIAL_CAPACITY
+        if self.__dtypes is None:
+            dtypes = {name: _column_dtype(values[name]) for name in self.__fields}
+        else:
+            dtypes = self.__dtypes
+        self.__columns = {name: np.empty(self.__capacity, dtype=dtypes[name]) for name in self.__fields}
+
+    def __grow(self):
+        self.__capacity *= 2
+        for name, column in self.__columns.items():
+            grown = np.empty(self.__capacity, dtype=column.dtype)
+            grown[:self.__size] = column[:self.__size]
+            self.__columns[name] = grown
+
+    def __store(self, name, column, value):
+        kind = column.dtype.kind
+        if kind == 'i':
+            if isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_)):
+                column[self.__size] = value
+                return
+            column = column.astype(np.float64 if isinstance(value, (float, np.floating)) else object)
+            self.__columns[name] = column
+            kind = column.dtype.kind
+        if kind == 'f':
+            if isinstance(value, (float, np.floating, int, np.integer)) and not isinstance(value, (bool, np.bool_)):
+                column[self.__size] = value
+                return
+            column = column.astype(object)
+            self.__columns[name] = column
+        column[self.__size] = value
+
+    def append(self, **values):
+        """
+        追加一条记录，参数为各字段的值
+        """
+        if self.__columns is None:
+            self.__allocate(values)
+        elif self.__size == self.__capacity:
+            self.__grow()
+        columns = self.__columns
+        for name in self.__fields:
+            self.__store(name, columns[name], values[name])
+        self.__size += 1
+
+        if self.__spill_dir is not None and self.__size >= self.__spill_rows:
+            self.__spill()
+
+    def append_record(self, record):
+        """
+        追加一条dataclass记录
+        """
+        self.append(**{name: getattr(record, name) for name in self.__fields})
+
+    def __memory_frame(self) -> pd.DataFrame:
+        if self.__columns is None:
+            return pd.DataFrame({name: [] for name in self.__fields})
+        data = {}
+        for name in self.__fields:
+            column = self.__columns[name][:self.__size]
+            data[name] = column.tolist() if column.dtype == object else column
+        return pd.DataFrame(data, copy=False)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # 落盘文件随原缓冲区回收而删除，序列化时读回已落盘的记录
+        state['_ColumnBuffer__spill_files'] = [_read_spill_file(path) for path in self.__spill_files]
+        return state
+
+    def __setstate__(self, state):
+        frames = state.pop('_ColumnBuffer__spill_files')
+        self.__dict__.update(state)
+        self.__spill_files = []
+        weakref.finalize(self, _remove_files, self.__spill_files)
+        for frame in frames:
+            self.__write_spill_file(frame)
+
+    def __spill(self):
+        self.__write_spill_file(self.__memory_frame())
+
+        self.__spilled_rows += self.__size
+        self.__dtypes = {name: column.dtype for name, column in self.__columns.items()}
+        # 重新分配数组，避免覆盖之前返回的DataFrame仍在引用的内存
+        self.__columns = None
+        self.__size = 0
+        self.__capacity = 0
+
+    def __write_spill_file(self, frame):
+        spill_dir = pathlib.Path(self.__spill_dir)
+        spill_dir.mkdir(parents=True, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix=f"{self.__name}-", suffix='.parquet', dir=spill_dir)
+        os.close(fd)
+        path = pathlib.Path(path)
+        self.__spill_files.append(path)
+
+        try:
+            frame.to_parquet(path, index=False, row_group_size=len(frame))
+        except (ImportError, ValueError, TypeError):
+            # 未安装pyarrow，或object列中混有parquet无法表示的多种类型（如0与日期字符串），改为pickle格式
+            path.unlink(missing_ok=True)
+            path = path.with_suffix('.pkl')
+            self.__spill_files[-1] = path
+            frame.to_pickle(path)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        转换为DataFrame，数值列直接使用缓冲区中的数组构造，不再逐条读取记录
+
+        已落盘的记录读回后与内存中的记录按写入顺序拼接，各块类型不一致的列按全部记录重新推断类型，
+        与dataclass_list_to_dataframe的结果一致，而不是由pd.concat隐式提升
+        """
+        frame = self.__memory_frame()
+        if not self.__spill_files:
+            return frame
+        frames = [_read_spill_file(path) for path in self.__spill_files]
+        if len(frame) > 0:
+            frames.append(frame)
+        mixed = [name for name in self.__fields if len({f[name].dtype for f in frames}) > 1]
+        if mixed:
+            frames = [f.astype({name: object for name in mixed}) for f in frames]
+        result = pd.concat(frames, ignore_index=True)
+        for name in mixed:
+            result[name] = pd.Series(result[name].tolist())
+        return result
+
+    def clear(self):
+        """
+        清空全部记录并删除落盘文件
+        """
+        _remove_files(self.__spill_files)
+        self.__spill_files.clear()
+        self.__spilled_rows = 0
+        self.__columns = None
+        self.__dtypes = None
+        self.__size = 0
+        self.__capacity = 0
@@ -0,0 +1,125 @@
+"""
+测试共用的合成行情
+
+用随机生成的股票和指数日行情替换 wk_data.get 与交易日历服务的数据源，使回测可以在没有本地数据目录时运行。
+并购重组数据仍通过 wk_data 的数据模块读取包内自带的文件
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import wk_data
+from wk_data.constants import ExtStatus
+from wk_data.data_spec import DataSpec, DATA_LAYOUT_SPEC_FILE
+from wk_util.configuration import Configuration
+
+INDEX_CODES = ["000001.SH", "000016.SH", "000300.SH", "399905.SZ", "000852.SH", "399006.SZ", "000906.SH",
+               "932000.CSI"]
+
+
+class SyntheticMarket:
+    """
+    合成行情，data_end 不为None时只提供该日期及之前的数据，用于模拟数据尚未更新的情形
+    """
+
+    def __init__(self, n_codes=30, begin='20200101', end='20201231', seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.calendar = list(pd.bdate_range(begin, end).strftime('%Y%m%d'))
+        self.codes = [f"{i:06d}.SZ" for i in range(n_codes)]
+        self.data_end = None
+        self.__stock = self.__make_stock()
+        self.__index = {code: self.__make_index(code) for code in INDEX_CODES}
+        self.__get = wk_data.get
+
+    def __make_stock(self):
+        rows = []
+        for code in self.codes:
+            price = 10.0
+            for date in self.calendar:
+                pre_close = price
+                price = max(1.0, price * (1 + self.rng.normal(0, 0.02)))
+                rows.append(dict(
+                    trade_dt=date, windcode=code, pre_close=pre_close,
+                    open=pre_close * (1 + self.rng.normal(0, 0.005)), high=price * 1.01, low=price * 0.99,
+                    close=price, industry_name='x', volume=float(self.rng.integers(1000, 100000)), st='',
+                    suspension=int(self.rng.random() < 0.01), sec_name=code, max_up_down=0, list_date='20000101',
+                    amount=float(self.rng.integers(1e5, 1e7)), adj_factor=1.0, delist_date=None,
+                    ext_status=ExtStatus.NORMAL.value, amount_ma=1e6
+                ))
+        return pd.DataFrame(rows)
+
+    def __make_index(self, code):
+        price = 1000 * np.cumprod(1 + self.rng.normal(0, 0.01, len(self.calendar)))
+        return pd.DataFrame(dict(trade_dt=self.calendar, windcode=code, open=price, close=price, high=price,
+                                 low=price, volume=1e6, amount=1e9))
+
+    def weights(self, n_rebalance=12, k=10, seed=1):
+        """
+        随机生成的调仓权重，调仓日在交易日历上均匀分布
+        """
+        rng = np.random.default_rng(seed)
+        dates = self.calendar[::len(self.calendar) // n_rebalance][:n_rebalance]
+        rows = []
+        for date in dates:
+            weight = rng.random(k)
+            weight /= weight.sum()
+            rows += [dict(date=int(date), windcode=code, weight=w)
+                     for code, w in zip(rng.choice(self.codes, k, replace=False), weight)]
+        return pd.DataFrame(rows)
+
+    def __slice(self, data, begin_date, end_date):
+        if end_date is None or (self.data_end is not None and end_date > self.data_end):
+            end_date = self.data_end
+        if begin_date is not None:
+            data = data[data['trade_dt'] >= begin_date]
+        if end_date is not None:
+            data = data[data['trade_dt'] <= end_date]
+        return data.reset_index(drop=True)
+
+    def trade_calendar(self, begin_date=None, end_date=None):
+        calendar = pd.DataFrame({'trade_dt': self.calendar})
+        return self.__slice(calendar, begin_date, end_date)['trade_dt'].tolist()
+
+    def index_market(self, instrument=None, begin_date=None, end_date=None):
+        codes = [instrument] if instrument else INDEX_CODES
+        return self.__slice(pd.concat([self.__index[c] for c in codes]), begin_date, end_date)
+
+    def get(self, name, begin_date=None, end_date=None, instrument=None, **kwargs):
+        if name == 'trade_calendar':
+            return self.trade_calendar(begin_date, end_date)
+        if name == 'a_share_market':
+            return self.__slice(self.__stock, begin_date, end_date)
+        if name == 'index_market':
+            return self.index_market(instrument, begin_date, end_date)
+        if name in ('mr_data', 'dummy_data'):
+            return self.__get(name, begin_date=begin_date, end_date=end_date, **kwargs)
+        raise KeyError(name)
+
+
+@pytest.fixture(scope='session')
+def market():
+    import wk_data.data.calendar_service as calendar_service
+    market = SyntheticMarket()
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(wk_data, 'get', market.get)
+        mp.setattr(calendar_service, '_load_calendar', market.trade_calendar)
+        mp.setattr(calendar_service, '_load_index', lambda symbol: market.index_market(symbol))
+        # 数据截止日期变化时交易日历服务重新载入
+        mp.setattr(calendar_service, '_index_update_date', lambda: market.data_end or market.calendar[-1])
+        yield market
+        market.data_end = None
+
+
+@pytest.fixture
+def data_spec(tmp_path, monkeypatch):
+    """
+    以临时目录作为数据目录并创建数据布局文件，避免读写真实的数据目录
+    """
+    monkeypatch.setitem(Configuration()._config['store'], 'data_dir2', str(tmp_path))
+    data_dir = Configuration().data_dir
+    data_dir.mkdir(parents=True, exist_ok=True)
+    data_dir.joinpath(DATA_LAYOUT_SPEC_FILE).write_text("[daily]\nupdate_date = '20200101'\n")
+    spec = DataSpec.__new__(DataSpec)
+    spec.__init__(data_dir)
+    monkeypatch.setattr(DataSpec, '_instance', spec, raising=False)
+    return spec
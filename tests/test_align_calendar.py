@@ -0,0 +1,70 @@
+"""
+向量化的align_calendar与逐标的groupby实现的结果一致
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from wk_data.constants import ExtStatus
+from wk_platform.util.data import align_calendar, _align_calendar_groupby
+
+CALENDAR = list(pd.bdate_range('20200101', '20200630').strftime('%Y%m%d'))
+
+
+def _market_data(seed, n_codes=20, missing_ratio=0.1, delist_ratio=0.2):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n_codes):
+        code = f"{i:06d}.SZ"
+        dates = CALENDAR[rng.integers(0, len(CALENDAR) // 2):]
+        if rng.random() < delist_ratio:
+            dates = dates[:rng.integers(1, len(dates) + 1)]
+        dates = [d for d in dates if rng.random() >= missing_ratio] or dates[:1]
+        for d in dates:
+            rows.append(dict(windcode=code, trade_dt=d, close=rng.random() * 100,
+                             volume=int(rng.integers(0, 10000)), ext_status=ExtStatus.NORMAL.value))
+        if len(dates) < len(CALENDAR) and dates[-1] != CALENDAR[-1] and rng.random() < 0.5:
+            rows[-1]['ext_status'] = ExtStatus.DUMMY_BAR_FOR_DELISTING.value
+    return pd.DataFrame(rows).sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def _assert_same(data, calendar=CALENDAR):
+    expected = _align_calendar_groupby(data, calendar)
+    result = align_calendar(data, calendar)
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True),
+                                  check_dtype=False)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_market_data(seed):
+    _assert_same(_market_data(seed))
+
+
+def test_missing_values_are_filled_forward():
+    data = _market_data(0)
+    data.loc[data.sample(frac=0.1, random_state=0).index, 'close'] = np.nan
+    _assert_same(data)
+
+
+def test_without_ext_status():
+    _assert_same(_market_data(1).drop(columns='ext_status'))
+
+
+def test_dates_outside_calendar():
+    """
+    日历范围之外的行情被丢弃
+    """
+    data = _market_data(2)
+    first = data[data['trade_dt'] == CALENDAR[0]].assign(trade_dt='20191231')
+    last = data[data['trade_dt'] == CALENDAR[-1]].assign(trade_dt='20200701')
+    _assert_same(pd.concat([first, data, last], ignore_index=True))
+
+
+def test_duplicated_records():
+    data = _market_data(3)
+    _assert_same(pd.concat([data, data.head(5)], ignore_index=True))
+
+
+def test_empty_data():
+    data = _market_data(4).head(0)
+    assert align_calendar(data, CALENDAR).empty
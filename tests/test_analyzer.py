@@ -0,0 +1,68 @@
+"""
+回测指标算子默认在当前线程中顺序执行，并行执行时各项指标与顺序执行的结果一致
+"""
+import threading
+
+import pandas as pd
+import pytest
+
+import wk_platform.backtest.analyzer as analyzer
+from wk_platform.backtest.analyzer import AnalyzerContext, BaseAnalyzer, run_analyzers
+from wk_platform.contrib.strategy import WeightStrategy, WeightStrategyConfiguration
+
+
+class _ThreadAnalyzer(BaseAnalyzer):
+    def __init__(self, threads):
+        super().__init__()
+        self.threads = threads
+
+    def _analyze(self, context):
+        self.threads.append(threading.get_ident())
+
+
+def _analyzers(threads, n=4):
+    return [type(f'_Analyzer{i}', (_ThreadAnalyzer,), {})(threads) for i in range(n)]
+
+
+def test_serial_by_default(monkeypatch):
+    monkeypatch.setattr(analyzer.os, 'cpu_count', lambda: 4)
+    threads = []
+    context = AnalyzerContext()
+    run_analyzers(_analyzers(threads), context)
+    assert threads == [threading.get_ident()] * 4
+    assert all(context.finished(f'_Analyzer{i}') for i in range(4))
+
+
+def test_parallel_when_requested():
+    threads = []
+    run_analyzers(_analyzers(threads), AnalyzerContext(), max_workers=4)
+    assert len(threads) == 4
+    assert threading.get_ident() not in threads
+
+
+def _sheets(market, analyzer_workers):
+    config = WeightStrategyConfiguration(progress_bar=False, analyzer_workers=analyzer_workers)
+    strategy = WeightStrategy(market.weights(), market.calendar[0], market.calendar[-1], config=config)
+    strategy.run()
+    result = strategy.result
+    return {name: result[name] for name in result.keys()}
+
+
+def _assert_same(left, right, name):
+    if isinstance(right, pd.DataFrame):
+        pd.testing.assert_frame_equal(left, right, obj=name)
+    elif isinstance(right, dict):
+        assert list(left) == list(right), name
+        for k in right:
+            _assert_same(left[k], right[k], f'{name}.{k}')
+    else:
+        assert left == right, name
+
+
+@pytest.mark.parametrize('analyzer_workers', [4, None])
+def test_parallel_sheets_equal_serial(market, analyzer_workers):
+    serial = _sheets(market, 1)
+    parallel = _sheets(market, analyzer_workers)
+    assert list(parallel) == list(serial)
+    for name, sheet in serial.items():
+        _assert_same(parallel[name], sheet, name)
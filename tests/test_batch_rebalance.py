@@ -0,0 +1,68 @@
+"""
+批量调仓与逐笔调仓使用相同的Position与券商订单处理流程：
+不计交易费用时两者的成交和未成交记录完全一致；计入费用时批量调仓按调仓前总资产计算数量，只有成交数量略有差异
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from wk_platform.broker.brokers.extend_broker import BrokerV2
+from wk_platform.contrib.strategy import WeightStrategy, WeightStrategyConfiguration
+
+
+def _suspended_weights(market):
+    """
+    在随机权重的基础上，每个调仓日加入一只当天停牌的股票，使两种调仓方式都产生停牌未成交记录
+    """
+    weight = market.weights()
+    stock = market.get('a_share_market')
+    suspended = stock[stock['suspension'] == 1]
+    rows = []
+    for date in sorted(set(weight['date'])):
+        codes = suspended[suspended['trade_dt'] == str(date)]['windcode']
+        codes = codes[~codes.isin(weight[weight['date'] == date]['windcode'])]
+        if len(codes) > 0:
+            rows.append(dict(date=date, windcode=codes.iloc[0], weight=0.05))
+    return pd.concat([weight, pd.DataFrame(rows)], ignore_index=True)
+
+
+def _run(market, weight, batch_rebalance, **kwargs):
+    config = WeightStrategyConfiguration(progress_bar=False, batch_rebalance=batch_rebalance, **kwargs)
+    strategy = WeightStrategy(weight, market.calendar[0], market.calendar[-1], config=config, broker_cls=BrokerV2)
+    strategy.run()
+    return strategy.result
+
+
+def test_same_transactions_without_fees(market):
+    weight = _suspended_weights(market)
+    serial = _run(market, weight, False, commission=0, stamp_tax=0)
+    batch = _run(market, weight, True, commission=0, stamp_tax=0)
+    assert (serial['未成交记录']['原因'] == '停牌').any()
+    pd.testing.assert_frame_equal(batch['交易流水'], serial['交易流水'])
+    pd.testing.assert_frame_equal(batch['未成交记录'], serial['未成交记录'])
+    pd.testing.assert_frame_equal(batch['策略指标'], serial['策略指标'])
+
+
+def test_sizing_on_pre_rebalance_equity(market):
+    """
+    逐笔调仓每笔成交后按扣除佣金的最新总资产计算下一笔订单，批量调仓统一使用调仓前的总资产，
+    因此同一组订单的标的、方向和价格相同，买入数量略多
+    """
+    weight = _suspended_weights(market)
+    serial = _run(market, weight, False)['交易流水']
+    batch = _run(market, weight, True)['交易流水']
+    columns = ['证券代码', '成交方向', '成交价格']
+    pd.testing.assert_frame_equal(batch[columns], serial[columns])
+
+    first_day = batch.index[0]
+    serial_buy = serial.loc[[first_day]]['成交数量'].to_numpy()
+    batch_buy = batch.loc[[first_day]]['成交数量'].to_numpy()
+    # 最后一笔买单受可用现金限制部分成交，其余订单批量调仓的数量不少于逐笔调仓
+    assert np.all(batch_buy[:-1] >= serial_buy[:-1])
+    assert np.any(batch_buy[:-1] > serial_buy[:-1])
+
+    def turnover(transactions):
+        return (transactions['成交价格'] * transactions['成交数量']).sum()
+
+    assert turnover(batch) == pytest.approx(turnover(serial), rel=1e-3)
+
@@ -0,0 +1,54 @@
+"""
+批量回测：指数净值在fork之前载入，子进程不再重复计算，结果与单独回测一致
+"""
+import os
+
+import pandas as pd
+
+import wk_platform.backtest.benchmark as benchmark
+from wk_platform.contrib.strategy import WeightStrategy, WeightStrategyConfiguration
+from wk_platform.contrib.strategy.weight_strategy import BatchWeightStrategy
+from wk_platform.contrib.util import first_weight_date
+
+
+def _weight_files(market, tmp_path):
+    weights = {
+        'a': market.weights(seed=1),
+        # 首个调仓日不同的权重，使用不同的回测区间
+        'b': market.weights(seed=2).query(f"date > {market.calendar[30]}"),
+    }
+    files = []
+    for name, weight in weights.items():
+        path = tmp_path / f'{name}.csv'
+        weight.to_csv(path, index=False, encoding='gbk')
+        files.append(path)
+    return weights, files
+
+
+def test_first_weight_date(market):
+    weight = market.weights()
+    dates = sorted(set(weight['date'].astype(str)))
+    assert first_weight_date(weight, market.calendar[0], market.calendar[-1]) == dates[0]
+    assert first_weight_date(weight, dates[1], market.calendar[-1]) == dates[1]
+    assert first_weight_date(weight, '20300101', '20301231') is None
+
+
+def test_index_bench_prepared_before_fork(market, tmp_path, monkeypatch):
+    weights, files = _weight_files(market, tmp_path)
+    parent = os.getpid()
+    prepare_index_bench = benchmark.prepare_index_bench
+
+    def prepare_in_parent(*args, **kwargs):
+        assert os.getpid() == parent, 'index bench prepared in a forked worker'
+        return prepare_index_bench(*args, **kwargs)
+
+    monkeypatch.setattr(benchmark, 'prepare_index_bench', prepare_in_parent)
+    config = WeightStrategyConfiguration(progress_bar=False)
+    batch = BatchWeightStrategy(files, market.calendar[0], market.calendar[-1], config=config, max_process=2)
+    batch.run()
+    assert batch.result_set.errors == {}
+
+    for name, weight in weights.items():
+        single = WeightStrategy(weight, market.calendar[0], market.calendar[-1], config=config)
+        single.run()
+        pd.testing.assert_frame_equal(batch.result_set[name]['策略指标'], single.result['策略指标'])
@@ -0,0 +1,79 @@
+"""
+权重回测的状态快照：从快照恢复并继续回测的结果应与一次性完成的回测一致
+"""
+import pickle
+
+import pandas as pd
+import pytest
+
+from wk_data.data.mr_data import MRRecord
+from wk_platform.contrib.strategy import WeightStrategy, WeightStrategyConfiguration
+from wk_platform.strategy.checkpoint import StrategySnapshot
+
+
+def _config():
+    return WeightStrategyConfiguration(progress_bar=False, stop_loss=-0.08)
+
+
+def _assert_result_equal(expected, actual):
+    assert list(expected.keys()) == list(actual.keys())
+    for name in expected.keys():
+        x, y = expected[name], actual[name]
+        if isinstance(x, pd.DataFrame):
+            pd.testing.assert_frame_equal(x, y, obj=name)
+        elif isinstance(x, pd.Series):
+            pd.testing.assert_series_equal(x, y, obj=name)
+        else:
+            assert repr(x) == repr(y), name
+
+
+@pytest.fixture(scope='module')
+def full_result(market):
+    strategy = WeightStrategy(market.weights(), market.calendar[0], market.calendar[-1], config=_config())
+    strategy.run()
+    return strategy.result
+
+
+def test_mr_records_are_picklable(market):
+    """
+    并购重组记录由数据模块动态加载，快照中包含这些记录，必须可以被pickle
+    """
+    import wk_data
+    mr_map = wk_data.get('mr_data')
+    assert len(mr_map) > 0
+    assert all(isinstance(record, MRRecord) for record in mr_map.values())
+    assert pickle.loads(pickle.dumps(mr_map)) == mr_map
+
+
+def test_resume_from_dumped_snapshot(market, full_result, tmp_path):
+    calendar = market.calendar
+    part = WeightStrategy(market.weights(), calendar[0], calendar[150], config=_config(), checkpoint=True)
+    part.run()
+    assert part.snapshot.last_date == calendar[150]
+
+    path = tmp_path / 'snapshot.pkl'
+    part.snapshot.dump(path)
+    resumed = WeightStrategy.resume(StrategySnapshot.load(path), calendar[200], weight=market.weights())
+    resumed = WeightStrategy.resume(resumed.snapshot, calendar[-1], weight=market.weights())
+    _assert_result_equal(full_result, resumed.result)
+
+
+def test_resume_skips_scheduled_rebalance_dates(market, full_result):
+    """
+    结束日期晚于最新数据时，原回测的权重表已包含快照之后的调仓日，恢复时传入同一权重表不应重复添加
+    """
+    calendar = market.calendar
+    weight = market.weights()
+    rebalance_dates = sorted(set(weight['date'].astype(str)))
+    last_date = calendar[calendar.index(rebalance_dates[7]) - 1]
+
+    market.data_end = last_date
+    try:
+        part = WeightStrategy(weight, calendar[0], rebalance_dates[8], config=_config(), checkpoint=True)
+        part.run()
+    finally:
+        market.data_end = None
+    assert part.snapshot.last_date == last_date
+
+    resumed = WeightStrategy.resume(part.snapshot, calendar[-1], weight=market.weights())
+    _assert_result_equal(full_result, resumed.result)
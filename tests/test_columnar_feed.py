@@ -0,0 +1,94 @@
+"""
+列式feed解析出的行与bar与逐行（itertuples）解析的结果一致，回测结果相同
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from pyalgotrade.bar import Frequency
+
+from wk_platform.contrib.strategy import WeightStrategy, WeightStrategyConfiguration
+from wk_platform.contrib.strategy.weight_strategy import prepare_feed
+from wk_platform.feed.mixed_feed import MixedFeed
+from wk_platform.feed.parser import RowParser
+
+
+class _RecordingParser(RowParser):
+    """
+    将行数据原样记录为字典，用于比较两种模式下解析函数得到的字段值
+    """
+
+    def __init__(self, columns):
+        super().__init__(None, None, Frequency.DAY)
+        self.__columns = columns
+
+    def parse_row(self, row):
+        return row.windcode, {c: getattr(row, c) for c in self.__columns}
+
+
+def _frame():
+    dates = pd.bdate_range('20200101', periods=5)
+    data = pd.DataFrame([(d, f"{i:06d}.SZ") for d in dates for i in range(3)], columns=['date', 'windcode'])
+    n = len(data)
+    data['trade_dt'] = data['date'].dt.strftime('%Y%m%d')
+    data['close'] = np.where(np.arange(n) % 4 == 0, np.nan, np.arange(n) * 1.5)
+    data['volume'] = np.arange(n, dtype=np.int64)
+    data['st'] = np.where(np.arange(n) % 2 == 0, '', 'ST')
+    data['flag'] = np.arange(n) % 3 == 0
+    data['list_date'] = pd.Timestamp('20100101') + pd.to_timedelta(np.arange(n), unit='D')
+    data.loc[1, 'list_date'] = pd.NaT
+    data['update_time'] = data['date'].dt.tz_localize('Asia/Shanghai')
+    data['holding'] = pd.to_timedelta(np.arange(n), unit='h')
+    return data
+
+
+def _same(a, b):
+    if pd.isna(a) or pd.isna(b):
+        return pd.isna(a) and pd.isna(b) and type(a) is type(b)
+    return a == b and type(a) is type(b)
+
+
+def _parsed(columnar, data):
+    feed = MixedFeed(columnar=columnar)
+    feed.add_data_from_dataframe('test', 'trade_dt', data, _RecordingParser(list(data.columns)))
+    return {date: dict(macro_bars.items()) for date, macro_bars in feed.get_data_seq().items()}
+
+
+def test_columnar_rows_match_itertuples():
+    data = _frame()
+    columnar = _parsed(True, data)
+    rows = _parsed(False, data)
+    assert list(columnar) == list(rows)
+    for date, bars in rows.items():
+        assert list(columnar[date]) == list(bars)
+        for inst, row in bars.items():
+            for col, value in row.items():
+                assert _same(columnar[date][inst][col], value), (date, inst, col)
+    first = columnar[data['trade_dt'].iloc[0]][data['windcode'].iloc[0]]
+    assert isinstance(first['list_date'], pd.Timestamp)
+    assert first['update_time'] == data['update_time'].iloc[0]
+    assert isinstance(first['holding'], pd.Timedelta)
+
+
+def _bar_states(feed):
+    return {date: {inst: bar_.__getstate__() for inst, bar_ in macro_bars.items()}
+            for date, macro_bars in feed.get_data_seq().items()}
+
+
+def test_columnar_feed_bars(market):
+    states = {}
+    for columnar in (False, True):
+        config = WeightStrategyConfiguration(progress_bar=False, columnar_feed=columnar)
+        feed, _ = prepare_feed(market.calendar[0], market.calendar[-1], market.codes, config)
+        states[columnar] = _bar_states(feed)
+    assert states[True] == states[False]
+
+
+@pytest.mark.parametrize('sheet', ['策略指标', '策略净值', '交易流水', '未成交记录', '每日持仓'])
+def test_columnar_feed_backtest(market, sheet):
+    results = {}
+    for columnar in (False, True):
+        config = WeightStrategyConfiguration(progress_bar=False, columnar_feed=columnar)
+        strategy = WeightStrategy(market.weights(), market.calendar[0], market.calendar[-1], config=config)
+        strategy.run()
+        results[columnar] = strategy.result[sheet]
+    pd.testing.assert_frame_equal(results[True], results[False])
@@ -0,0 +1,155 @@
+"""
+分片数据按年份/代码写入临时数据目录，读取时的列与行过滤结果与pandas过滤一致；
+h5分片迁移为parquet后通过数据布局文件切换格式，读取结果不变
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import wk_data.proc_util as pu
+from wk_data.data_spec import DataSpec
+from wk_data.data_shard import YearlyShardData, CodeShardData, migrate_shard_data
+
+CODES = [f"{i:06d}.SZ" for i in range(6)]
+
+
+def _market_data(seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('20190101', '20201231').strftime('%Y%m%d')
+    data = pd.DataFrame([(d, c) for d in dates for c in CODES], columns=['trade_dt', 'windcode'])
+    data['close'] = rng.random(len(data)) * 100
+    data['volume'] = rng.integers(0, 10000, len(data))
+    return data
+
+
+MARKET = _market_data()
+
+
+def _yearly_fetch(begin_date, end_date):
+    return MARKET[(MARKET['trade_dt'] >= begin_date) & (MARKET['trade_dt'] <= end_date)].reset_index(drop=True)
+
+
+def _code_fetch(code):
+    return MARKET[MARKET['windcode'] == code].reset_index(drop=True)
+
+
+def _expected(begin_date, end_date, columns=None, instruments=None):
+    data = MARKET[(MARKET['trade_dt'] >= begin_date) & (MARKET['trade_dt'] <= end_date)]
+    if instruments is not None:
+        data = data[data['windcode'].isin(instruments)]
+    if columns is not None:
+        data = data[columns]
+    return data.reset_index(drop=True)
+
+
+def _yearly(file_type):
+    return YearlyShardData('test_market', fetch=True, fetch_func=_yearly_fetch, file_type=file_type)
+
+
+def _code(file_type):
+    return CodeShardData(CODES, 'test_code_market', fetch=True, fetch_func=_code_fetch, file_type=file_type)
+
+
+@pytest.fixture
+def read_parquet_calls(monkeypatch):
+    calls = []
+    read_parquet = pd.read_parquet
+
+    def spy(path, **kwargs):
+        calls.append(kwargs)
+        return read_parquet(path, **kwargs)
+
+    monkeypatch.setattr(pu.pd, 'read_parquet', spy)
+    return calls
+
+
+@pytest.mark.parametrize('file_type', ['h5', 'pkl', 'parquet'])
+def test_yearly_fetch_data(data_spec, file_type, read_parquet_calls):
+    shard = _yearly(file_type)
+    columns = ['windcode', 'close']
+    instruments = CODES[1:3]
+    result = shard.fetch_data('20190601', '20200315', columns=columns, instruments=instruments)
+    pd.testing.assert_frame_equal(result.reset_index(drop=True),
+                                  _expected('20190601', '20200315', columns, instruments))
+    pd.testing.assert_frame_equal(shard.fetch_data('20190101', '20201231').reset_index(drop=True),
+                                  _expected('20190101', '20201231'))
+
+    if file_type == 'parquet':
+        # 列与过滤条件下推至parquet读取
+        assert read_parquet_calls[0]['columns'] == columns
+        assert read_parquet_calls[0]['filters'] == [('trade_dt', '>=', '20190601'), ('trade_dt', '<=', '20200315'),
+                                                    ('windcode', 'in', instruments)]
+    else:
+        assert read_parquet_calls == []
+
+
+@pytest.mark.parametrize('file_type', ['h5', 'parquet'])
+def test_code_fetch_data(data_spec, file_type, read_parquet_calls):
+    shard = _code(file_type)
+    result = shard.fetch_data('20190601', '20200315', columns=['trade_dt', 'volume'])
+    expected = MARKET[(MARKET['trade_dt'] >= '20190601') & (MARKET['trade_dt'] <= '20200315')]
+    # 按代码分片时结果按代码顺序拼接
+    expected = expected.sort_values('windcode', kind='stable')[['trade_dt', 'volume']].reset_index(drop=True)
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), expected)
+
+    result = shard.fetch_data('20200101', instrument=CODES[2], columns=['close'])
+    pd.testing.assert_frame_equal(result.reset_index(drop=True),
+                                  _expected('20200101', '20201231', ['close'], [CODES[2]]))
+    if file_type == 'parquet':
+        assert read_parquet_calls[-1]['columns'] == ['close']
+        assert read_parquet_calls[-1]['filters'] == [('trade_dt', '>=', '20200101')]
+
+
+def test_replace_shard_files(data_spec):
+    data_spec.add_shard_data_spec('test_market', type_='yearly_shard')
+    data_spec.add_yearly_shard_file('test_market', 2019)
+    data_spec.add_yearly_shard_file('test_market', 2020)
+    data_spec.set_shard_update_date('test_market', '20201231')
+    assert data_spec.shard_files('test_market') == {
+        'test_market_2019': 'test_market_2019.h5', 'test_market_2020': 'test_market_2020.h5'}
+
+    data_spec.replace_shard_files('test_market', {'test_market_2020': 'test_market_2020.parquet'}, 'parquet')
+    assert data_spec.shard_files('test_market') == {
+        'test_market_2019': 'test_market_2019.h5', 'test_market_2020': 'test_market_2020.parquet'}
+    assert data_spec.get_shard_file_type('test_market') == 'parquet'
+    assert data_spec.get_shard_update_date('test_market') == '20201231'
+
+    # 重新载入布局文件后内容一致
+    data_spec.load()
+    assert data_spec.get_shard_file_type('test_market') == 'parquet'
+    assert data_spec.shard_files('test_market')['test_market_2020'] == 'test_market_2020.parquet'
+
+
+def test_shard_file_name():
+    for file_type in pu.SHARD_FILE_TYPES:
+        assert DataSpec.shard_file_name('test_market', 2020, file_type) == f'test_market_2020.{file_type}'
+    with pytest.raises(AssertionError):
+        DataSpec.shard_file_name('test_market', 2020, 'csv')
+
+
+@pytest.mark.parametrize('remove_old', [False, True])
+def test_migrate_h5_to_parquet(data_spec, remove_old, read_parquet_calls):
+    data_dir = data_spec.yearly_shard_file_path('test_market', 2019).parent
+    columns = ['windcode', 'volume']
+    instruments = CODES[:2]
+    h5 = _yearly('h5').fetch_data('20190301', '20201130', columns=columns, instruments=instruments)
+    h5_files = sorted(p.name for p in data_dir.glob('test_market_*.h5'))
+    assert h5_files == ['test_market_2019.h5', 'test_market_2020.h5']
+
+    new_files = migrate_shard_data('test_market', 'parquet', remove_old=remove_old)
+    assert new_files == ['test_market_2019.parquet', 'test_market_2020.parquet']
+    assert data_spec.get_shard_file_type('test_market') == 'parquet'
+    assert sorted(data_spec.shard_files('test_market').values()) == new_files
+    assert all(data_dir.joinpath(f).exists() for f in new_files)
+    assert all(data_dir.joinpath(f).exists() != remove_old for f in h5_files)
+    # 已迁移的数据再次迁移时不做任何操作
+    assert migrate_shard_data('test_market', 'parquet') == []
+
+    # 构造时指定的格式被布局文件中记录的格式覆盖
+    shard = _yearly('h5')
+    assert shard.file_type == 'parquet'
+    parquet = shard.fetch_data('20190301', '20201130', columns=columns, instruments=instruments)
+    assert len(read_parquet_calls) == 2
+    expected = _expected('20190301', '20201130', columns, instruments)
+    pd.testing.assert_frame_equal(parquet.reset_index(drop=True), expected)
+    pd.testing.assert_frame_equal(h5.reset_index(drop=True), expected)
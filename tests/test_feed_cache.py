@@ -0,0 +1,68 @@
+"""
+行情缓存键区分partial绑定的参数，数据布局文件data_spec.toml改变后旧缓存失效
+"""
+from functools import partial
+
+import pandas as pd
+
+from wk_platform.contrib.util import PreprocessorSeq
+from wk_platform.feed.feed_cache import FeedCache, preprocessor_name
+from wk_platform.feed.mixed_feed import load_feed_data
+from wk_platform.feed.parser import IndexDataRowParser
+
+
+def _scale(data, factor=1.0):
+    return data.assign(close=data['close'] * factor)
+
+
+def _select(data, func):
+    return func(data)
+
+
+def test_partial_arguments_in_name():
+    names = {
+        preprocessor_name(_scale),
+        preprocessor_name(partial(_scale, factor=2.0)),
+        preprocessor_name(partial(_scale, factor=3.0)),
+        preprocessor_name(partial(_scale, 2.0)),
+        preprocessor_name(partial(_select, func=partial(_scale, factor=2.0))),
+        preprocessor_name(partial(_select, func=partial(_scale, factor=3.0))),
+        preprocessor_name(PreprocessorSeq(partial(_scale, factor=2.0), _scale)),
+        preprocessor_name(PreprocessorSeq(partial(_scale, factor=3.0), _scale)),
+    }
+    assert len(names) == 8
+    # 名称不依赖对象的内存地址，不同进程中计算的缓存键一致
+    assert preprocessor_name(partial(_select, func=_scale)) == preprocessor_name(partial(_select, func=_scale))
+
+
+def _load(market, cache, preprocessor):
+    return load_feed_data('index_market', IndexDataRowParser, market.calendar[0], market.calendar[-1], 'index',
+                          preprocessor, cache=cache)
+
+
+def test_no_key_collision_between_partials(market, tmp_path, data_spec):
+    cache = FeedCache(tmp_path / 'cache')
+    raw = market.get('index_market', market.calendar[0], market.calendar[-1])
+    for factor in (2.0, 3.0):
+        pd.testing.assert_frame_equal(_load(market, cache, partial(_scale, factor=factor)), _scale(raw, factor))
+    # 再次读取时命中各自的缓存
+    for factor in (2.0, 3.0):
+        pd.testing.assert_frame_equal(_load(market, cache, partial(_scale, factor=factor)), _scale(raw, factor))
+    assert len(list(cache.root.joinpath(cache.revision()).glob('*.pkl'))) == 2
+
+
+def test_invalidated_when_data_spec_changes(market, tmp_path, data_spec):
+    cache = FeedCache(tmp_path / 'cache')
+    key = cache.make_key(dataset='index_market')
+    cache.dump(key, _scale(market.get('index_market'), 2.0))
+    old_revision = cache.revision()
+    assert cache.load(key) is not None
+
+    data_spec.last_update_date = '20201231'
+    assert cache.revision() != old_revision
+    assert cache.load(key) is None
+
+    cache.dump(key, market.get('index_market'))
+    pd.testing.assert_frame_equal(cache.load(key), market.get('index_market'))
+    # 写入新修订号的缓存时清理旧的缓存目录
+    assert [p.name for p in cache.root.iterdir()] == [cache.revision()]
@@ -0,0 +1,40 @@
+"""
+fork_map捕获任务中的异常；子进程异常退出导致进程池损坏时，保留已完成的结果，未完成的任务记为失败
+"""
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from wk_platform.contrib.util import fork_map
+
+
+def _square(key, context):
+    if key == context.get('fail'):
+        raise ValueError(f'bad key {key}')
+    if key == context.get('crash'):
+        time.sleep(0.5)
+        os._exit(1)
+    return key * key * context['scale']
+
+
+@pytest.mark.parametrize('max_process', [1, 2])
+def test_errors_recorded(max_process):
+    results, errors = fork_map(_square, range(6), {'scale': 2, 'fail': 4}, max_process=max_process)
+    assert results == {k: k * k * 2 for k in (0, 1, 2, 3, 5)}
+    assert list(results) == [0, 1, 2, 3, 5]
+    assert list(errors) == [4]
+    assert 'ValueError: bad key 4' in errors[4]
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='fork is not supported')
+def test_broken_process_pool():
+    keys = list(range(8))
+    results, errors = fork_map(_square, keys, {'scale': 1, 'crash': 3}, max_process=2)
+    assert 3 in errors
+    assert 'BrokenProcessPool' in errors[3]
+    assert all(results[k] == k * k for k in results)
+    assert {0, 1, 2} <= set(results)
+    assert set(results) | set(errors) == set(keys)
+    assert not set(results) & set(errors)
@@ -0,0 +1,60 @@
+"""
+按需生成的日内feed与逐日预先构建全部feed的结果一致
+"""
+from collections import OrderedDict
+
+import pytest
+from pyalgotrade.bar import Frequency
+
+from wk_platform.contrib.strategy.base_intra_day_strategy import (
+    gen_intra_day_market_data, gen_intra_day_index_data, build_intra_day_feeds
+)
+from wk_platform.feed.fast_feed import StockFeed, StockIndexSynthETFFeed
+from wk_platform.util.data import add_normal_ext_status
+
+
+def _eager_feeds(data, intra_day_index_data, allow_synth=False):
+    """
+    原先的实现：按日期分组，预先构建全部交易日的feed
+    """
+    feeds = OrderedDict()
+    data['date'] = data['trade_dt'].apply(lambda dt: dt[:8])
+    for k, group in data.groupby('date'):
+        feeds[k] = StockIndexSynthETFFeed(frequency=Frequency.TRADE) if allow_synth \
+            else StockFeed(frequency=Frequency.TRADE)
+        feeds[k].add_stock_bars(group)
+
+    intra_day_index_data['date'] = intra_day_index_data['trade_dt'].apply(lambda dt: dt[:8])
+    intra_day_index_data = add_normal_ext_status(intra_day_index_data)
+    for k, group in intra_day_index_data.groupby('date'):
+        feeds[k].add_index_bars(group)
+        if allow_synth:
+            feeds[k].add_synth_index_etf_bars(group)
+        feeds[k].prefetch()
+    return feeds
+
+
+def _bar_states(feed):
+    return {dt: {inst: bar_.__getstate__() for inst, bar_ in bars.items()}
+            for dt, bars in feed.get_data_seq().items()}
+
+
+@pytest.mark.parametrize('allow_synth', [False, True])
+def test_lazy_feed_matches_eager(market, allow_synth):
+    days = market.calendar[::20]
+    data = market.get('a_share_market')
+    index_data = market.get('index_market')
+    intra_day_data = gen_intra_day_market_data(data, days)
+    id_index_data = gen_intra_day_index_data(index_data, days)
+
+    eager = _eager_feeds(intra_day_data.copy(), id_index_data.copy(), allow_synth=allow_synth)
+    lazy = build_intra_day_feeds(intra_day_data, id_index_data, allow_synth=allow_synth)
+    assert lazy.dates() == list(eager.keys()) == days
+    assert len(lazy) == len(days)
+    assert days[1] in lazy and market.calendar[1] not in lazy
+    # 按任意顺序访问，同一交易日可重复生成
+    for day in reversed(days):
+        states = _bar_states(lazy[day])
+        assert list(states) == [day + '0930', day + '1500']
+        assert states == _bar_states(eager[day])
+    assert _bar_states(lazy[days[0]]) == _bar_states(eager[days[0]])
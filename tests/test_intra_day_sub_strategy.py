@@ -0,0 +1,83 @@
+"""
+日内子策略在各调仓日之间重复使用：reset后的状态与新创建的子策略一致，
+连续多个调仓日的成交与每个调仓日新建子策略的结果相同
+"""
+import pandas as pd
+import pytest
+
+import wk_platform.contrib.strategy.base_intra_day_strategy as base_intra_day_strategy
+from wk_platform.broker.brokers import IntraDayBroker
+from wk_platform.contrib.strategy.base_intra_day_strategy import (
+    IntraDayRatioStrategy, IntraDayRatioStrategyConfiguration, build_intra_day_feeds,
+    gen_intra_day_market_data, gen_intra_day_index_data
+)
+from wk_platform.stratanalyzer import StrategyAnalyzer
+from wk_platform.strategy.mid_frequency_strategy import MidFreqIntraDaySubStrategy
+
+CONFIG = IntraDayRatioStrategyConfiguration(progress_bar=False)
+
+
+class _FreshSubStrategy(MidFreqIntraDaySubStrategy):
+    """
+    每个调仓日重新初始化子策略及日内Broker，与重复使用前每日新建子策略的做法相同
+    """
+
+    def reset(self, bar_feed, broker_status, bars):
+        callback = self._MidFreqIntraDaySubStrategy__on_bar_callback
+        MidFreqIntraDaySubStrategy.__init__(self, bar_feed, broker_cls=IntraDayBroker, config=CONFIG)
+        self.register_hook('on_bars', callback)
+        self.getBroker().update_status(broker_status)
+        self.getBroker().init_fill_strategy(bars)
+
+
+def _weights(market):
+    rows = []
+    for i, day in enumerate(market.calendar[5:120:10]):
+        rows += [dict(datetime=day + '0930', windcode=code, action='BUY', ratio=0.2)
+                 for code in market.codes[i:i + 5]]
+        # 收盘卖出前一调仓日买入的部分股票，使两个时间点都有成交
+        rows += [dict(datetime=day + '1500', windcode=code, action='SELL', ratio=0.5)
+                 for code in market.codes[max(i - 2, 0):i]]
+    return pd.DataFrame(rows)
+
+
+def _run(market):
+    strategy = IntraDayRatioStrategy(_weights(market), market.calendar[0], market.calendar[-1], config=CONFIG)
+    strategy.run()
+    return strategy.result
+
+
+@pytest.mark.parametrize('sheet', ['交易流水', '未成交记录', '每日持仓', '策略指标'])
+def test_reused_sub_strategy_matches_fresh(market, monkeypatch, sheet):
+    reused = _run(market)[sheet]
+    monkeypatch.setattr(base_intra_day_strategy, 'MidFreqIntraDaySubStrategy', _FreshSubStrategy)
+    fresh = _run(market)[sheet]
+    pd.testing.assert_frame_equal(reused, fresh)
+    if sheet == '交易流水':
+        assert reused.index.str.endswith('15:00').any()
+        assert reused.index.str[:10].nunique() > 2
+
+
+def test_reset_clears_day_state(market):
+    days = market.calendar[10:12]
+    feeds = build_intra_day_feeds(gen_intra_day_market_data(market.get('a_share_market'), days),
+                                  gen_intra_day_index_data(market.get('index_market'), days))
+    strategy = MidFreqIntraDaySubStrategy(feeds[days[0]], broker_cls=IntraDayBroker, config=CONFIG)
+    broker = strategy.getBroker()
+    strategy.attachAnalyzerEx(StrategyAnalyzer(), 'day_analyzer')
+    strategy._MidFreqIntraDaySubStrategy__stop_pnl_exclude['000001.SZ'] = True
+    broker.setAllowNegativeCash(True)
+    fill_strategy = broker.getFillStrategy()
+    strategy.run()
+    assert strategy.current_dt_str == days[0] + '1500'
+
+    strategy.reset(feeds[days[1]], broker.export_status(), None)
+    assert strategy.getBroker() is broker
+    assert strategy.current_dt_str is None
+    assert strategy.getNamedAnalyzer('day_analyzer') is None
+    assert strategy._MidFreqIntraDaySubStrategy__stop_pnl_exclude == {}
+    assert broker._IntraDayBroker__allow_negative_cash is False
+    assert broker.getFillStrategy() is not fill_strategy
+    assert broker.getActiveOrders() == []
+    strategy.run()
+    assert strategy.current_dt_str == days[1] + '1500'
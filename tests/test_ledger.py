@@ -0,0 +1,93 @@
+"""
+成交流水的汇总结果与对 to_dataframe() 做pandas分组聚合的结果一致
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from wk_platform.stratanalyzer.ledger import TransactionLedger, DIRECTIONS, DIRECTION_SIGN
+from wk_platform.stratanalyzer.record import TransactionRecord
+
+
+def _ledger(n, intraday=False, seed=0):
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range('20200101', periods=10).strftime('%Y-%m-%d')
+    ledger = TransactionLedger()
+    for _ in range(n):
+        trade_dt = rng.choice(days)
+        if intraday:
+            trade_dt = f"{trade_dt} {rng.integers(9, 15):02d}:{rng.integers(0, 60):02d}"
+        code = f"{rng.integers(0, 8):06d}.SZ"
+        ledger.append(trade_dt, code, code, float(rng.random() * 100), int(rng.integers(1, 100)) * 100,
+                      float(rng.random()), float(rng.random() * 0.1), rng.choice(DIRECTIONS))
+    return ledger
+
+
+def _expected_daily(ledger):
+    df = ledger.to_dataframe()
+    df['trade_dt'] = df['trade_dt'].str.split(' ').str[0]
+    df['amount'] = df['price'] * df['volume']
+    df['buy_amount'] = df['amount'].where(df['direction'] == '买入', 0)
+    df['sell_amount'] = df['amount'].where(df['direction'] == '卖出', 0)
+    ret = df.groupby('trade_dt', sort=False).agg(
+        buy_amount=('buy_amount', 'sum'), sell_amount=('sell_amount', 'sum'), commission=('commission', 'sum'),
+        stamp_tax=('stamp_tax', 'sum'), count=('amount', 'size'))
+    ret.insert(2, 'turnover', ret['buy_amount'] + ret['sell_amount'])
+    return ret
+
+
+def _expected_instrument(ledger, market_value=None):
+    df = ledger.to_dataframe()
+    sign = df['direction'].map(DIRECTION_SIGN)
+    df['amount'] = df['price'] * df['volume']
+    df['buy_volume'] = df['volume'].where(sign < 0, 0)
+    df['sell_volume'] = df['volume'].where(sign > 0, 0)
+    df['buy_amount'] = df['amount'].where(sign < 0, 0)
+    df['sell_amount'] = df['amount'].where(sign > 0, 0)
+    df['pnl'] = sign * df['amount'] - df['commission'] - df['stamp_tax']
+    ret = df.groupby('windcode', sort=False)[
+        ['buy_volume', 'sell_volume', 'buy_amount', 'sell_amount', 'commission', 'stamp_tax', 'pnl']].sum()
+    if market_value is not None:
+        ret['pnl'] += pd.Series(market_value).reindex(ret.index).fillna(0)
+    return ret
+
+
+@pytest.mark.parametrize('intraday', [False, True])
+def test_daily_summary(intraday):
+    ledger = _ledger(500, intraday=intraday)
+    expected = _expected_daily(ledger)
+    pd.testing.assert_frame_equal(ledger.daily_summary(), expected, check_dtype=False)
+    assert len(expected) == 10
+
+
+@pytest.mark.parametrize('with_market_value', [False, True])
+def test_instrument_summary(with_market_value):
+    ledger = _ledger(500, intraday=True, seed=1)
+    market_value = {'000001.SZ': 1000.0, '000003.SZ': 2500.0, '999999.SZ': 1.0} if with_market_value else None
+    expected = _expected_instrument(ledger, market_value)
+    pd.testing.assert_frame_equal(ledger.instrument_summary(market_value), expected, check_dtype=False)
+
+
+def test_empty_ledger():
+    ledger = TransactionLedger()
+    daily = ledger.daily_summary()
+    assert daily.empty
+    assert list(daily.columns) == ['buy_amount', 'sell_amount', 'turnover', 'commission', 'stamp_tax', 'count']
+    instrument = ledger.instrument_summary({'000001.SZ': 100.0})
+    assert instrument.empty
+    assert list(instrument.columns) == list(_expected_instrument(ledger).columns)
+    assert list(ledger.to_dataframe().columns) == list(TransactionRecord.__dataclass_fields__.keys())
+
+
+def test_free_text_direction():
+    """
+    clean_position可以传入自定义的成交方向说明，这类记录不计入买卖数量和金额，只扣除费用
+    """
+    ledger = _ledger(50, seed=2)
+    expected = _expected_instrument(ledger)
+    ledger.append('2020-01-15', '000001.SZ', '000001.SZ', 0.0, 500, 0.0, 0.0, '吸收合并注销')
+    ledger.append('2020-01-15', '000009.SZ', '000009.SZ', 0.0, 300, 1.0, 0.0, '吸收合并注销')
+    result = ledger.instrument_summary()
+    pd.testing.assert_frame_equal(result.loc[expected.index], expected, check_dtype=False)
+    assert result.loc['000009.SZ'].tolist() == [0, 0, 0, 0, 1.0, 0, -1.0]
+    assert ledger.daily_summary()['count'].sum() == 52
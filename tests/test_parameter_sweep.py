@@ -0,0 +1,69 @@
+"""
+参数扫描按网格展开配置，每组配置的汇总指标与单独回测的策略指标一致；
+回撤超过阈值的配置标记为提前终止，执行出错的配置标记为失败
+"""
+import pandas as pd
+import pytest
+
+from wk_platform.contrib.strategy import WeightParameterSweep, WeightStrategy, WeightStrategyConfiguration
+
+CONFIG = WeightStrategyConfiguration(progress_bar=False)
+
+
+def _sweep(market, grid, **kwargs):
+    sweep = WeightParameterSweep(market.weights(), market.calendar[0], market.calendar[-1], config=CONFIG,
+                                 grid=grid, **kwargs)
+    sweep.run()
+    return sweep
+
+
+def _summary(market, overrides):
+    strategy = WeightStrategy(market.weights(), market.calendar[0], market.calendar[-1],
+                              config=CONFIG.replace(**overrides))
+    strategy.run()
+    return strategy.result['策略指标'].iloc[0]
+
+
+def test_grid_rows_equal_single_backtest(market):
+    grid = {'commission': [0.0003, 0.001], 'stamp_tax': [0, 0.001]}
+    sweep = _sweep(market, grid)
+    result = sweep.result
+    assert sweep.errors == {}
+    # 字典形式的网格按参数取值的笛卡尔积展开
+    assert result[['commission', 'stamp_tax']].to_dict(orient='records') == [
+        {'commission': 0.0003, 'stamp_tax': 0}, {'commission': 0.0003, 'stamp_tax': 0.001},
+        {'commission': 0.001, 'stamp_tax': 0}, {'commission': 0.001, 'stamp_tax': 0.001}]
+    assert (result['状态'] == '完成').all()
+    assert result['终止日期'].isna().all()
+
+    for i, overrides in enumerate(result[['commission', 'stamp_tax']].to_dict(orient='records')):
+        summary = _summary(market, overrides)
+        row = result.loc[i, summary.index]
+        pd.testing.assert_series_equal(row, summary, check_names=False, check_dtype=False)
+    # 不同的费率得到不同的收益
+    assert result['策略收益'].nunique() == 4
+
+
+def test_abort_and_failure(market):
+    grid = [{'commission': 0.0003}, {'initial_cash': 0}]
+    sweep = _sweep(market, grid, abort_draw_down=1e-4)
+    result = sweep.result
+    assert result['状态'].tolist() == ['提前终止', '失败']
+    assert result.loc[0, '终止日期'] in market.calendar
+    assert result.loc[0, '最大回撤'] > 1e-4
+    assert list(sweep.errors) == [1]
+    assert 'ZeroDivisionError' in sweep.errors[1]
+
+
+def test_grid_list_and_unknown_key(market):
+    sweep = _sweep(market, [{}, {'commission': 0.001}])
+    assert sweep.result['状态'].tolist() == ['完成', '完成']
+    assert pd.isna(sweep.result.loc[0, 'commission'])
+    summary = _summary(market, {'commission': 0.001})
+    pd.testing.assert_series_equal(sweep.result.loc[1, summary.index], summary, check_names=False, check_dtype=False)
+
+    with pytest.raises(TypeError):
+        CONFIG.replace(not_an_option=1)
+    with pytest.raises(TypeError):
+        WeightParameterSweep(market.weights(), market.calendar[0], market.calendar[-1], config=CONFIG,
+                             grid={'not_an_option': [1, 2]})
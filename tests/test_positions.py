@@ -0,0 +1,46 @@
+"""
+MixedPositionMixin 按类型返回的持仓为只读视图，并随持仓的修改同步更新
+"""
+import pickle
+
+import pytest
+
+from wk_platform.broker.brokers.extend_broker import MixedPositionMixin
+from wk_platform.broker.brokers.position import StockPosition, FuturePosition
+
+
+def _positions(by_pass_future):
+    positions = MixedPositionMixin(by_pass_future=by_pass_future)
+    positions.open_position('000001.SZ', StockPosition(windcode='000001.SZ', quantity=100))
+    positions.open_position('IF2001.CFE', FuturePosition(windcode='IF2001.CFE', quantity=1))
+    return positions
+
+
+@pytest.mark.parametrize('by_pass_future', [True, False])
+def test_stock_dict_is_read_only(by_pass_future):
+    positions = _positions(by_pass_future)
+    stock_dict = positions.get_stock_dict()
+    with pytest.raises(TypeError):
+        stock_dict['000002.SZ'] = StockPosition(windcode='000002.SZ', quantity=100)
+    assert positions.get_stock_dict() is stock_dict
+
+    positions.open_position('000002.SZ', StockPosition(windcode='000002.SZ', quantity=200))
+    positions.set_position_zero('000001.SZ')
+    assert '000002.SZ' in stock_dict
+    assert '000001.SZ' not in stock_dict
+
+
+def test_typed_views():
+    positions = _positions(by_pass_future=False)
+    assert list(positions.get_stock_dict()) == ['000001.SZ']
+    assert list(positions.get_future_dict()) == ['IF2001.CFE']
+    with pytest.raises(TypeError):
+        positions.get_future_dict()['IF2002.CFE'] = FuturePosition(windcode='IF2002.CFE', quantity=1)
+
+
+@pytest.mark.parametrize('by_pass_future', [True, False])
+def test_views_after_pickle(by_pass_future):
+    positions = pickle.loads(pickle.dumps(_positions(by_pass_future)))
+    positions.open_position('000002.SZ', StockPosition(windcode='000002.SZ', quantity=200))
+    assert '000002.SZ' in positions.get_stock_dict()
+    assert positions.get_quantity('000002.SZ') == 200
@@ -0,0 +1,94 @@
+"""
+分片文件按顺序读取拼接，列类型保持不变；非parquet格式未显式配置并发时顺序读取
+"""
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import wk_data.proc_util as pu
+from wk_util.configuration import Configuration
+
+
+def _shard(year, n=50):
+    rng = np.random.default_rng(year)
+    dates = pd.bdate_range(f'{year}0101', periods=n)
+    return pd.DataFrame({
+        'trade_dt': dates.strftime('%Y%m%d'),
+        'datetime': dates,
+        'windcode': [f"{i:06d}.SZ" for i in rng.integers(0, 10, n)],
+        'close': rng.random(n) * 100,
+        'volume': rng.integers(0, 10000, n),
+        'flag': rng.random(n) > 0.5,
+        'ratio': rng.random(n).astype(np.float32),
+    }, index=pd.RangeIndex(n) + year * 1000)
+
+
+def _write_shards(tmp_path, file_type, years=(2018, 2019, 2020)):
+    paths, frames = [], []
+    for year in years:
+        frame = _shard(year)
+        path = tmp_path / f'{year}.{file_type}'
+        pu.dump_data(frame, str(path), file_type)
+        paths.append(str(path))
+        frames.append(frame)
+    return paths, frames
+
+
+def test_concat_frames_keeps_order_and_dtypes():
+    frames = [_shard(year) for year in (2020, 2018, 2019)]
+    result = pu.concat_frames(frames)
+    pd.testing.assert_frame_equal(result, pd.concat(frames))
+    assert result.dtypes.equals(frames[0].dtypes)
+
+
+def test_concat_frames_mismatched_dtypes():
+    frames = [_shard(2018), _shard(2019).astype({'volume': float})]
+    pd.testing.assert_frame_equal(pu.concat_frames(frames), pd.concat(frames))
+
+
+@pytest.mark.parametrize('file_type', ['h5', 'pkl', 'parquet'])
+@pytest.mark.parametrize('max_workers, executor', [(None, None), (1, None), (2, 'thread'), (2, 'process')])
+def test_load_shards_keeps_order_and_dtypes(tmp_path, file_type, max_workers, executor):
+    paths, frames = _write_shards(tmp_path, file_type)
+    expected = pd.concat(frames)
+    result = pu.load_shards(paths, file_type, max_workers=max_workers, executor=executor)
+    if file_type == 'parquet':
+        # parquet分片写入时不保存索引，每个分片读回后的索引从0开始
+        expected.index = np.concatenate([np.arange(len(f)) for f in frames])
+    pd.testing.assert_frame_equal(result, expected)
+
+    result = pu.load_shards(paths, file_type, columns=['windcode', 'volume'], filters=[('volume', '>', 5000)],
+                            max_workers=max_workers, executor=executor)
+    expected = expected[expected['volume'] > 5000][['windcode', 'volume']]
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+@pytest.mark.parametrize('file_type', ['h5', 'pkl'])
+def test_non_thread_safe_shards_read_serially_by_default(tmp_path, file_type, monkeypatch):
+    paths, frames = _write_shards(tmp_path, file_type)
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError('pool created without explicit data_loader config')
+
+    monkeypatch.setattr(pu.os, 'cpu_count', lambda: 4)
+    monkeypatch.setattr(pu, 'ProcessPoolExecutor', no_pool)
+    monkeypatch.setattr(pu, 'ThreadPoolExecutor', no_pool)
+    pd.testing.assert_frame_equal(pu.load_shards(paths, file_type), pd.concat(frames))
+
+
+def test_configured_loader_uses_process_pool(tmp_path, monkeypatch):
+    paths, frames = _write_shards(tmp_path, 'h5')
+    used = []
+
+    class RecordingPool(concurrent.futures.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            used.append(kwargs.get('max_workers'))
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(pu, 'ProcessPoolExecutor', RecordingPool)
+    config = Configuration()
+    monkeypatch.setitem(config._config, 'data_loader', {'executor': 'thread', 'max_workers': 2})
+    pd.testing.assert_frame_equal(pu.load_shards(paths, 'h5'), pd.concat(frames))
+    assert used == [2]
@@ -0,0 +1,90 @@
+"""
+向量化的process_groups与逐标的groupby实现的结果一致
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from wk_data.constants import ExtStatus
+from wk_data.data.mr_data import MRRecord
+from wk_data.proc_util import process_groups, _process_groups_legacy
+
+CALENDAR = list(pd.bdate_range('20200101', '20201231').strftime('%Y%m%d'))
+CURRENT_DATE = CALENDAR[-1]
+
+
+def _rows(rng, windcode, dates, delist_date=None):
+    n = len(dates)
+    close = 10 * np.cumprod(1 + rng.normal(0, 0.02, n))
+    return pd.DataFrame({
+        'trade_dt': dates, 'windcode': windcode, 'pre_close': close, 'open': close, 'high': close * 1.01,
+        'low': close * 0.99, 'close': close, 'industry_name': 'x', 'volume': rng.integers(1000, 100000, n) * 1.0,
+        'st': '', 'suspension': 0, 'sec_name': windcode, 'max_up_down': 0, 'list_date': '20000101',
+        'amount': rng.integers(100000, 10000000, n) * 1.0, 'adj_factor': 1.0, 'delist_date': delist_date,
+    })
+
+
+def _market_data(seed=0):
+    rng = np.random.default_rng(seed)
+    parts = [
+        # 正常交易
+        _rows(rng, '000001.SZ', CALENDAR),
+        _rows(rng, '000002.SZ', CALENDAR[100:]),
+        # 上市不足20个交易日
+        _rows(rng, '000003.SZ', CALENDAR[-10:]),
+        # 有退市日期且已退市
+        _rows(rng, '000004.SZ', CALENDAR[:150], delist_date=CALENDAR[150]),
+        # 退市日期在当期之后
+        _rows(rng, '000005.SZ', CALENDAR, delist_date='20210630'),
+        # 最后交易日之后没有数据，也没有退市日期
+        _rows(rng, '000006.SZ', CALENDAR[:200]),
+        # 当期内并购重组
+        _rows(rng, '000007.SZ', CALENDAR[:120]),
+        # 并购重组跨年
+        _rows(rng, '000008.SZ', CALENDAR[:240]),
+        # 不足20个交易日即退市
+        _rows(rng, '000009.SZ', CALENDAR[:5], delist_date=CALENDAR[5]),
+    ]
+    data = pd.concat(parts, ignore_index=True)
+    return data.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+MR_MAP = {
+    '000007.SZ': MRRecord(CALENDAR[130], '000107.SZ', 1.5),
+    '000008.SZ': MRRecord('20210115', '000108.SZ', 0.8),
+}
+
+
+def _assert_same(data, mr_map=None, **kwargs):
+    expected = _process_groups_legacy(data.copy(), CURRENT_DATE, CALENDAR, mr_map)
+    result = process_groups(data.copy(), CURRENT_DATE, CALENDAR, mr_map, **kwargs)
+    pd.testing.assert_frame_equal(result, expected[result.columns])
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_market_data(seed):
+    _assert_same(_market_data(seed), MR_MAP)
+
+
+def test_without_mr_map():
+    _assert_same(_market_data())
+
+
+def test_missing_values():
+    data = _market_data()
+    rng = np.random.default_rng(0)
+    for column in ('close', 'volume', 'industry_name'):
+        data.loc[rng.random(len(data)) < 0.05, column] = np.nan
+    _assert_same(data, MR_MAP)
+
+
+def test_marked_ext_status():
+    data = _market_data()
+    data['ext_status'] = ExtStatus.NORMAL.value
+    last = data[data['windcode'] == '000004.SZ']['trade_dt'].idxmax()
+    data.loc[last, 'ext_status'] = ExtStatus.DUMMY_BAR_FOR_DELISTING.value
+    _assert_same(data, MR_MAP)
+
+
+def test_parallel():
+    _assert_same(_market_data(), MR_MAP, using_parallel=True, max_workers=2)
@@ -0,0 +1,129 @@
+"""
+按列存储的记录缓冲区转换得到的DataFrame与逐条记录的dataclass列表转换结果一致，
+落盘后按写入顺序读回，各块的列类型统一，序列化时带上已落盘的记录
+"""
+import pickle
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from wk_util.recorder import ColumnBuffer, dataclass_list_to_dataframe
+
+
+@dataclass
+class _Record:
+    date: str
+    code: str
+    amount: object
+    price: object
+    flag: object
+
+
+def _records(n=20):
+    records = []
+    for i in range(n):
+        # amount先为整数后出现浮点数，price中夹有None，flag为bool中夹有字符串
+        amount = i if i < 7 else i + 0.5
+        price = float(i) if i % 9 != 8 else None
+        flag = i % 2 == 0 if i not in (13, 14) else 'N/A'
+        records.append(_Record(f"2020{i:04d}", f"{i:06d}.SZ", amount, price, flag))
+    return records
+
+
+def _buffer(records, **kwargs):
+    buffer = ColumnBuffer.from_dataclass(_Record, **kwargs)
+    for record in records:
+        buffer.append_record(record)
+    return buffer
+
+
+def test_dtype_promotion():
+    buffer = ColumnBuffer(['value'])
+    buffer.append(value=1)
+    buffer.append(value=2)
+    assert buffer.to_dataframe()['value'].dtype == np.int64
+    buffer.append(value=2.5)
+    frame = buffer.to_dataframe()
+    assert frame['value'].dtype == np.float64
+    assert frame['value'].tolist() == [1.0, 2.0, 2.5]
+    buffer.append(value='x')
+    frame = buffer.to_dataframe()
+    assert frame['value'].dtype == object
+    assert frame['value'].tolist() == [1.0, 2.0, 2.5, 'x']
+
+
+def test_bool_column():
+    buffer = ColumnBuffer(['flag'])
+    buffer.append(flag=True)
+    buffer.append(flag=False)
+    frame = buffer.to_dataframe()
+    assert frame['flag'].dtype == bool
+    assert frame['flag'].tolist() == [True, False]
+
+
+@pytest.mark.parametrize('n', [0, 1, 20, 600])
+def test_same_as_dataclass_list(n):
+    records = _records(n)
+    expected = dataclass_list_to_dataframe(records, _Record)
+    buffer = _buffer(records)
+    assert len(buffer) == n
+    pd.testing.assert_frame_equal(dataclass_list_to_dataframe(buffer), expected, check_index_type=n > 0)
+
+
+@pytest.mark.parametrize('spill_rows', [3, 5, 8])
+def test_spill_read_back(tmp_path, spill_rows):
+    records = _records()
+    buffer = _buffer(records, spill_dir=tmp_path, spill_rows=spill_rows)
+    spill_files = sorted(tmp_path.iterdir())
+    assert len(spill_files) == len(records) // spill_rows
+    assert len(buffer) == len(records)
+    # 数值列写入parquet，混有bool与字符串等多种类型的块写入pickle
+    assert {p.suffix for p in spill_files} == {'.parquet', '.pkl'}
+
+    expected = dataclass_list_to_dataframe(records, _Record)
+    pd.testing.assert_frame_equal(buffer.to_dataframe(), expected)
+
+    buffer.clear()
+    assert len(buffer) == 0
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.filterwarnings('error::FutureWarning')
+def test_spill_dtype_consistent(tmp_path):
+    """
+    前几块为整数、之后出现浮点数和None的列，以及首块全为None、之后为浮点数的列，
+    拼接后的类型与逐条记录转换的结果一致
+    """
+    buffer = ColumnBuffer(['value', 'price', 'note'], spill_dir=tmp_path, spill_rows=4)
+    values = list(range(8)) + [8.5, 9, None, 11]
+    prices = [None] * 4 + [float(i) for i in range(8)]
+    notes = [None] * 4 + ['a', None, 'b', None] + [None] * 4
+    for value, price, note in zip(values, prices, notes):
+        buffer.append(value=value, price=price, note=note)
+    frame = buffer.to_dataframe()
+    expected = pd.DataFrame({'value': values, 'price': prices, 'note': notes})
+    pd.testing.assert_frame_equal(frame, expected)
+    assert frame['value'].dtype == np.float64
+    assert frame['price'].dtype == np.float64
+
+
+def test_pickle(tmp_path):
+    records = _records()
+    buffer = _buffer(records, spill_dir=tmp_path / 'a', spill_rows=6)
+    spilled = sorted((tmp_path / 'a').iterdir())
+
+    restored = pickle.loads(pickle.dumps(buffer))
+    assert len(restored) == len(records)
+    # 恢复后的缓冲区重新写入自己的落盘文件，原缓冲区的文件不受影响
+    assert sorted((tmp_path / 'a').iterdir()) != spilled
+    assert all(p.exists() for p in spilled)
+    pd.testing.assert_frame_equal(restored.to_dataframe(), buffer.to_dataframe())
+
+    for record in records:
+        restored.append_record(record)
+    pd.testing.assert_frame_equal(restored.to_dataframe(),
+                                  dataclass_list_to_dataframe(records + records, _Record))
+    restored.clear()
+    assert sorted((tmp_path / 'a').iterdir()) == spilled
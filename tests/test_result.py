@@ -0,0 +1,166 @@
+"""
+回测结果中的指标延迟计算：按任意顺序访问与一次计算全部指标的结果一致，序列化时计算全部指标，
+metric_groups未包含的分组不执行对应的算子；全部指标计算完成后结果不再引用策略对象。
+导出为parquet/feather后延迟读取的结果与原结果一致
+"""
+import gc
+import json
+import pickle
+import threading
+import weakref
+from collections import Counter
+
+import pandas as pd
+import pytest
+
+import wk_platform.backtest.strategyOutput as strategyOutput
+from wk_platform.backtest.result import BackTestResult, BackTestResultSet, MANIFEST_NAME
+from wk_platform.config import MetricGroup
+from wk_platform.contrib.strategy import WeightStrategy, WeightStrategyConfiguration
+
+
+def _result(market, **kwargs):
+    config = WeightStrategyConfiguration(progress_bar=False, **kwargs)
+    strategy = WeightStrategy(market.weights(), market.calendar[0], market.calendar[-1], config=config)
+    strategy.run()
+    return strategy.result
+
+
+def _assert_same(left, right, name):
+    if isinstance(right, pd.DataFrame):
+        pd.testing.assert_frame_equal(left, right, obj=name)
+    elif isinstance(right, dict):
+        assert list(left) == list(right), name
+        for k in right:
+            _assert_same(left[k], right[k], f'{name}.{k}')
+    else:
+        assert left == right, name
+
+
+@pytest.fixture
+def ran_analyzers(monkeypatch):
+    names = []
+    run_analyzers = strategyOutput.run_analyzers
+
+    def spy(analyzers, context, **kwargs):
+        names.extend(analyzer.name for analyzer in analyzers)
+        return run_analyzers(analyzers, context, **kwargs)
+
+    monkeypatch.setattr(strategyOutput, 'run_analyzers', spy)
+    return names
+
+
+def test_lazy_equal_eager(market, ran_analyzers):
+    eager = _result(market).materialize()
+    lazy = _result(market)
+    keys = list(eager.keys())
+    assert all(not lazy.is_materialized(k) for k in keys)
+    # 倒序逐个访问，每次只计算所需的算子，每个算子只执行一次
+    for k in reversed(keys):
+        _assert_same(lazy[k], eager[k], k)
+        assert lazy.is_materialized(k)
+    assert set(Counter(ran_analyzers).values()) == {2}
+
+
+def test_pickle_materializes(market):
+    result = _result(market)
+    expected = _result(market).materialize()
+    restored = pickle.loads(pickle.dumps(result))
+    assert all(result.is_materialized(k) for k in result.keys())
+    assert all(restored.is_materialized(k) for k in restored.keys())
+    for k in expected.keys():
+        _assert_same(restored[k], expected[k], k)
+
+
+def test_summary_group_skips_other_analyzers(market, ran_analyzers):
+    full = _result(market)
+    result = _result(market, metric_groups=[MetricGroup.SUMMARY])
+    assert list(result.keys()) == ['回测配置', '策略指标']
+    ran_analyzers.clear()
+    result.materialize()
+    assert 'MetricSummaryAnalyzer' in ran_analyzers
+    for name in ('YearlyExtendedMetricAnalyzer', 'MonthlyAggregatedMetricAnalyzer', 'WeeklyMetricAnalyzer'):
+        assert name not in ran_analyzers
+    for k in result.keys():
+        _assert_same(result[k], full[k], k)
+
+
+def test_release_strategy_after_materialize(market, monkeypatch):
+    outputs = []
+    post_process = strategyOutput.StrategyOutput.post_process
+
+    def spy(self):
+        outputs.append(weakref.ref(self))
+        return post_process(self)
+
+    monkeypatch.setattr(strategyOutput.StrategyOutput, 'post_process', spy)
+    result = _result(market)
+    gc.collect()
+    # 尚未计算的指标引用策略输出对象
+    assert outputs[0]() is not None
+    result['策略指标']
+    gc.collect()
+    assert outputs[0]() is not None
+    result.materialize()
+    gc.collect()
+    assert outputs[0]() is None
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'feather'])
+def test_binary_round_trip(market, tmp_path, fmt):
+    result = _result(market)
+    expected = _result(market).materialize()
+    directory = getattr(result, f'to_{fmt}')(tmp_path / 'result')
+
+    with open(directory / MANIFEST_NAME, encoding='utf-8') as f:
+        manifest = json.load(f)
+    assert manifest['format'] == fmt
+    metrics = {metric['key']: metric for metric in manifest['metrics']}
+    assert list(metrics) == list(expected.keys())
+    assert metrics['策略净值']['plot'] == 'wk_analyzer.plot.backtest:plot_net_value'
+    assert metrics['交易流水']['kind'] == 'frame'
+    assert metrics['年度表现']['kind'] == 'dict'
+    assert [entry['name'] for entry in metrics['年度表现']['files']] == list(expected['年度表现'].keys())
+    for metric in metrics.values():
+        assert all((directory / entry['file']).exists() for entry in metric['files'])
+    # 混有数值与'--'的指标表改用pickle格式
+    assert metrics['策略指标']['files'][0]['format'] == 'pickle'
+    assert metrics['交易流水']['files'][0]['format'] == fmt
+
+    loaded = BackTestResult.load(directory)
+    assert list(loaded.keys()) == list(expected.keys())
+    assert not any(loaded.is_materialized(k) for k in loaded.keys())
+    for k in expected.keys():
+        _assert_same(loaded[k], expected[k], k)
+
+
+def test_result_set_binary(market, tmp_path, monkeypatch):
+    threads = []
+    run_analyzers = strategyOutput.run_analyzers
+
+    def spy(analyzers, context, **kwargs):
+        threads.append(threading.get_ident())
+        return run_analyzers(analyzers, context, **kwargs)
+
+    monkeypatch.setattr(strategyOutput, 'run_analyzers', spy)
+    result_set = BackTestResultSet()
+    for name in ('a', 'b', 'c'):
+        result_set[name] = _result(market)
+    result_set.add_error('d', 'Traceback ...')
+    expected = _result(market).materialize()
+
+    directory = result_set.to_parquet(tmp_path / 'results', max_workers=3)
+    # 指标在当前线程中计算，线程池只写入文件
+    assert threads and set(threads) == {threading.get_ident()}
+    with open(directory / MANIFEST_NAME, encoding='utf-8') as f:
+        manifest = json.load(f)
+    assert manifest['results'] == [{'key': 'a', 'directory': '0000'}, {'key': 'b', 'directory': '0001'},
+                                   {'key': 'c', 'directory': '0002'}]
+    assert manifest['errors'] == {'d': 'Traceback ...'}
+
+    loaded = BackTestResultSet.load(directory)
+    assert list(loaded.keys()) == ['a', 'b', 'c']
+    assert loaded.errors == {'d': 'Traceback ...'}
+    for name in loaded.keys():
+        for k in expected.keys():
+            _assert_same(loaded[name][k], expected[k], f'{name}.{k}')
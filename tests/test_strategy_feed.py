@@ -0,0 +1,51 @@
+"""
+FeedRegistry 并发准备数据集：结果与顺序执行一致，线程中的耗时记入当前的RuntimeProfiler
+"""
+import pandas as pd
+import pytest
+
+from wk_platform.contrib.strategy import WeightStrategy, WeightStrategyConfiguration
+from wk_platform.feed.strategy_feed import FeedRegistry
+from wk_platform.util.profiler import RuntimeProfiler
+
+
+def _build(market, **kwargs):
+    registry = FeedRegistry(market.calendar[0], market.calendar[-1], WeightStrategyConfiguration(progress_bar=False))
+    registry.register('a_share_market', instruments=market.codes)
+    profiler = RuntimeProfiler()
+    with profiler.activate():
+        feed, ext_status_df = registry.build_feed(**kwargs)
+    seq = feed.get_data_seq()
+    return {date: sorted(inst for inst, _ in bars.items()) for date, bars in seq.items()}, ext_status_df, \
+        profiler.summary()
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_concurrent_build_matches_serial(market, executor):
+    expected, expected_ext, _ = _build(market)
+    actual, actual_ext, _ = _build(market, max_workers=3, executor=executor)
+    assert actual == expected
+    assert actual_ext.equals(expected_ext)
+
+
+def test_thread_stages_are_profiled(market):
+    _, _, summary = _build(market, max_workers=3, executor='thread')
+    assert 'feed.build.prepare_feed_a_share_market' in summary.index
+    assert 'feed.build.prepare_feed_index_market' in summary.index
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_backtest_with_concurrent_feed(market, executor):
+    config = WeightStrategyConfiguration(progress_bar=False)
+    serial = WeightStrategy(market.weights(), market.calendar[0], market.calendar[-1], config=config)
+    serial.run()
+    concurrent = WeightStrategy(market.weights(), market.calendar[0], market.calendar[-1],
+                                config=config.replace(feed_workers=3, feed_executor=executor))
+    concurrent.run()
+    pd.testing.assert_frame_equal(serial.result['策略指标'], concurrent.result['策略指标'])
+    pd.testing.assert_frame_equal(serial.result['交易流水'], concurrent.result['交易流水'])
+
+
+def test_unsupported_feed_executor():
+    with pytest.raises(ValueError):
+        WeightStrategyConfiguration(feed_executor='greenlet')